@@ -0,0 +1,109 @@
+"""
+CPU cost of the download loop per GiB: the fixed 8 KiB chunks against the adaptive chunks.
+
+The fixed loop is the previous implementation of downloader._download() (iter_content(),
+a bytes object, write(), hash update and a progress update per chunk), the adaptive one
+is the current downloader.download(). One large file is streamed from the local mock server
+(a separate process) to a temporary directory, the CPU time of this process is measured.
+The progress bars of both loops are drawn to /dev/null.
+
+    python -m benchmarks.chunks --size 2G
+"""
+
+from hashlib import sha256
+from multiprocessing import Pipe, Process
+import os
+from pathlib import Path
+import tempfile
+from time import perf_counter
+from typing import Callable
+
+import click
+from tqdm import tqdm
+from yarl import URL
+
+from benchmarks.download import configure, parse_size, serve
+from benchmarks.mock_hosting import Scenario, get_checksum
+from simple_downloader.config import BASE_CHUNK, DEFAULT_CHUNK_MULTIPLIER
+from simple_downloader.core.parsing import parse_filename
+from simple_downloader.core.models import MediaFile
+from simple_downloader.handlers import downloader
+from simple_downloader.handlers.requester import Requester
+
+
+def download_fixed(file: MediaFile, save_path: Path, http_client: Requester) -> str:
+    bar_params = downloader.TQDM_PARAMS | {"miniters": 1, "mininterval": 0.1}  # as it was
+    hasher = sha256()
+    with http_client.get_response(file.stream_url, stream=True) as stream:
+        total = int(stream.headers.get("content-length", 0))
+        with save_path.joinpath(str(file.filename)).open("wb") as bf_out, tqdm(
+            total=total, **bar_params
+        ) as bar:
+            for chunk in stream.iter_content(BASE_CHUNK * DEFAULT_CHUNK_MULTIPLIER):
+                bf_out.write(chunk)
+                hasher.update(chunk)
+                bar.update(len(chunk))
+
+    return f"sha256:{hasher.hexdigest()}"
+
+
+def download_adaptive(file: MediaFile, save_path: Path, http_client: Requester) -> str:
+    downloader.download(file, save_path, http_client)
+    return file.checksum or ""
+
+
+def measure(
+    download: Callable[[MediaFile, Path, Requester], str],
+    file: MediaFile,
+    http_client: Requester,
+) -> tuple[float, float, str]:
+    with tempfile.TemporaryDirectory(prefix="bench-") as directory:
+        started_at, cpu_started_at = perf_counter(), _get_cpu_time()
+        checksum = download(file, Path(directory), http_client)
+        return perf_counter() - started_at, _get_cpu_time() - cpu_started_at, checksum
+
+
+def _get_cpu_time() -> float:
+    times = os.times()
+    return times.user + times.system
+
+
+@click.command()
+@click.option("--size", type=parse_size, default="1G", help="Size of the file (K, M, G).")
+@click.option("--repeat", "-r", type=click.IntRange(min=1), default=3)
+def main(size: int, repeat: int) -> None:
+    scenario = Scenario(files=1, size=size)
+    expected = f"sha256:{get_checksum(scenario)}"
+
+    connection, server_connection = Pipe()
+    server = Process(target=serve, args=(("pixeldrain",), scenario, server_connection), daemon=True)
+    server.start()
+    base_url, _ = connection.recv()["pixeldrain"]
+
+    rate_limiter = configure(base_url, limit=False, retry_wait=0)
+    downloader.TQDM_PARAMS.update(disable=False, file=open(os.devnull, "w"))
+    file_url = URL(base_url) / "u" / "file0"
+    stream_url = URL(base_url) / "api" / "file" / "file0"
+    gigabytes = size / 1024**3
+
+    click.echo(f"{'loop':<10}{'sec':>8}{'MiB/s':>9}{'CPU sec':>9}{'CPU sec/GiB':>13}")
+    try:
+        with Requester(rate_limiter) as http_client:
+            for name, download in (("fixed", download_fixed), ("adaptive", download_adaptive)):
+                for _ in range(repeat):
+                    file = MediaFile("file0", parse_filename("file0.mp4"), file_url, stream_url)
+                    seconds, cpu, checksum = measure(download, file, http_client)
+                    if checksum != expected:
+                        raise click.ClickException(f"The {name} loop received broken content")
+
+                    click.echo(
+                        f"{name:<10}{seconds:>8.2f}{size / 1024**2 / seconds:>9.1f}"
+                        f"{cpu:>9.2f}{cpu / gigabytes:>13.2f}"
+                    )
+    finally:
+        connection.send("stop")
+        server.join(timeout=5)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,392 @@
+"""
+Benchmark of the full download() path against the local mock hostings.
+
+The mock server runs in a separate process, so its CPU and memory are not measured.
+Each hosting is benchmarked on an album of the same files, the results are printed
+as a table and can be appended to a JSON lines file to compare the engines and changes.
+
+    python -m benchmarks.download --files 50 --size 8M --workers 4
+    python -m benchmarks.download -h pixeldrain --engine async --error-rate 0.05 --json results.jsonl
+
+The rate limiter is disabled by default (the server is local) and the retries wait
+only "--retry-wait" seconds instead of the exponential strategy of the application.
+The progress bars are disabled. Both engines are imported, so httpx (the extra "async")
+is required.
+
+With "--storage s3" the files are uploaded to the local stand-in of S3 (benchmarks/mock_s3.py)
+instead of the disk, it needs boto3 (the extra "s3"). Its latency shows whether a slow storage
+holds up the other downloads, the received objects are checked by their SHA-256 and the left
+multipart uploads are counted:
+
+    python -m benchmarks.download -h pixeldrain -e async -w 8 --storage s3 --storage-latency 0.05
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+import json
+from multiprocessing import Pipe, Process
+from multiprocessing.connection import Connection
+import os
+from pathlib import Path
+import resource
+from statistics import median, quantiles
+import tempfile
+from time import perf_counter
+from typing import TYPE_CHECKING, Any, Callable
+
+import click
+import httpx
+from tenacity import wait_fixed
+from yarl import URL
+
+from benchmarks.mock_hosting import HOSTINGS, MockHosting, Scenario, get_checksum
+from benchmarks.mock_s3 import MockS3, StorageScenario
+from simple_downloader import __main__ as cli
+from simple_downloader import crawlers
+from simple_downloader.core.models import DownloadCounter, DownloadOptions
+from simple_downloader.crawlers import cyberdrop, pixeldrain
+from simple_downloader.handlers import async_downloader, downloader, segmented
+from simple_downloader.handlers.async_requester import AsyncRequester
+from simple_downloader.handlers.rate_limiter import RateLimiter
+from simple_downloader.handlers.requester import Requester
+
+if TYPE_CHECKING:
+    from simple_downloader.storages.s3 import S3Storage
+
+
+CRAWLERS = {
+    "pixeldrain": (crawlers.Pixeldrain, crawlers.AsyncPixeldrain),
+    "cyberdrop": (crawlers.Cyberdrop, crawlers.AsyncCyberdrop),
+    "bunkr": (crawlers.Bunkr, crawlers.AsyncBunkr),
+}
+SIZE_UNITS = {"K": 1024, "M": 1024**2, "G": 1024**3}
+
+
+@dataclass(slots=True)
+class Result:
+    hosting: str
+    engine: str
+    files: int
+    failures: int
+    received: int  # bytes
+    seconds: float
+    ttfb_p50: float
+    ttfb_p99: float
+    storage: str = "local"
+    corrupted: int = 0  # objects of the storage whose SHA-256 does not match
+    uploads_left: int = 0  # multipart uploads neither completed nor aborted
+
+    @property
+    def files_per_second(self) -> float:
+        return self.files / self.seconds
+
+    @property
+    def megabytes_per_second(self) -> float:
+        return self.received / 1024**2 / self.seconds
+
+
+def serve(
+    hostings: tuple[str, ...],
+    scenario: Scenario,
+    storage_scenario: StorageScenario | None,
+    connection: Connection,
+) -> None:
+    servers = [MockHosting(hosting, scenario) for hosting in hostings]
+    for server in servers:
+        server.start()
+
+    storage_url = None
+    if storage_scenario is not None:
+        storage_server = MockS3(storage_scenario)
+        storage_server.start()
+        storage_url = storage_server.base_url
+
+    addresses = {server.hosting: (server.base_url, server.album_url) for server in servers}
+    connection.send((addresses, storage_url))
+    connection.recv()  # until the benchmark is finished
+
+
+def configure(base_url: str, limit: bool, retry_wait: float) -> RateLimiter:
+    """Points the API of the crawlers to the mock server and shortens the retries."""
+
+    downloader.TQDM_PARAMS["disable"] = True  # the dictionary is shared by all downloaders
+    pixeldrain.BASE_API = URL(base_url) / "api"
+    cyberdrop.BASE_API = URL(base_url) / "api"
+
+    for function in (
+        Requester._make_request,
+        AsyncRequester._make_request,
+        downloader.download,
+        async_downloader.download,
+        segmented._download_segment,
+    ):
+        function.retry.wait = wait_fixed(retry_wait)  # type: ignore[reportFunctionMemberAccess]
+
+    unlimited = float("inf")
+    return RateLimiter() if limit else RateLimiter(unlimited, unlimited, unlimited, unlimited)
+
+
+def run_sync(
+    hosting: str,
+    album_url: URL,
+    save_path: Path,
+    rate_limiter: RateLimiter,
+    workers: int,
+    segments: int,
+    counter: DownloadCounter,
+    storage: "S3Storage | None",
+) -> list[float]:
+    ttfb: list[float] = []
+
+    def record(response: Any, *args: Any, **kwargs: Any) -> None:
+        ttfb.append(response.elapsed.total_seconds())  # until the headers are parsed
+
+    with Requester(rate_limiter, pool_maxsize=workers * segments) as http_client:
+        http_client._session.hooks["response"].append(record)
+        crawler = CRAWLERS[hosting][0](http_client)
+
+        pool = ThreadPoolExecutor(workers, "download") if workers > 1 else None
+        try:
+            options = DownloadOptions(segments, storage=storage)
+            cli.download(album_url, save_path, crawler, http_client, counter, pool, options)
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+
+    return ttfb
+
+
+async def run_async(
+    hosting: str,
+    album_url: URL,
+    save_path: Path,
+    rate_limiter: RateLimiter,
+    workers: int,
+    counter: DownloadCounter,
+    storage: "S3Storage | None",
+) -> list[float]:
+    ttfb: list[float] = []
+
+    async def start(request: httpx.Request) -> None:
+        request.extensions["started_at"] = perf_counter()
+
+    async def record(response: httpx.Response) -> None:
+        ttfb.append(perf_counter() - response.request.extensions["started_at"])
+
+    async with AsyncRequester(rate_limiter, max_connections=workers) as http_client:
+        http_client._client.event_hooks = {"request": [start], "response": [record]}
+        crawler = CRAWLERS[hosting][1](http_client)
+
+        limit = asyncio.Semaphore(workers)
+        await cli.download_async(
+            album_url,
+            save_path,
+            crawler,
+            http_client,
+            counter,
+            limit,
+            workers == 1,
+            DownloadOptions(storage=storage),
+        )
+
+    return ttfb
+
+
+def measure(
+    hosting: str,
+    engine: str,
+    run: Callable[[Path, DownloadCounter, "S3Storage | None"], list[float]],
+    checksum: str,
+    storage_url: str | None,
+) -> Result:
+    counter = DownloadCounter()
+    corrupted = uploads_left = 0
+    with tempfile.TemporaryDirectory(prefix="bench-") as directory:
+        storage = None
+        if storage_url is not None:
+            from simple_downloader.storages.s3 import S3Storage
+
+            storage = S3Storage("bench", f"{hosting}-{engine}", Path(directory), storage_url)
+
+        started_at = perf_counter()
+        ttfb = run(Path(directory), counter, storage)
+        seconds = perf_counter() - started_at
+
+        if storage is None:
+            received = sum(path.stat().st_size for path in Path(directory).rglob("*.mp4"))
+        else:
+            received, corrupted, uploads_left = check_storage(storage, checksum)
+            storage.close()
+        cli.close_manifests()
+
+    percentiles = quantiles(ttfb, n=100) if len(ttfb) > 1 else ttfb * 99
+    return Result(
+        hosting=hosting,
+        engine=engine,
+        files=counter.successes,
+        failures=counter.failures,
+        received=received,
+        seconds=seconds,
+        ttfb_p50=median(ttfb) if ttfb else 0,
+        ttfb_p99=percentiles[98] if percentiles else 0,
+        storage="local" if storage_url is None else "s3",
+        corrupted=corrupted,
+        uploads_left=uploads_left,
+    )
+
+
+def check_storage(storage: "S3Storage", checksum: str) -> tuple[int, int, int]:
+    """The received bytes, the corrupted objects and the left uploads of the storage."""
+
+    client = storage.client
+    objects = client.list_objects_v2(Bucket=storage.bucket, Prefix=storage.prefix)
+    files = [item for item in objects.get("Contents", []) if item["Key"].endswith(".mp4")]
+    uploads = client.list_multipart_uploads(Bucket=storage.bucket, Prefix=storage.prefix)
+
+    received = sum(item["Size"] for item in files)
+    corrupted = sum(item["ETag"].strip('"') != checksum for item in files)
+    return received, corrupted, len(uploads.get("Uploads", []))
+
+
+def parse_size(value: str) -> int:
+    value = value.strip().upper().removesuffix("B").removesuffix("I")
+    multiplier = SIZE_UNITS.get(value[-1:], 1)
+    return int(float(value.rstrip("".join(SIZE_UNITS))) * multiplier)
+
+
+def get_peak_rss() -> int:
+    """Peak resident set size of the process in bytes (kilobytes on Linux, bytes on macOS)."""
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if os.uname().sysname == "Darwin" else peak * 1024
+
+
+def report(results: list[Result], peak_rss: int) -> None:
+    header = f"{'hosting':<12}{'engine':<8}{'files':>7}{'failed':>8}{'MiB':>9}{'sec':>8}"
+    header += f"{'files/s':>9}{'MiB/s':>9}{'TTFB p50':>11}{'TTFB p99':>11}"
+    click.echo(header)
+    for r in results:
+        click.echo(
+            f"{r.hosting:<12}{r.engine:<8}{r.files:>7}{r.failures:>8}{r.received / 1024**2:>9.1f}"
+            f"{r.seconds:>8.2f}{r.files_per_second:>9.2f}{r.megabytes_per_second:>9.1f}"
+            f"{r.ttfb_p50 * 1000:>9.1f}ms{r.ttfb_p99 * 1000:>9.1f}ms"
+        )
+    for r in results:
+        if r.storage != "local":
+            click.echo(
+                f"\n{r.hosting} ({r.engine}): {r.corrupted} corrupted objects and "
+                f"{r.uploads_left} uploads left in the storage ({r.storage})"
+            )
+    click.echo(f"\nPeak RSS: {peak_rss / 1024**2:.1f} MiB")
+
+
+@click.command()
+@click.option("--hosting", "-h", "hostings", type=click.Choice(HOSTINGS), multiple=True)
+@click.option("--engine", "-e", type=click.Choice(["sync", "async"]), default="sync")
+@click.option("--files", "-n", type=click.IntRange(min=1), default=10, help="Files in the album.")
+@click.option("--size", type=parse_size, default="1M", help="Size of each file (K, M, G).")
+@click.option("--workers", "-w", type=click.IntRange(min=1), default=1)
+@click.option("--segments", "-s", type=click.IntRange(min=1), default=1)
+@click.option("--latency", type=click.FloatRange(min=0), default=0, help="Seconds per response.")
+@click.option("--error-rate", type=click.FloatRange(0, 1), default=0, help="Part of 429/503.")
+@click.option("--disconnect-rate", type=click.FloatRange(0, 1), default=0)
+@click.option("--retry-wait", type=click.FloatRange(min=0), default=0.01)
+@click.option("--limit/--no-limit", default=False, help="Use the default rate limiter.")
+@click.option("--storage", type=click.Choice(["local", "s3"]), default="local")
+@click.option("--storage-latency", type=click.FloatRange(min=0), default=0, help="Seconds (s3).")
+@click.option("--storage-error-rate", type=click.FloatRange(0, 1), default=0, help="Part of 503.")
+@click.option("--json", "json_path", type=click.Path(dir_okay=False, path_type=Path))
+def main(
+    hostings: tuple[str, ...],
+    engine: str,
+    files: int,
+    size: int,
+    workers: int,
+    segments: int,
+    latency: float,
+    error_rate: float,
+    disconnect_rate: float,
+    retry_wait: float,
+    limit: bool,
+    storage: str,
+    storage_latency: float,
+    storage_error_rate: float,
+    json_path: Path | None,
+) -> None:
+    hostings = hostings or HOSTINGS
+    scenario = Scenario(files, size, latency, error_rate, disconnect_rate)
+    storage_scenario = None
+    if storage == "s3":
+        storage_scenario = StorageScenario(storage_latency, storage_error_rate)
+        for name, value in (
+            ("AWS_ACCESS_KEY_ID", "bench"),
+            ("AWS_SECRET_ACCESS_KEY", "bench"),
+            ("AWS_DEFAULT_REGION", "us-east-1"),
+        ):
+            os.environ.setdefault(name, value)  # the stand-in does not check the signature
+
+    connection, server_connection = Pipe()
+    server = Process(
+        target=serve, args=(hostings, scenario, storage_scenario, server_connection), daemon=True
+    )
+    server.start()
+    addresses: dict[str, tuple[str, str]]
+    addresses, storage_url = connection.recv()
+    checksum = get_checksum(scenario)
+
+    results = []
+    try:
+        for hosting in hostings:
+            base_url, album_url = addresses[hosting]
+            rate_limiter = configure(base_url, limit, retry_wait)
+
+            if engine == "async":
+                result = measure(
+                    hosting,
+                    engine,
+                    lambda path, counter, storage: asyncio.run(
+                        run_async(
+                            hosting, URL(album_url), path, rate_limiter, workers, counter, storage
+                        )
+                    ),
+                    checksum,
+                    storage_url,
+                )
+            else:
+                result = measure(
+                    hosting,
+                    engine,
+                    lambda path, counter, storage: run_sync(
+                        hosting,
+                        URL(album_url),
+                        path,
+                        rate_limiter,
+                        workers,
+                        segments,
+                        counter,
+                        storage,
+                    ),
+                    checksum,
+                    storage_url,
+                )
+            results.append(result)
+    finally:
+        connection.send("stop")
+        server.join(timeout=5)
+
+    peak_rss = get_peak_rss()
+    report(results, peak_rss)
+
+    if json_path is not None:
+        with json_path.open("a") as f_out:
+            for result in results:
+                record = asdict(result) | asdict(scenario) | {"workers": workers}
+                record |= {"segments": segments, "peak_rss": peak_rss}
+                if storage_scenario is not None:
+                    record |= {f"storage_{k}": v for k, v in asdict(storage_scenario).items()}
+                f_out.write(json.dumps(record) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+"""
+Local HTTP server imitating the pages and API of the supported hostings.
+
+Only the shapes read by the crawlers are served:
+
+- pixeldrain: "/api/list/{id}", "/api/file/{id}/info" and "/api/file/{id}";
+- cyberdrop: the album page "/a/{id}" with "#table .image" links, "/api/f/{id}";
+- bunkr: the album page "/a/{id}" with ".grid-images a" links, the file page "/v/{id}"
+  and the download page "/d/{id}" with "Download" hyperlinks.
+
+Files are served from "/files/{id}" (pixeldrain from its API) with "Range" and "ETag" support,
+the content is a repeated random block, so a file of any size takes no memory. Each hosting
+is served on its own port, because the crawlers take the media type from the first part
+of the path.
+"""
+
+from dataclasses import dataclass
+from hashlib import sha256
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+from random import Random
+from threading import Lock, Thread
+from time import sleep
+
+
+HOSTINGS = ("pixeldrain", "cyberdrop", "bunkr")
+ALBUM_ID = "bench"
+BLOCK_SIZE = 1024**2
+ETAG = '"bench"'
+
+
+@dataclass(frozen=True, slots=True)
+class Scenario:
+    files: int = 10
+    size: int = BLOCK_SIZE
+    latency: float = 0  # seconds before the response headers
+    error_rate: float = 0  # part of the requests answered with 429 or 503
+    disconnect_rate: float = 0  # part of the file streams broken in the middle
+    seed: int = 0
+
+
+class MockHosting(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, hosting: str, scenario: Scenario, port: int = 0) -> None:
+        super().__init__(("127.0.0.1", port), Handler)
+        self.hosting = hosting
+        self.scenario = scenario
+        self.block = get_block(scenario)
+        self.checksum = get_checksum(scenario)
+
+        self._random = Random(scenario.seed)
+        self._random_lock = Lock()
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host!s}:{port}"
+
+    @property
+    def album_url(self) -> str:
+        path = "l" if self.hosting == "pixeldrain" else "a"
+        return f"{self.base_url}/{path}/{ALBUM_ID}"
+
+    def roll(self, rate: float) -> bool:
+        with self._random_lock:
+            return self._random.random() < rate
+
+    def start(self) -> Thread:
+        thread = Thread(target=self.serve_forever, name=self.hosting, daemon=True)
+        thread.start()
+        return thread
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: MockHosting  # type: ignore[reportIncompatibleVariableOverride]
+
+    def log_message(self, format: str, *args: object) -> None:
+        pass
+
+    def do_GET(self) -> None:
+        scenario = self.server.scenario
+        if scenario.latency:
+            sleep(scenario.latency)
+
+        if self.server.roll(scenario.error_rate):
+            self._send_error()
+            return
+
+        parts = self.path.strip("/").split("/")
+        match self.server.hosting, parts:
+            case "pixeldrain", ["api", "list", album_id]:
+                self._send_json({"title": album_id, "files": self._get_files()})
+            case "pixeldrain", ["api", "file", file_id, "info"]:
+                info = {"name": f"{file_id}.mp4", "size": scenario.size}
+                self._send_json(info | {"hash_sha256": self.server.checksum})
+            case "pixeldrain", ["api", "file", _]:
+                self._send_file()
+
+            case "cyberdrop", ["a", album_id]:
+                links = "".join(
+                    f'<a class="image" href="/f/{f["id"]}"></a>' for f in self._get_files()
+                )
+                self._send_html(f'<h1>{album_id}</h1><div id="table">{links}</div>')
+            case "cyberdrop", ["api", "f", file_id]:
+                url = f"{self.server.base_url}/files/{file_id}"
+                self._send_json({"name": f"{file_id}.mp4", "url": url})
+
+            case "bunkr", ["a", album_id]:
+                links = "".join(
+                    f'<a href="{self.server.base_url}/v/{f["id"]}"></a>' for f in self._get_files()
+                )
+                self._send_html(f'<h1>{album_id}</h1><div class="grid-images">{links}</div>')
+            case "bunkr", ["v", file_id]:
+                self._send_download_page(file_id, f"{self.server.base_url}/d/{file_id}")
+            case "bunkr", ["d", file_id]:
+                self._send_download_page(file_id, f"{self.server.base_url}/files/{file_id}")
+
+            case _, ["files", _]:
+                self._send_file()
+            case _:
+                self._send(HTTPStatus.NOT_FOUND, b"not found", "text/plain")
+
+    def _get_files(self) -> list[dict[str, str]]:
+        return [{"id": f"file{number}"} for number in range(self.server.scenario.files)]
+
+    def _send_error(self) -> None:
+        if self.server.roll(0.5):
+            self._send(HTTPStatus.TOO_MANY_REQUESTS, b"", "text/plain", {"retry-after": "0"})
+        else:
+            self._send(HTTPStatus.SERVICE_UNAVAILABLE, b"", "text/plain")
+
+    def _send_json(self, data: dict) -> None:
+        self._send(HTTPStatus.OK, json.dumps(data).encode(), "application/json")
+
+    def _send_html(self, body: str) -> None:
+        html = f"<html><body>{body}</body></html>"
+        self._send(HTTPStatus.OK, html.encode(), "text/html; charset=utf-8")
+
+    def _send_download_page(self, file_id: str, link: str) -> None:
+        self._send_html(f'<h1>{file_id}.mp4</h1><a href="{link}">Download</a>')
+
+    def _send(
+        self,
+        status: HTTPStatus,
+        body: bytes,
+        content_type: str,
+        headers: dict[str, str] | None = None,
+    ) -> None:
+        self.send_response(status)
+        self.send_header("content-type", content_type)
+        self.send_header("content-length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_file(self) -> None:
+        size = self.server.scenario.size
+        start, end = 0, size - 1
+        if (range_header := self.headers.get("range")) is not None:
+            first, last = range_header.removeprefix("bytes=").split("-")
+            start, end = int(first), int(last) if last else size - 1
+            if start >= size:
+                self._send(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE, b"", "text/plain")
+                return
+
+            end = min(end, size - 1)
+            self.send_response(HTTPStatus.PARTIAL_CONTENT)
+            self.send_header("content-range", f"bytes {start}-{end}/{size}")
+        else:
+            self.send_response(HTTPStatus.OK)
+
+        self.send_header("content-type", "video/mp4")
+        self.send_header("content-length", str(end - start + 1))
+        self.send_header("accept-ranges", "bytes")
+        self.send_header("etag", ETAG)
+        self.end_headers()
+
+        if self.server.roll(self.server.scenario.disconnect_rate):
+            end = start + (end - start) // 2
+            self.close_connection = True
+
+        self._write_range(start, end)
+
+    def _write_range(self, start: int, end: int) -> None:
+        view = memoryview(self.server.block)
+        position = start
+        while position <= end:
+            offset = position % BLOCK_SIZE
+            length = min(BLOCK_SIZE - offset, end - position + 1)
+            self.wfile.write(view[offset : offset + length])
+            position += length
+
+
+def get_block(scenario: Scenario) -> bytes:
+    return Random(scenario.seed).randbytes(BLOCK_SIZE)
+
+
+def get_checksum(scenario: Scenario) -> str:
+    """SHA-256 of the files, the content of every file is the same."""
+
+    block = get_block(scenario)
+    hasher = sha256()
+    for _ in range(scenario.size // BLOCK_SIZE):
+        hasher.update(block)
+    hasher.update(block[: scenario.size % BLOCK_SIZE])
+    return hasher.hexdigest()
@@ -0,0 +1,271 @@
+"""
+Local HTTP server imitating the S3 API (as MinIO does) for the uploads of the S3 storage.
+
+Only the requests sent by the storage and the checks of the benchmark are served (path-style
+addressing, the signature is not checked):
+
+- PutObject "PUT /{bucket}/{key}";
+- CreateMultipartUpload "POST /{bucket}/{key}?uploads", UploadPart "PUT ...?partNumber&uploadId",
+  CompleteMultipartUpload "POST ...?uploadId" and AbortMultipartUpload "DELETE ...?uploadId";
+- ListObjectsV2 "GET /{bucket}?list-type=2" and ListMultipartUploads "GET /{bucket}?uploads".
+
+The content is not kept: the parts are hashed in order as they arrive (the parts received ahead
+wait in memory), an object keeps only its size and SHA-256, which the listing reports as its ETag.
+The CRC32 sent by botocore is checked, so a broken body is answered by "BadDigest". Every response
+can be delayed and a part of them answered by 503 "SlowDown" (retried by botocore) to imitate
+a slow or overloaded storage.
+"""
+
+from base64 import b64encode
+from dataclasses import dataclass, field
+from hashlib import sha256
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import count
+from random import Random
+from threading import Lock, Thread
+from time import sleep
+from typing import Any
+from urllib.parse import parse_qs, unquote, urlsplit
+from xml.sax.saxutils import escape
+from zlib import crc32
+
+
+XMLNS = "http://s3.amazonaws.com/doc/2006-03-01/"
+
+
+@dataclass(frozen=True, slots=True)
+class StorageScenario:
+    latency: float = 0  # seconds before each response
+    error_rate: float = 0  # part of the requests answered with 503
+    seed: int = 0
+
+
+@dataclass(slots=True)
+class Upload:
+    bucket: str
+    key: str
+    hasher: Any = field(default_factory=sha256)
+    size: int = 0
+    next_part: int = 1  # the parts before it are hashed
+    waiting: dict[int, bytes] = field(default_factory=dict)  # the parts received ahead
+
+    def add(self, number: int, body: bytes) -> None:
+        if number < self.next_part:
+            return  # the retry of the hashed part, its content is the same
+
+        self.waiting[number] = body
+        while self.next_part in self.waiting:
+            part = self.waiting.pop(self.next_part)
+            self.hasher.update(part)
+            self.size += len(part)
+            self.next_part += 1
+
+
+class MockS3(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, scenario: StorageScenario = StorageScenario(), port: int = 0) -> None:
+        super().__init__(("127.0.0.1", port), Handler)
+        self.scenario = scenario
+        self.objects: dict[tuple[str, str], tuple[int, str]] = {}  # size and SHA-256
+        self.uploads: dict[str, Upload] = {}
+        self.lock = Lock()
+
+        self._ids = count(1)
+        self._random = Random(scenario.seed)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host!s}:{port}"
+
+    def roll(self, rate: float) -> bool:
+        with self.lock:
+            return self._random.random() < rate
+
+    def new_upload_id(self) -> str:
+        with self.lock:
+            return f"upload{next(self._ids)}"
+
+    def start(self) -> Thread:
+        thread = Thread(target=self.serve_forever, name="s3", daemon=True)
+        thread.start()
+        return thread
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: MockS3  # type: ignore[reportIncompatibleVariableOverride]
+
+    def log_message(self, format: str, *args: object) -> None:
+        pass
+
+    def do_GET(self) -> None:
+        self._handle()
+
+    def do_PUT(self) -> None:
+        self._handle()
+
+    def do_POST(self) -> None:
+        self._handle()
+
+    def do_DELETE(self) -> None:
+        self._handle()
+
+    def _handle(self) -> None:
+        body = self.rfile.read(int(self.headers.get("content-length", 0)))
+        scenario = self.server.scenario
+        if scenario.latency:
+            sleep(scenario.latency)
+
+        if self.server.roll(scenario.error_rate):
+            self._send_error(HTTPStatus.SERVICE_UNAVAILABLE, "SlowDown")
+            return
+
+        url = urlsplit(self.path)
+        bucket, _, key = unquote(url.path).lstrip("/").partition("/")
+        query = {name: values[0] for name, values in parse_qs(url.query, True).items()}
+
+        match self.command, key:
+            case "GET", "" if "uploads" in query:
+                self._list_uploads(bucket)
+            case "GET", "":
+                self._list_objects(bucket, query.get("prefix", ""))
+            case "POST", _ if "uploads" in query:
+                self._create_upload(bucket, key)
+            case "PUT", _ if "uploadId" in query:
+                self._upload_part(query["uploadId"], int(query["partNumber"]), body)
+            case "POST", _ if "uploadId" in query:
+                self._complete_upload(query["uploadId"])
+            case "DELETE", _ if "uploadId" in query:
+                self._abort_upload(query["uploadId"])
+            case "PUT", _:
+                self._put_object(bucket, key, body)
+            case _:
+                self._send_error(HTTPStatus.NOT_IMPLEMENTED, "NotImplemented")
+
+    def _put_object(self, bucket: str, key: str, body: bytes) -> None:
+        if not self._check_digest(body):
+            return
+
+        with self.server.lock:
+            self.server.objects[bucket, key] = (len(body), sha256(body).hexdigest())
+        self._send(HTTPStatus.OK, headers={"etag": f'"{sha256(body).hexdigest()}"'})
+
+    def _create_upload(self, bucket: str, key: str) -> None:
+        upload_id = self.server.new_upload_id()
+        with self.server.lock:
+            self.server.uploads[upload_id] = Upload(bucket, key)
+
+        self._send_xml(
+            "InitiateMultipartUploadResult",
+            f"<Bucket>{escape(bucket)}</Bucket><Key>{escape(key)}</Key>"
+            f"<UploadId>{upload_id}</UploadId>",
+        )
+
+    def _upload_part(self, upload_id: str, number: int, body: bytes) -> None:
+        if not self._check_digest(body):
+            return
+
+        with self.server.lock:
+            upload = self.server.uploads.get(upload_id)
+            if upload is not None:
+                upload.add(number, body)
+
+        if upload is None:
+            self._send_error(HTTPStatus.NOT_FOUND, "NoSuchUpload")
+        else:
+            self._send(HTTPStatus.OK, headers={"etag": f'"{upload_id}-{number}"'})
+
+    def _complete_upload(self, upload_id: str) -> None:
+        with self.server.lock:
+            upload = self.server.uploads.pop(upload_id, None)
+            if upload is not None and not upload.waiting:
+                self.server.objects[upload.bucket, upload.key] = (
+                    upload.size,
+                    upload.hasher.hexdigest(),
+                )
+
+        if upload is None:
+            self._send_error(HTTPStatus.NOT_FOUND, "NoSuchUpload")
+        elif upload.waiting:  # a part before them is missing
+            self._send_error(HTTPStatus.BAD_REQUEST, "InvalidPart")
+        else:
+            self._send_xml(
+                "CompleteMultipartUploadResult",
+                f"<Bucket>{escape(upload.bucket)}</Bucket><Key>{escape(upload.key)}</Key>"
+                f'<ETag>"{upload.hasher.hexdigest()}"</ETag>',
+            )
+
+    def _abort_upload(self, upload_id: str) -> None:
+        with self.server.lock:
+            upload = self.server.uploads.pop(upload_id, None)
+
+        if upload is None:
+            self._send_error(HTTPStatus.NOT_FOUND, "NoSuchUpload")
+        else:
+            self._send(HTTPStatus.NO_CONTENT)
+
+    def _list_objects(self, bucket: str, prefix: str) -> None:
+        with self.server.lock:
+            objects = sorted(
+                (key, size, digest)
+                for (name, key), (size, digest) in self.server.objects.items()
+                if name == bucket and key.startswith(prefix)
+            )
+
+        contents = "".join(
+            f"<Contents><Key>{escape(key)}</Key><LastModified>2024-01-01T00:00:00.000Z"
+            f'</LastModified><ETag>"{digest}"</ETag><Size>{size}</Size></Contents>'
+            for key, size, digest in objects
+        )
+        self._send_xml(
+            "ListBucketResult",
+            f"<Name>{escape(bucket)}</Name><Prefix>{escape(prefix)}</Prefix>"
+            f"<KeyCount>{len(objects)}</KeyCount><MaxKeys>{len(objects)}</MaxKeys>"
+            f"<IsTruncated>false</IsTruncated>{contents}",
+        )
+
+    def _list_uploads(self, bucket: str) -> None:
+        with self.server.lock:
+            uploads = [
+                (upload_id, upload.key)
+                for upload_id, upload in self.server.uploads.items()
+                if upload.bucket == bucket
+            ]
+
+        entries = "".join(
+            f"<Upload><Key>{escape(key)}</Key><UploadId>{upload_id}</UploadId></Upload>"
+            for upload_id, key in uploads
+        )
+        self._send_xml(
+            "ListMultipartUploadsResult",
+            f"<Bucket>{escape(bucket)}</Bucket><IsTruncated>false</IsTruncated>{entries}",
+        )
+
+    def _check_digest(self, body: bytes) -> bool:
+        expected = self.headers.get("x-amz-checksum-crc32")
+        if expected is None or expected == b64encode(crc32(body).to_bytes(4, "big")).decode():
+            return True
+
+        self._send_error(HTTPStatus.BAD_REQUEST, "BadDigest")
+        return False
+
+    def _send_xml(self, root: str, content: str) -> None:
+        xml = f'<?xml version="1.0" encoding="UTF-8"?><{root} xmlns="{XMLNS}">{content}</{root}>'
+        self._send(HTTPStatus.OK, xml.encode(), {"content-type": "application/xml"})
+
+    def _send_error(self, status: HTTPStatus, code: str) -> None:
+        xml = f"<?xml version='1.0' encoding='UTF-8'?><Error><Code>{code}</Code></Error>"
+        self._send(status, xml.encode(), {"content-type": "application/xml"})
+
+    def _send(
+        self, status: HTTPStatus, body: bytes = b"", headers: dict[str, str] | None = None
+    ) -> None:
+        self.send_response(status)
+        self.send_header("content-length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
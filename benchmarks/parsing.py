@@ -0,0 +1,257 @@
+"""
+Parse time and memory of the HTML pages: BeautifulSoup against the lxml tree.
+
+The BeautifulSoup path is the previous implementation of core.parsing (a complete soup of every
+page, the same extraction), the lxml path is the current one (the album pages are parsed
+completely, the file and the download pages until the title and the "Download" hyperlink).
+Both must extract the same title, hyperlinks and file URLs.
+
+The pages are built like the pages of the hostings (the head with the scripts and the styles,
+the navigation, the footer, the Cloudflare email protection in the title), or the saved pages
+are read from a directory: "album*.html" (Bunkr), "table*.html" (Cyberdrop), "file*.html"
+and "download*.html".
+
+The memory is the growth of RSS of a fresh process per document kept alive (the lxml tree
+is allocated by libxml2, tracemalloc does not see it), so the benchmark runs on Linux.
+
+    python -m benchmarks.parsing --repeat 200 --album-files 500
+    python -m benchmarks.parsing --pages saved_pages/
+"""
+
+import multiprocessing
+from pathlib import Path
+import os
+import re
+import statistics
+from time import perf_counter
+from typing import Any, Callable
+
+import click
+from yarl import URL
+
+from simple_downloader.core import parsing
+from simple_downloader.core.utils import decode_cloudflare_email_protection
+
+
+BASE_URL = URL("https://cyberdrop.me")
+KEPT_DOCUMENTS = 50
+EMAIL = "5d282e382f1d38253c302d3138733e3230"  # "user@example.com" protected by Cloudflare
+
+HEAD = (
+    "<head><meta charset='utf-8'><title>{title} | Bunkr</title>"
+    + "".join(f"<meta name='m{i}' content='{'x' * 40}'>" for i in range(30))
+    + "".join(f"<link rel='preload' href='/assets/{i}.js' as='script'>" for i in range(20))
+    + f"<style>{'.c{{margin:0;padding:0;color:#fff}}' * 400}</style>"
+    + f"<script>{'window.dataLayer=window.dataLayer||[];' * 300}</script></head>"
+)
+NAVIGATION = (
+    "<nav><ul>"
+    + "".join(f"<li><a href='/n/{i}'>Item {i}</a></li>" for i in range(40))
+    + "</ul></nav>"
+)
+FOOTER = (
+    "<footer>"
+    + "".join(
+        f"<div class='col'><a href='/f/{i}'>Link {i}</a><p>{'text ' * 20}</p></div>"
+        for i in range(60)
+    )
+    + "</footer><script>"
+    + "console.log(1);" * 500
+    + "</script>"
+)
+
+
+def build_page(title: str, body: str) -> str:
+    return (
+        f"<!DOCTYPE html><html>{HEAD.format(title=title)}<body>{NAVIGATION}"
+        f"<main>{body}</main>{FOOTER}</body></html>"
+    )
+
+
+def build_pages(album_files: int) -> dict[str, str]:
+    title = f'<h1>video <a class="__cf_email__" data-cfemail="{EMAIL}">[email protected]</a></h1>'
+    cards = "".join(
+        f"<div class='relative group'><a href='https://bunkr.si/v/{i}'><img src='/t/{i}.png'>"
+        f"<div class='details'><p>video-{i}.mp4</p><span>12.5 MB</span></div></a></div>"
+        for i in range(album_files)
+    )
+    rows = "".join(
+        f"<div class='column'><a class='image' href='/f/{i}'><img src='/t/{i}.png'></a>"
+        f"<p class='name'>file-{i}.jpg</p></div>"
+        for i in range(album_files)
+    )
+    related = "".join(
+        f"<div class='card'><a href='/v/r{i}'>Related {i}</a></div>" for i in range(30)
+    )
+    return {
+        "album": build_page("album", f"<h1>album</h1><div class='grid-images'>{cards}</div>"),
+        "table": build_page("album", f"<h1>album</h1><div id='table'>{rows}</div>"),
+        "file": build_page(
+            "video",
+            f"{title}<video src='/s.mp4'></video><a href='https://get.bunkr.su/1'>Download</a>"
+            f"<div class='related'>{related}</div>",
+        ),
+        "download": build_page(
+            "video", f"<h1>video.mp4</h1><a href='https://c.bunkr.ru/v.mp4'>Download</a>{related}"
+        ),
+    }
+
+
+def read_pages(directory: Path) -> dict[str, str]:
+    return {
+        path.stem: path.read_text(encoding="utf-8", errors="replace")
+        for path in sorted(directory.glob("*.html"))
+        if path.stem.startswith(("album", "table", "file", "download"))
+    }
+
+
+# -- the previous implementation -------------------------------------------------------------
+
+
+def parse_soup(kind: str, html_page: str) -> Any:
+    from bs4 import BeautifulSoup
+    from bs4.element import NavigableString, Tag
+
+    def parse_title(soup: BeautifulSoup) -> str:
+        h1_tag = soup.h1
+        assert h1_tag is not None
+        if h1_tag.select_one(".__cf_email__") is None:
+            return h1_tag.get_text(strip=True)
+
+        match h1_tag.next:
+            case Tag() as tag:
+                return decode_cloudflare_email_protection(tag["data-cfemail"])  # type: ignore
+            case NavigableString() as string:
+                data: str = string.next["data-cfemail"]  # type: ignore
+                return f"{string.get_text(strip=True)}{decode_cloudflare_email_protection(data)}"
+            case _:
+                raise ValueError(h1_tag)
+
+    def parse_download_hyperlink(soup: BeautifulSoup) -> URL:
+        return URL(soup.find("a", href=True, string=re.compile(r"(?i)download"))["href"])  # type: ignore
+
+    soup = BeautifulSoup(html_page, "lxml")
+    match kind:
+        case "album":
+            return parse_title(soup), [URL(tag["href"]) for tag in soup.select(".grid-images a")]  # type: ignore
+        case "table":
+            urls = [BASE_URL.with_path(tag["href"]) for tag in soup.select("#table .image")]  # type: ignore
+            return parse_title(soup), urls
+        case "file":
+            return parse_title(soup), parse_download_hyperlink(soup)
+        case _:
+            return parse_download_hyperlink(soup)
+
+
+# -- the current implementation --------------------------------------------------------------
+
+
+def parse_tree(kind: str, html_page: str) -> Any:
+    match kind:
+        case "album":
+            document = parsing.get_document(html_page)
+            path = f"//*[{parsing.has_class('grid-images')}]//a"
+            return parsing.parse_title(document), list(parsing.parse_file_urls(document, path))
+        case "table":
+            document = parsing.get_document(html_page)
+            path = f"//*[@id='table']//*[{parsing.has_class('image')}]"
+            urls = list(parsing.parse_file_urls(document, path, BASE_URL))
+            return parsing.parse_title(document), urls
+        case "file":
+            document = parsing.get_document(html_page, parsing.TITLE, parsing.DOWNLOAD_HYPERLINK)
+            return parsing.parse_title(document), parsing.parse_download_hyperlink(document)
+        case _:
+            document = parsing.get_document(html_page, parsing.DOWNLOAD_HYPERLINK)
+            return parsing.parse_download_hyperlink(document)
+
+
+# ---------------------------------------------------------------------------------------------
+
+
+def get_kind(name: str) -> str:
+    return next(kind for kind in ("album", "table", "file", "download") if name.startswith(kind))
+
+
+def measure_time(parse: Callable[[str, str], Any], kind: str, html_page: str, repeat: int) -> float:
+    seconds = []
+    for _ in range(repeat):
+        started_at = perf_counter()
+        parse(kind, html_page)
+        seconds.append(perf_counter() - started_at)
+
+    return statistics.median(seconds)
+
+
+def keep_documents(implementation: str, kind: str, html_page: str, connection: Any) -> None:
+    if implementation == "soup":
+        from bs4 import BeautifulSoup
+
+        parse: Callable[[str], Any] = lambda page: BeautifulSoup(page, "lxml")  # noqa: E731
+    else:
+        targets = {
+            "file": (parsing.TITLE, parsing.DOWNLOAD_HYPERLINK),
+            "download": (parsing.DOWNLOAD_HYPERLINK,),
+        }
+        parse = lambda page: parsing.get_document(page, *targets.get(kind, ()))  # noqa: E731
+
+    parse("<h1>title</h1>")  # the imports, the freed memory of a large page would be reused
+    before = get_rss()
+    documents = [parse(html_page) for _ in range(KEPT_DOCUMENTS)]
+    connection.send((get_rss() - before) / len(documents))
+
+
+def get_rss() -> int:
+    """The current resident memory (not the peak, the freed memory is reused)."""
+
+    resident_pages = Path("/proc/self/statm").read_text().split()[1]
+    return int(resident_pages) * os.sysconf("SC_PAGE_SIZE")
+
+
+def measure_memory(implementation: str, kind: str, html_page: str) -> float:
+    """Bytes per document, measured in a fresh process."""
+
+    context = multiprocessing.get_context("spawn")  # a forked process has the freed memory
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=keep_documents, args=(implementation, kind, html_page, sender))
+    process.start()
+    memory = receiver.recv()
+    process.join()
+    return memory
+
+
+@click.command()
+@click.option("--repeat", "-r", type=click.IntRange(min=1), default=100)
+@click.option("--album-files", type=click.IntRange(min=1), default=200, help="Files in the album.")
+@click.option(
+    "--pages",
+    type=click.Path(exists=True, file_okay=False, path_type=Path),
+    help="Directory of the saved pages.",
+)
+def main(repeat: int, album_files: int, pages: Path | None) -> None:
+    html_pages = read_pages(pages) if pages is not None else build_pages(album_files)
+    if not html_pages:
+        raise click.ClickException("No pages: album*.html, table*.html, file*.html, download*.html")
+
+    click.echo(
+        f"{'page':<16}{'size':>8}{'soup':>10}{'lxml':>10}{'speedup':>9}"
+        f"{'soup mem':>11}{'lxml mem':>11}"
+    )
+    for name, html_page in html_pages.items():
+        kind = get_kind(name)
+        expected, received = parse_soup(kind, html_page), parse_tree(kind, html_page)
+        if expected != received:
+            raise click.ClickException(f"{name}: {received} is extracted, {expected} expected")
+
+        soup_time = measure_time(parse_soup, kind, html_page, repeat)
+        tree_time = measure_time(parse_tree, kind, html_page, repeat)
+        soup_memory = measure_memory("soup", kind, html_page)
+        tree_memory = measure_memory("tree", kind, html_page)
+        click.echo(
+            f"{name:<16}{len(html_page) / 1024:>6.0f}KB{soup_time * 1000:>8.2f}ms"
+            f"{tree_time * 1000:>8.2f}ms{soup_time / tree_time:>8.1f}x"
+            f"{soup_memory / 1024:>9.0f}KB{tree_memory / 1024:>9.0f}KB"
+        )
+
+
+if __name__ == "__main__":
+    main()
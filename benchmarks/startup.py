@@ -0,0 +1,130 @@
+"""
+Startup time of the CLI and the modules imported before the first request.
+
+Each scenario is run in a fresh interpreter several times, the best and the median wall time
+are reported. One more run with "-X importtime" lists the slowest imports (cumulative time)
+and the heavy dependencies that were loaded, e.g. the HTML parser must not be imported for
+"--help" or for the hosting with the API (pixeldrain).
+
+The user agent of the session is measured separately: the dataset of fake_useragent against
+the pool cached on the disk.
+
+    python -m benchmarks.startup --repeat 10 --top 15
+"""
+
+from pathlib import Path
+import statistics
+import subprocess
+import sys
+import tempfile
+from time import perf_counter
+
+import click
+
+
+HEAVY = ("bs4", "lxml", "tqdm", "tenacity", "requests", "fake_useragent", "asyncio", "httpx")
+
+# everything the single file of the hosting needs before the first request
+SESSION = """
+from yarl import URL
+import simple_downloader.__main__
+from simple_downloader.handlers import downloader, factory
+from simple_downloader.handlers.requester import Requester
+factory.get_crawler(URL("{url}"), Requester())
+"""
+
+SCENARIOS = {
+    "--help": ["-m", "simple_downloader", "--help"],
+    "pixeldrain": ["-c", SESSION.format(url="https://pixeldrain.com/u/abc")],
+    "bunkr": ["-c", SESSION.format(url="https://bunkr.si/v/abc")],
+}
+
+USER_AGENT = """
+from time import perf_counter
+started_at = perf_counter()
+{code}
+print(perf_counter() - started_at)
+"""
+
+
+def measure(arguments: list[str], repeat: int) -> list[float]:
+    seconds = []
+    for _ in range(repeat):
+        started_at = perf_counter()
+        subprocess.run([sys.executable, *arguments], check=True, capture_output=True)
+        seconds.append(perf_counter() - started_at)
+
+    return seconds
+
+
+def get_import_times(arguments: list[str]) -> dict[str, int]:
+    """Cumulative microseconds of each imported module."""
+
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", *arguments], check=True, capture_output=True, text=True
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = (
+            part.strip() for part in line.removeprefix("import time:").split("|")
+        )
+        times[name] = int(cumulative)
+
+    return times
+
+
+def measure_user_agent(code: str, repeat: int) -> float:
+    seconds = []
+    for _ in range(repeat):
+        result = subprocess.run(
+            [sys.executable, "-c", USER_AGENT.format(code=code)],
+            check=True,
+            capture_output=True,
+            text=True,
+        )
+        seconds.append(float(result.stdout))
+
+    return statistics.median(seconds)
+
+
+@click.command()
+@click.option("--repeat", "-r", type=click.IntRange(min=1), default=10)
+@click.option("--top", type=click.IntRange(min=0), default=10, help="Slowest imports to list.")
+def main(repeat: int, top: int) -> None:
+    click.echo(f"{'scenario':<12}{'best':>9}{'median':>9}{'imports':>10}  heavy dependencies")
+    details = []
+    for name, arguments in SCENARIOS.items():
+        seconds = measure(arguments, repeat)
+        times = get_import_times(arguments)
+        heavy = [module for module in HEAVY if module in times]
+        click.echo(
+            f"{name:<12}{min(seconds) * 1000:>7.0f}ms{statistics.median(seconds) * 1000:>7.0f}ms"
+            f"{len(times):>10}  {', '.join(heavy) or '-'}"
+        )
+        details.append((name, times))
+
+    with tempfile.TemporaryDirectory(prefix="bench-") as directory:
+        path = Path(directory, "user_agents.json")
+        dataset = measure_user_agent(
+            "from fake_useragent import UserAgent\nUserAgent().random", repeat
+        )
+        pool = (
+            "import simple_downloader.handlers.user_agents as user_agents\n"
+            f"user_agents.USER_AGENTS_PATH = __import__('pathlib').Path({str(path)!r})\n"
+            "user_agents.get_user_agent()"
+        )
+        measure_user_agent(pool, 1)  # the pool is sampled
+        cached = measure_user_agent(pool, repeat)
+
+    click.echo(f"\nUser agent: {dataset * 1000:.1f}ms by the dataset, {cached * 1000:.1f}ms cached")
+
+    for name, times in details if top else ():
+        click.echo(f"\nSlowest imports ({name}):")
+        for module, microseconds in sorted(times.items(), key=lambda item: -item[1])[:top]:
+            click.echo(f"{microseconds / 1000:>9.1f}ms  {module}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,29 +1,51 @@
-from functools import wraps
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from contextlib import ExitStack, contextmanager
+from dataclasses import replace
+from functools import partial, wraps
+from importlib.util import find_spec
+from inspect import iscoroutinefunction
 from logging import config, getLogger
+import os
 from pathlib import Path
 import sys
-from typing import Any, Callable, ParamSpec, assert_never
+from time import sleep
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Iterable,
+    Iterator,
+    Literal,
+    ParamSpec,
+    TextIO,
+    assert_never,
+)
 
 import click
-from requests import (
-    ConnectionError,
-    ConnectTimeout,
-    HTTPError,
-    ReadTimeout,
-    RequestException,
-    TooManyRedirects,
-)
 from yarl import URL
 
 from simple_downloader.config import (
     BASE_DIR,
+    CACHE_TTL,
+    DEFAULT_ENGINE,
+    DEFERRED_ROUNDS,
+    DEFAULT_PROCESSES,
+    DEFAULT_SEGMENTS,
+    DEFAULT_WORKERS,
     FAILURE,
+    HASH_ALGORITHM,
     INFO,
+    JOBS_NAME,
     MAX_REDIRECTS,
+    MIRRORS,
     SAVE_FOLDER_NAME,
+    SERVICE_HOST,
+    SERVICE_PORT,
+    STORE_NAME,
     UNKNOWN,
 )
 from simple_downloader.core.exceptions import (
+    CircuitOpenError,
     CrawlerNotFound,
     DeviceSpaceRunOutError,
     DownloadError,
@@ -31,15 +53,44 @@ from simple_downloader.core.exceptions import (
     ExtensionNotFoundError,
     ExtensionNotSupported,
     FileOpenError,
+    NotEnoughSpaceError,
 )
+from simple_downloader.core.jobs import Job, JobState, close_queues, get_queue
 from simple_downloader.core.log_settings import LOGGING
-from simple_downloader.core.models import Crawler, DownloadCounter, MediaAlbum, MediaFile
+from simple_downloader.core.manifest import Manifest, close_manifests, get_manifest
+from simple_downloader.core.metrics import CONNECTIONS, REQUESTS, Format, MetricsExporter
+from simple_downloader.core.models import (
+    AsyncCrawler,
+    Crawler,
+    DownloadCounter,
+    DownloadOptions,
+    MediaAlbum,
+    MediaFile,
+)
+from simple_downloader.core.store import ContentStore, close_stores, get_store
+from simple_downloader.core.tracing import span, start_tracing, stop_tracing
 from simple_downloader.core.utils import (
+    echo,
     get_http_status_phrase,
     get_updated_parent_path,
     get_url_from_args,
+    parse_rate,
+    read_urls,
 )
-from simple_downloader.handlers import downloader, factory, requester
+from simple_downloader.handlers import factory
+from simple_downloader.handlers.cache import ResponseCache
+from simple_downloader.handlers.health import DeferredJobs, HealthTracker
+from simple_downloader.handlers.integrity import get_algorithms, save_checksum
+from simple_downloader.handlers.mirrors import Mirrors
+from simple_downloader.handlers.pipeline import Resolved, Resolver
+from simple_downloader.handlers.rate_limiter import BandwidthLimiter, ConcurrencyLimiter
+
+if TYPE_CHECKING:
+    import asyncio
+
+    from simple_downloader.handlers import requester
+    from simple_downloader.handlers.async_requester import AsyncRequester
+    from simple_downloader.sharding import ShardBy
 
 P = ParamSpec("P")
 
@@ -52,47 +103,73 @@ def error_handling_wrapper(func: Callable[..., Any]) -> Callable[..., Any]:
     Intercepts all major exceptions and logs them to a log file and the CLI.
 
     Allows you to continue running the program even if there is a failed request.
+    Coroutine functions are wrapped as well (the async engine).
     """
 
+    if iscoroutinefunction(func):
+
+        @wraps(func)
+        async def async_wrapper(*args: P.args, **kwargs: P.kwargs) -> Any:
+            with intercept_errors(get_url_from_args(args)):
+                return await func(*args, **kwargs)
+
+        return async_wrapper
+
     @wraps(func)
     def wrapper(*args: P.args, **kwargs: P.kwargs) -> Any:
-        url = get_url_from_args(args)
-
-        try:
+        with intercept_errors(get_url_from_args(args)):
             return func(*args, **kwargs)
 
-        except ExtensionNotFoundError as e:
-            logger.info(e)
-            click.echo(f'{FAILURE} File "{e.title}" has no extension: {url}')
-        except ExtensionNotSupported as e:
-            logger.info(e)
-            click.echo(f'{FAILURE} File extension "{e.extension}" is not supported: {url}')
-        except FileOpenError as e:
-            logger.info(e)
-            click.echo(f"{FAILURE} Filename has forbidden chars: {url}")
+    return wrapper
 
-        except HTTPError as e:
-            logger.info(e)
-            code = e.response.status_code
-            phrase = get_http_status_phrase(code)
-            click.echo(f"{FAILURE} {phrase} ({code} code): {url}")
-        except TooManyRedirects as e:
-            logger.info(e)
-            click.echo(f"{FAILURE} Too Many Redirects (max {MAX_REDIRECTS}): {url}")
-        except ConnectTimeout as e:
-            logger.info(e)
-            click.echo(f"{FAILURE} Connect Timeout: {url}")
-        except ReadTimeout as e:
-            logger.info(e)
-            click.echo(f"{FAILURE} Read Timeout: {url}")
-        except (ConnectionError, EmptyContentTypeError) as e:
-            logger.info(e)
-            click.echo(f"{FAILURE} Unknown Server Error: {url}")
-        except (RequestException, DownloadError) as e:
-            logger.warning(e, exc_info=True)
-            click.echo(f"{FAILURE} Download Error: {url}")
 
-    return wrapper
+@contextmanager
+def intercept_errors(url: URL | str) -> Iterator[None]:
+    from requests import (
+        ConnectionError,
+        ConnectTimeout,
+        HTTPError,
+        ReadTimeout,
+        RequestException,
+        TooManyRedirects,
+    )
+
+    try:
+        yield
+
+    except ExtensionNotFoundError as e:
+        logger.info(e)
+        echo(f'{FAILURE} File "{e.title}" has no extension: {url}')
+    except ExtensionNotSupported as e:
+        logger.info(e)
+        echo(f'{FAILURE} File extension "{e.extension}" is not supported: {url}')
+    except FileOpenError as e:
+        logger.info(e)
+        echo(f"{FAILURE} Filename has forbidden chars: {url}")
+
+    except HTTPError as e:
+        logger.info(e)
+        code = e.response.status_code
+        phrase = get_http_status_phrase(code)
+        echo(f"{FAILURE} {phrase} ({code} code): {url}")
+    except TooManyRedirects as e:
+        logger.info(e)
+        echo(f"{FAILURE} Too Many Redirects (max {MAX_REDIRECTS}): {url}")
+    except ConnectTimeout as e:
+        logger.info(e)
+        echo(f"{FAILURE} Connect Timeout: {url}")
+    except ReadTimeout as e:
+        logger.info(e)
+        echo(f"{FAILURE} Read Timeout: {url}")
+    except (ConnectionError, EmptyContentTypeError) as e:
+        logger.info(e)
+        echo(f"{FAILURE} Unknown Server Error: {url}")
+    except CircuitOpenError as e:
+        logger.info(e)
+        echo(f'{FAILURE} Host "{e.host}" is unavailable: {url}')
+    except (RequestException, DownloadError) as e:
+        logger.warning(e, exc_info=True)
+        echo(f"{FAILURE} Download Error: {url}")
 
 
 @error_handling_wrapper
@@ -100,61 +177,1193 @@ def download(
     url: URL,
     save_path: Path,
     crawler: Crawler,
-    http_client: requester.Requester,
+    http_client: "requester.Requester",
     counter: DownloadCounter,
+    pool: ThreadPoolExecutor | None = None,
+    options: DownloadOptions = DownloadOptions(),
 ) -> None:
+    """
+    Downloads the media by URL.
+
+    The files of the album are resolved by the separate thread ahead of the downloads.
+    If a pool is passed, they are downloaded by its workers, otherwise one after another.
+    Each large file can be split into several segments (see the options).
+    """
+
     counter.add_attempt()
 
-    media: MediaAlbum | MediaFile = crawler.get_media(url)
+    with tracking(url, save_path, counter, options):
+        if is_skipped(get_manifest(save_path), counter, url, local=options.storage is None):
+            return
+
+        set_state(url, save_path, options, JobState.RESOLVING)
+        with span("crawl", url):
+            media: MediaAlbum | MediaFile = crawler.get_media(url)
+        save_media(url, media, save_path, crawler, http_client, counter, pool, options)
+
+
+@error_handling_wrapper
+def download_resolved(
+    url: URL,
+    resolved: Resolved,
+    save_path: Path,
+    crawler: Crawler,
+    http_client: "requester.Requester",
+    counter: DownloadCounter,
+    pool: ThreadPoolExecutor | None,
+    options: DownloadOptions,
+) -> None:
+    """
+    Counterpart of the download() for the file of the album resolved by the pipeline
+    (or for the album restored from the job queue).
+    """
+
+    counter.add_attempt()
+
+    with tracking(url, save_path, counter, options):
+        if resolved.is_skipped:
+            return
+
+        media = resolved.get_media()
+        save_media(url, media, save_path, crawler, http_client, counter, pool, options)
+
+
+def save_media(
+    url: URL,
+    media: MediaAlbum | MediaFile,
+    save_path: Path,
+    crawler: Crawler,
+    http_client: "requester.Requester",
+    counter: DownloadCounter,
+    pool: ThreadPoolExecutor | None,
+    options: DownloadOptions,
+) -> None:
+    from simple_downloader.handlers import downloader
+
     match media:
         case MediaAlbum():
+            counter.add_album()
             save_path = get_updated_parent_path(save_path, media.title)
-            for file_url in media.file_urls:
-                download(file_url, save_path, crawler, http_client, counter)
+            file_urls = expand(url, save_path, media, options)
+            skip = partial(is_resolving, get_manifest(save_path), counter, save_path, options)
+
+            with Resolver(file_urls, crawler, skip) as resolver, counting_connections(media):
+                if pool is None:
+                    consume(resolver, save_path, crawler, http_client, counter, None, options)
+                else:
+                    # every worker takes the next resolved file as soon as it is free
+                    # (no more of them than the limiter lets download from the hosting at once)
+                    workers = pool._max_workers
+                    if options.limiter is not None:
+                        workers = min(workers, options.limiter.per_host)
+                    tasks = [
+                        pool.submit(
+                            consume,
+                            resolver,
+                            save_path,
+                            crawler,
+                            http_client,
+                            counter,
+                            pool,
+                            options,
+                        )
+                        for _ in range(workers)
+                    ]
+                    wait_for_tasks(tasks)
 
         case MediaFile():
-            downloader.download(media, save_path, http_client)
+            with claiming(media, options):
+                manifest = get_manifest(save_path)
+                if is_skipped(
+                    manifest, counter, media.url, media.stream_url, local=options.storage is None
+                ):
+                    return
+
+                store = get_store(options.store_path)
+                if store is not None and is_linked(store, counter, media, save_path):
+                    manifest.add(media, url)
+                    return
+
+                with holding(url, options):
+                    set_state(url, save_path, options, JobState.DOWNLOADING)
+                    downloader.download(
+                        media,
+                        save_path,
+                        http_client,
+                        leave_progress_bar=pool is None,
+                        segments=options.segments,
+                        hash_algorithm=options.hash_algorithm,
+                        storage=options.storage,
+                    )
+                if media.is_downloaded:
+                    if store is not None:
+                        store.add(media, save_path)
+                    manifest.add(media, url)
+                    counter.add_success()
+
+        case _ as unreachable:
+            assert_never(unreachable)
+
+
+def consume(
+    resolver: Resolver,
+    save_path: Path,
+    crawler: Crawler,
+    http_client: "requester.Requester",
+    counter: DownloadCounter,
+    pool: ThreadPoolExecutor | None,
+    options: DownloadOptions,
+) -> None:
+    for resolved in resolver:
+        download_resolved(
+            resolved.url, resolved, save_path, crawler, http_client, counter, pool, options
+        )
+
+
+def is_skipped(
+    manifest: Manifest, counter: DownloadCounter, *urls: URL, local: bool = True
+) -> bool:
+    """Checks by the manifest of the save folder if the file has already been downloaded."""
+
+    url = next((url for url in urls if manifest.is_complete(url, local)), None)
+    if url is None:
+        return False
+
+    logger.info("Skip %s, it has already been downloaded", url)
+    echo(f"{INFO} Already downloaded: {url}")
+    counter.add_skip()
+    return True
+
+
+def is_linked(
+    store: ContentStore, counter: DownloadCounter, file: MediaFile, save_path: Path
+) -> bool:
+    """
+    Places the file from the store if it has already been downloaded into another folder,
+    with its checksum as the download would write it.
+    """
+
+    method = store.link(file, save_path)
+    if method is None:
+        return False
+
+    if file.checksum is not None:
+        save_checksum(save_path.joinpath(str(file.filename)), file.checksum)
+
+    logger.info("Take %s from the store (%s)", file.url, method)
+    echo(f"{INFO} Taken from the store ({method}): {file.url}")
+    counter.add_link()
+    return True
+
+
+def is_resolving(
+    manifest: Manifest,
+    counter: DownloadCounter,
+    save_path: Path,
+    options: DownloadOptions,
+    url: URL,
+) -> bool:
+    """The filter of the pipeline, the file is skipped if it is downloaded, otherwise resolved."""
+
+    if is_skipped(manifest, counter, url, local=options.storage is None):
+        return True
+
+    set_state(url, save_path, options, JobState.RESOLVING)
+    return False
+
+
+def expand(url: URL, save_path: Path, album: MediaAlbum, options: DownloadOptions) -> Iterable[URL]:
+    """Records the files of the album to the job queue, so a restart does not parse it again."""
+
+    queue = get_queue(options.jobs_path)
+    if queue is None:
+        return album.file_urls
+
+    file_urls = list(album.file_urls)
+    queue.expand(url, save_path, file_urls)
+    return file_urls
+
+
+def set_state(
+    url: URL,
+    save_path: Path,
+    options: DownloadOptions,
+    state: JobState,
+    reason: str | None = None,
+) -> None:
+    queue = get_queue(options.jobs_path)
+    if queue is not None:
+        queue.update(url, save_path, state, reason)
+    if options.listener is not None:
+        options.listener(url, state, reason)
+
+
+@contextmanager
+def tracking(
+    url: URL, save_path: Path, counter: DownloadCounter, options: DownloadOptions
+) -> Iterator[None]:
+    """
+    Records the result of the job: done or failed with the reason (it is reported by the wrapper).
+
+    The job failed fast by the open circuit of the host is deferred, it is run again later.
+    The file that does not fit on the disk is queued, "resume" downloads it when there is space.
+    """
+
+    try:
+        yield
+    except Exception as e:
+        if isinstance(e, CircuitOpenError) and options.deferred is not None:
+            defer(url, save_path, counter, options, e)
+            return
+        if isinstance(e, NotEnoughSpaceError):
+            postpone(url, save_path, counter, options, e)
+            return
+
+        set_state(url, save_path, options, JobState.FAILED, f"{type(e).__name__}: {e}")
+        raise
+    else:
+        set_state(url, save_path, options, JobState.DONE)
+
+
+def defer(
+    url: URL,
+    save_path: Path,
+    counter: DownloadCounter,
+    options: DownloadOptions,
+    error: CircuitOpenError,
+) -> None:
+    assert options.deferred is not None
+
+    options.deferred.add(Job(url, save_path), error.retry_in)
+    counter.add_deferral()  # the attempt is made again
+    set_state(url, save_path, options, JobState.DEFERRED, str(error))
+    logger.info("%s is deferred: %s", url, error)
+    echo(f'{INFO} Host "{error.host}" is unavailable, deferred: {url}')
+
+
+def postpone(
+    url: URL,
+    save_path: Path,
+    counter: DownloadCounter,
+    options: DownloadOptions,
+    error: NotEnoughSpaceError,
+) -> None:
+    counter.add_queued()
+    set_state(url, save_path, options, JobState.QUEUED, str(error))
+    logger.warning("%s is queued: %s", url, error)
+    echo(f"{INFO} Not enough free space, queued: {url}")
+
+
+@contextmanager
+def holding(url: URL, options: DownloadOptions) -> Iterator[None]:
+    """Waits for the slot of the download budget shared by the tasks of the service."""
+
+    if options.limiter is None:
+        yield
+        return
+
+    with options.limiter.hold(factory.get_hosting(url)):
+        yield
+
+
+@contextmanager
+def claiming(file: MediaFile, options: DownloadOptions) -> Iterator[None]:
+    """Waits while the same file is downloaded by another worker process (see --processes)."""
+
+    if options.claims is None:
+        yield
+        return
+
+    key = str(file.url)
+    options.claims.claim(key, os.getpid())
+    try:
+        yield
+    finally:
+        options.claims.release(key)
+
+
+def wait_for_tasks(tasks: list[Future[None]]) -> None:
+    """
+    Waits for the tasks to complete.
+
+    The errors of a single file are already intercepted by the wrapper, so the exception here
+    means the whole process must be stopped (e.g. no free space), then pending tasks are cancelled.
+    """
+
+    try:
+        for task in as_completed(tasks):
+            task.result()
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+
+
+@error_handling_wrapper
+async def download_async(
+    url: URL,
+    save_path: Path,
+    crawler: AsyncCrawler,
+    http_client: "AsyncRequester",
+    counter: DownloadCounter,
+    limit: "asyncio.Semaphore",
+    leave_progress_bar: bool,
+    options: DownloadOptions = DownloadOptions(),
+    media: MediaAlbum | MediaFile | None = None,
+) -> None:
+    """
+    Asynchronous counterpart of the download().
+
+    The files of the album are processed as tasks of one event loop, the limit restricts
+    the number of files that are resolved and downloaded at the same time.
+    The media may be passed already resolved (the album restored from the job queue).
+    """
+
+    counter.add_attempt()
+
+    with tracking(url, save_path, counter, options):
+        if media is None:
+            if is_skipped(get_manifest(save_path), counter, url, local=options.storage is None):
+                return
+
+            set_state(url, save_path, options, JobState.RESOLVING)
+            async with limit:
+                with span("crawl", url):
+                    media = await crawler.get_media(url)
+
+        await save_media_async(
+            url, media, save_path, crawler, http_client, counter, limit, leave_progress_bar, options
+        )
+
+
+async def save_media_async(
+    url: URL,
+    media: MediaAlbum | MediaFile,
+    save_path: Path,
+    crawler: AsyncCrawler,
+    http_client: "AsyncRequester",
+    counter: DownloadCounter,
+    limit: "asyncio.Semaphore",
+    leave_progress_bar: bool,
+    options: DownloadOptions,
+) -> None:
+    import asyncio
+
+    from simple_downloader.handlers import async_downloader
+
+    match media:
+        case MediaAlbum():
+            counter.add_album()
+            save_path = get_updated_parent_path(save_path, media.title)
+            try:
+                with counting_connections(media):
+                    async with asyncio.TaskGroup() as tasks:
+                        for file_url in expand(url, save_path, media, options):
+                            tasks.create_task(
+                                download_async(
+                                    file_url,
+                                    save_path,
+                                    crawler,
+                                    http_client,
+                                    counter,
+                                    limit,
+                                    leave_progress_bar,
+                                    options,
+                                )
+                            )
+            except* DeviceSpaceRunOutError as group:
+                raise group.exceptions[0]  # the whole process is stopped as in the sync engine
+
+        case MediaFile():
+            manifest = get_manifest(save_path)
+            if is_skipped(
+                manifest, counter, media.url, media.stream_url, local=options.storage is None
+            ):
+                return
+
+            store = get_store(options.store_path)
+            if store is not None and is_linked(store, counter, media, save_path):
+                manifest.add(media, url)
+                return
+
+            set_state(url, save_path, options, JobState.DOWNLOADING)
+            async with limit:
+                await async_downloader.download(
+                    media,
+                    save_path,
+                    http_client,
+                    leave_progress_bar=leave_progress_bar,
+                    hash_algorithm=options.hash_algorithm,
+                    storage=options.storage,
+                )
             if media.is_downloaded:
+                if store is not None:
+                    store.add(media, save_path)
+                manifest.add(media, url)
                 counter.add_success()
 
         case _ as unreachable:
             assert_never(unreachable)
 
 
-@click.command()
-@click.argument("url", type=URL)
-@click.option(
-    "--save_path",  # if the "path" contains "\s", it must be framed with quotes
-    "-p",
-    type=click.Path(exists=True, file_okay=False, path_type=Path),
-    default=get_updated_parent_path(BASE_DIR, SAVE_FOLDER_NAME),
-)
-def main(url: URL, save_path: Path) -> None:
-    logger.info("Start task %s", url)
-    click.echo(f"Task... {url}")
-    click.echo(f'Path to the saved files is "{save_path}".\n')
+def run(
+    jobs: list[Job],
+    workers: int,
+    options: DownloadOptions,
+    counter: DownloadCounter,
+    cache: ResponseCache,
+) -> None:
+    from simple_downloader.handlers import requester
 
-    counter = DownloadCounter()
+    pool = ThreadPoolExecutor(workers, "download") if workers > 1 else None
+
+    def run_jobs(jobs: list[Job], options: DownloadOptions) -> None:
+        for hosting_jobs in group_by_hosting(jobs, counter, options).values():
+            with requester.Requester(
+                options.rate_limiter,
+                pool_maxsize=options.connections or workers * options.segments,
+                cache=cache,
+                bandwidth=options.bandwidth,
+                health=options.health,
+                mirrors=options.mirrors,
+            ) as http_client:
+                crawler = factory.get_crawler(hosting_jobs[0].url, http_client)
+                for job in hosting_jobs:
+                    run_job(job, crawler, http_client, counter, pool, options)
+
+    try:
+        with reporting(counter, options.health):
+            run_jobs(jobs, options)
+            retry_deferred(run_jobs, options)
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+        close_manifests()
+        close_stores()
+        close_queues()
+        if options.storage is not None:
+            options.storage.close()
+
+
+def run_job(
+    job: Job,
+    crawler: Crawler,
+    http_client: "requester.Requester",
+    counter: DownloadCounter,
+    pool: ThreadPoolExecutor | None,
+    options: DownloadOptions,
+) -> None:
+    """Downloads the requested URL or the rest of the album restored from the job queue."""
+
+    if job.album is None:
+        download(job.url, job.save_path, crawler, http_client, counter, pool, options)
+    else:
+        resolved = Resolved(job.url, job.album)
+        download_resolved(
+            job.url, resolved, job.save_path, crawler, http_client, counter, pool, options
+        )
+
+
+def retry_deferred(
+    run_jobs: Callable[[list[Job], DownloadOptions], None], options: DownloadOptions
+) -> None:
+    """
+    Runs the deferred jobs again when the circuits of their hosts are half-open.
+
+    The jobs failed fast by the last round are failed.
+    """
+
+    for number in range(1, DEFERRED_ROUNDS + 1):
+        jobs, wait = get_deferred(options)
+        if not jobs:
+            return
+
+        sleep(wait)
+        run_jobs(jobs, options if number < DEFERRED_ROUNDS else replace(options, deferred=None))
+
+
+def get_deferred(options: DownloadOptions) -> tuple[list[Job], float]:
+    if options.deferred is None:
+        return [], 0
+
+    jobs, wait = options.deferred.take()
+    if jobs:
+        logger.info("%s deferred jobs are run again in %s seconds", len(jobs), f"{wait:.0f}")
+        echo(f"\n{INFO} {len(jobs)} deferred jobs are run again in {wait:.0f} seconds")
+    return jobs, wait
+
+
+def run_sharded(
+    jobs: list[Job],
+    processes: int,
+    shard_by: "ShardBy",
+    workers: int,
+    options: DownloadOptions,
+    counter: DownloadCounter,
+    cache_ttl: float,
+    cache_dir: Path | None,
+    trace_file: Path | None,
+) -> None:
+    """
+    Counterpart of the run() for the worker processes, each of them runs the jobs by the threads.
+
+    The counters of the workers are merged into the counter, their logs are written by this process.
+    """
+
+    from simple_downloader.sharding import WorkerSettings, run_processes, shard
+
+    settings = WorkerSettings(workers, options, cache_ttl, cache_dir, trace_file)
+    try:
+        with reporting(counter, options.health):
+            units = shard(group_by_hosting(jobs, counter, options), shard_by)
+            run_processes(units, min(processes, len(units)) or 1, settings, counter)
+    finally:
+        close_queues()
+
+
+async def run_async(
+    jobs: list[Job],
+    workers: int,
+    options: DownloadOptions,
+    counter: DownloadCounter,
+    cache: ResponseCache,
+) -> None:
+    import asyncio
+
+    from simple_downloader.handlers.async_requester import AsyncRequester
+
+    limit = asyncio.Semaphore(workers)
+
+    async def run_jobs(jobs: list[Job], options: DownloadOptions) -> None:
+        for hosting_jobs in group_by_hosting(jobs, counter, options).values():
+            async with AsyncRequester(
+                options.rate_limiter,
+                max_connections=options.connections or workers,
+                cache=cache,
+                http2=options.http2,
+                bandwidth=options.bandwidth,
+                health=options.health,
+                mirrors=options.mirrors,
+            ) as http_client:
+                crawler = factory.get_async_crawler(hosting_jobs[0].url, http_client)
+                for job in hosting_jobs:
+                    await download_async(
+                        job.url,
+                        job.save_path,
+                        crawler,
+                        http_client,
+                        counter,
+                        limit,
+                        workers == 1,
+                        options,
+                        job.album,
+                    )
+
+    try:
+        with reporting(counter, options.health):
+            await run_jobs(jobs, options)
+            for number in range(1, DEFERRED_ROUNDS + 1):  # as retry_deferred()
+                deferred, wait = get_deferred(options)
+                if not deferred:
+                    break
+
+                await asyncio.sleep(wait)
+                last = number == DEFERRED_ROUNDS
+                await run_jobs(deferred, replace(options, deferred=None) if last else options)
+    finally:
+        close_manifests()
+        close_stores()
+        close_queues()
+        if options.storage is not None:
+            options.storage.close()
+
+
+def group_by_hosting(
+    jobs: list[Job], counter: DownloadCounter, options: DownloadOptions
+) -> dict[str, list[Job]]:
+    """
+    Groups the jobs by the crawler, so one session (and its connections) is used per hosting.
+
+    Unsupported URLs are reported and counted as failed attempts.
+    """
 
-    with requester.Requester() as http_client:
+    groups: dict[str, list[Job]] = {}
+    for job in jobs:
         try:
-            crawler = factory.get_crawler(url, http_client)
+            hosting = factory.get_hosting(job.url)
         except CrawlerNotFound as e:
             logger.info(e)
-            click.echo(f"{FAILURE} Hosting is not supported: {e.url}", err=True)
+            echo(f"{FAILURE} Hosting is not supported: {e.url}", err=True)
+            counter.add_attempt()
+            set_state(job.url, job.save_path, options, JobState.FAILED, str(e))
         else:
-            try:
-                download(url, save_path, crawler, http_client, counter)
-            except DeviceSpaceRunOutError as e:
-                logger.warning(e)
-                click.echo(f"{FAILURE} Save Error: Probably not enough free space", err=True)
-                sys.exit(1)
-            finally:
-                click.echo(
-                    f"\n{INFO} Completed: "
-                    f"{counter.successes} successfully downloaded, "
-                    f"{counter.failures} failed attempts.",
-                )
+            groups.setdefault(hosting, []).append(job)
+
+    return groups
+
+
+@contextmanager
+def counting_connections(album: MediaAlbum) -> Iterator[None]:
+    """Reports how many new connections (handshakes) the album took, the rest are reused."""
+
+    connections, requests = CONNECTIONS.get_total(), REQUESTS.get_total()
+    try:
+        yield
+    finally:
+        connections, requests = (
+            int(CONNECTIONS.get_total() - connections),
+            int(REQUESTS.get_total() - requests),
+        )
+        logger.info('Album "%s": %s requests, %s connections', album.title, requests, connections)
+        echo(f'{INFO} Album "{album.title}": {requests} requests over {connections} connections')
+
+
+@contextmanager
+def reporting(counter: DownloadCounter, health: HealthTracker | None = None) -> Iterator[None]:
+    """Reports the result of the task and the hosts which failed, even if it was interrupted."""
+
+    try:
+        yield
+    except DeviceSpaceRunOutError as e:
+        logger.warning(e)
+        click.echo(f"{FAILURE} Save Error: Probably not enough free space", err=True)
+        sys.exit(1)
+    finally:
+        click.echo(
+            f"\n{INFO} Completed: "
+            f"{counter.successes} successfully downloaded, "
+            f"{counter.skips} already downloaded, "
+            f"{counter.links} taken from the store, "
+            f"{counter.failures} failed attempts.",
+        )
+        if counter.queued:
+            click.echo(
+                f"{INFO} {counter.queued} files do not fit on the disk, they are queued: "
+                'free the space and run "resume".',
+            )
+        for report in health.get_report() if health is not None else []:
+            if not report.failures:
+                continue
+
+            logger.info("Health of %s: %s", report.host, report)
+            click.echo(
+                f'{INFO} Host "{report.host}": {report.failures} of {report.requests} requests '
+                f"failed ({report.error_rate:.0%} of the last ones), circuit is {report.state}"
+                + (f" (opened {report.trips} times)" if report.trips else ""),
+            )
+
+
+class DefaultGroup(click.Group):
+    """
+    The group of commands with the default one.
+
+    If the first argument is not a command (e.g. it is the URL), the default command is run,
+    so "simple_downloader URL" is the same as "simple_downloader download URL".
+    """
+
+    def __init__(self, *args: Any, default: str, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.default = default
+
+    def parse_args(self, ctx: click.Context, args: list[str]) -> list[str]:
+        if not args or (args[0] not in self.commands and args[0] not in ctx.help_option_names):
+            args = [self.default, *args]
+        return super().parse_args(ctx, args)
+
+
+def validate_mirrors(
+    ctx: click.Context, param: click.Parameter, domains: tuple[str, ...]
+) -> tuple[str, ...]:
+    for domain in domains:
+        try:
+            factory.get_hosting(URL.build(scheme="https", host=domain))
+        except (CrawlerNotFound, ValueError):
+            raise click.BadParameter(f'"{domain}" is not a domain of the supported hostings')
+
+    return domains
+
+
+def validate_storage(ctx: click.Context, param: click.Parameter, url: URL | None) -> URL | None:
+    if url is None:
+        return None
+
+    package = factory.STORAGE_PACKAGES.get(url.scheme)
+    if package is None:
+        raise click.BadParameter(
+            f'"{url}" is not a supported storage ({", ".join(factory.STORAGES)})'
+        )
+    if find_spec(package) is None:
+        raise click.BadParameter(
+            f"{url.scheme} storage requires {package} (the poetry extra '{url.scheme}')"
+        )
+    if not url.host:
+        raise click.BadParameter(f'"{url}" has no host (the bucket or the server)')
+
+    return url
+
+
+TASK_OPTIONS = {
+    "save_path": click.option(
+        "--save_path",  # if the "path" contains "\s", it must be framed with quotes
+        "-p",
+        type=click.Path(exists=True, file_okay=False, path_type=Path),
+        default=get_updated_parent_path(BASE_DIR, SAVE_FOLDER_NAME),
+    ),
+    "workers": click.option(
+        "--workers",
+        "-w",
+        type=click.IntRange(min=1),
+        default=DEFAULT_WORKERS,
+        help="Number of album files processed at the same time.",
+    ),
+    "engine": click.option(
+        "--engine",
+        "-e",
+        type=click.Choice(["sync", "async"]),
+        default=DEFAULT_ENGINE,
+        help="The async engine requires httpx (the poetry extra 'async').",
+    ),
+    "processes": click.option(
+        "--processes",
+        type=click.IntRange(min=1),
+        default=DEFAULT_PROCESSES,
+        help="Worker processes the URLs are sharded across (the sync engine only).",
+    ),
+    "shard_by": click.option(
+        "--shard-by",
+        type=click.Choice(["album", "host"]),
+        default="album",
+        help="Unit of the work of a process: every URL or all the URLs of a hosting.",
+    ),
+    "segments": click.option(
+        "--segments",
+        "-s",
+        type=click.IntRange(min=1),
+        default=DEFAULT_SEGMENTS,
+        help="Number of connections per large file (the sync engine only).",
+    ),
+    "cache_dir": click.option(
+        "--cache-dir",
+        type=click.Path(file_okay=False, path_type=Path),
+        default=None,
+        help="Keep the pages and API responses on the disk between runs.",
+    ),
+    "cache_ttl": click.option(
+        "--cache-ttl",
+        type=click.FloatRange(min=0),
+        default=CACHE_TTL,
+        help="Seconds for which a response is used without revalidation.",
+    ),
+    "hash_algorithm": click.option(
+        "--hash",
+        "hash_algorithm",
+        type=click.Choice(get_algorithms()),
+        default=HASH_ALGORITHM,
+        help="Checksum of the files (xxh3 requires xxhash, the poetry extra 'xxhash').",
+    ),
+    "store_path": click.option(
+        "--store",
+        "store_path",
+        type=click.Path(dir_okay=False, path_type=Path),
+        default=None,
+        help=f"Index of the downloaded files shared by albums (default: {STORE_NAME} in the save path).",
+    ),
+    "dedupe": click.option(
+        "--dedupe/--no-dedupe",
+        default=True,
+        help="Hardlink the files downloaded into another album instead of downloading them again.",
+    ),
+    "metrics_file": click.option(
+        "--metrics-file",
+        type=click.Path(dir_okay=False, path_type=Path),
+        default=None,
+        help="Write the request and download metrics to the file while the task runs.",
+    ),
+    "metrics_format": click.option(
+        "--metrics-format",
+        type=click.Choice(["prometheus", "jsonl"]),
+        default="prometheus",
+        help="Prometheus text (for the textfile collector) or JSON lines appended periodically.",
+    ),
+    "trace_file": click.option(
+        "--trace-file",
+        type=click.Path(dir_okay=False, path_type=Path),
+        default=None,
+        help="Append the timing spans of every file (crawl, resolve, connect, transfer, fsync).",
+    ),
+    "connections": click.option(
+        "--connections",
+        type=click.IntRange(min=1),
+        default=None,
+        help="Connections kept open per host (by default workers * segments).",
+    ),
+    "limit_rate": click.option(
+        "--limit-rate",
+        type=parse_rate,
+        default=None,
+        help='Bandwidth of all the downloads, e.g. "10M" (MiB/s) or "300Mbit".',
+    ),
+    "limit_rate_per_host": click.option(
+        "--limit-rate-per-host",
+        type=parse_rate,
+        default=None,
+        help="Bandwidth of the downloads from one host (the same units).",
+    ),
+    "mirrors": click.option(
+        "--mirror",
+        "mirrors",
+        multiple=True,
+        callback=validate_mirrors,
+        help="One more domain of the hosting, e.g. 'bunkr.fi' (the fastest domain is used).",
+    ),
+    "storage": click.option(
+        "--storage",
+        type=URL,
+        default=None,
+        callback=validate_storage,
+        help="Upload the files while they are downloaded: 's3://bucket/prefix' or "
+        "'sftp://user@host/path' (the save path keeps the manifests and the job queue).",
+    ),
+    "http2": click.option(
+        "--http2",
+        is_flag=True,
+        help="Multiplex the requests over one connection (the async engine, the poetry extra 'http2').",
+    ),
+}
+
+
+def task_options(*names: str) -> Callable[[Callable[..., None]], Callable[..., None]]:
+    """The options of the commands which download the media (all of them by default)."""
+
+    def decorator(command: Callable[..., None]) -> Callable[..., None]:
+        for name in reversed(names or tuple(TASK_OPTIONS)):
+            command = TASK_OPTIONS[name](command)
+        return command
+
+    return decorator
+
+
+@click.group(cls=DefaultGroup, default="download")
+def main() -> None:
+    """Downloads the media from the file hostings ("download" is the default command)."""
+
+
+@main.command("download")
+@click.argument("url", type=URL, required=False)
+@click.option(
+    "--input-file",
+    "-i",
+    type=click.File("r", encoding="utf-8"),
+    default=None,
+    help="File with URLs, one per line ('-' to read them from stdin).",
+)
+@task_options()
+def download_command(
+    url: URL | None, input_file: TextIO | None, save_path: Path, **settings: Any
+) -> None:
+    """Downloads the media by the URL or by the URLs from the file."""
+
+    if url is None and input_file is None:
+        raise click.UsageError("Pass the URL or the file with URLs (--input-file).")
+
+    urls = [url] if url is not None else []
+    if input_file is not None:
+        urls.extend(read_urls(input_file))
+    urls = list(dict.fromkeys(urls))  # the same URL is downloaded once
+
+    task = urls[0] if len(urls) == 1 else f"{len(urls)} URLs"
+    logger.info("Start task %s", task)
+    click.echo(f"Task... {task}")
+    run_task([Job(url, save_path) for url in urls], save_path, **settings)
+
+
+@main.command("resume")
+@task_options()
+def resume_command(save_path: Path, **settings: Any) -> None:
+    """Continues the interrupted task by the job queue of the save path."""
+
+    jobs_path = save_path.joinpath(JOBS_NAME)
+    if not jobs_path.exists():
+        raise click.UsageError(f'There is no task to resume in "{save_path}".')
+
+    queue = get_queue(jobs_path)
+    jobs = queue.get_jobs() if queue is not None else []
+    if not jobs:
+        close_queues()
+        click.echo(f"{INFO} All jobs are done, there is nothing to resume.")
+        return
+
+    logger.info("Resume %s jobs", len(jobs))
+    click.echo(f"Resume... {len(jobs)} jobs")
+    run_task(jobs, save_path, **settings)
+
+
+@main.command("serve")
+@click.option(
+    "--socket",
+    "socket_path",
+    type=click.Path(dir_okay=False, path_type=Path),
+    default=None,
+    help="Listen on the Unix socket instead of the TCP port.",
+)
+@click.option("--host", default=SERVICE_HOST, help="Address of the API (it has no authentication).")
+@click.option("--port", type=click.IntRange(min=0, max=65535), default=SERVICE_PORT)
+@click.option(
+    "--per-host",
+    type=click.IntRange(min=1),
+    default=None,
+    help="Files downloaded from one hosting at the same time (by default all the workers).",
+)
+@task_options(
+    "save_path",
+    "workers",
+    "segments",
+    "cache_dir",
+    "cache_ttl",
+    "hash_algorithm",
+    "store_path",
+    "dedupe",
+    "metrics_file",
+    "metrics_format",
+    "trace_file",
+    "connections",
+    "limit_rate",
+    "limit_rate_per_host",
+    "mirrors",
+    "storage",
+)
+def serve_command(
+    socket_path: Path | None,
+    host: str,
+    port: int,
+    per_host: int | None,
+    save_path: Path,
+    workers: int,
+    segments: int,
+    cache_dir: Path | None,
+    cache_ttl: float,
+    hash_algorithm: str,
+    store_path: Path | None,
+    dedupe: bool,
+    metrics_file: Path | None,
+    metrics_format: Format,
+    trace_file: Path | None,
+    connections: int | None,
+    limit_rate: float | None,
+    limit_rate_per_host: float | None,
+    mirrors: tuple[str, ...],
+    storage: URL | None,
+) -> None:
+    """
+    Runs the service which takes the tasks by the HTTP API.
+
+    The sessions, crawlers and caches are kept between the tasks. The workers are the budget
+    shared by all the tasks: the files downloaded at the same time in total.
+    """
+
+    from simple_downloader.service import Service, ServiceServer, UnixServiceServer
+
+    options = get_options(
+        save_path,
+        segments,
+        hash_algorithm,
+        store_path,
+        dedupe,
+        connections,
+        limit_rate,
+        limit_rate_per_host,
+        mirrors=mirrors,
+        storage=storage,
+    )
+    options = replace(
+        options,
+        limiter=ConcurrencyLimiter(workers, per_host),
+        bandwidth=options.bandwidth or BandwidthLimiter(),  # the limits can be set by the API later
+    )
+    cache = ResponseCache(cache_ttl, directory=cache_dir)
+
+    with observing(cache, metrics_file, metrics_format, trace_file):
+        service = Service(download, save_path, options, workers, cache)
+        if socket_path is not None:
+            server: ServiceServer | UnixServiceServer = UnixServiceServer(socket_path, service)
+            address = str(socket_path)
+        else:
+            server = ServiceServer((host, port), service)
+            address = f"http://{host}:{server.server_port}"
+        logger.info("Service is listening on %s", address)
+        click.echo(f'Service is listening on {address}, path to the saved files is "{save_path}".')
+
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            click.echo(
+                f"\n{INFO} Stopping... the running tasks are finished, the queued ones are left"
+            )
+        finally:
+            server.server_close()
+            service.close()
+            close_manifests()
+            close_stores()
+            close_queues()
+            if options.storage is not None:
+                options.storage.close()
+
+
+def run_task(
+    jobs: list[Job],
+    save_path: Path,
+    workers: int,
+    engine: Literal["sync", "async"],
+    processes: int,
+    shard_by: "ShardBy",
+    segments: int,
+    cache_dir: Path | None,
+    cache_ttl: float,
+    hash_algorithm: str,
+    store_path: Path | None,
+    dedupe: bool,
+    metrics_file: Path | None,
+    metrics_format: Format,
+    trace_file: Path | None,
+    connections: int | None,
+    limit_rate: float | None,
+    limit_rate_per_host: float | None,
+    mirrors: tuple[str, ...],
+    storage: URL | None,
+    http2: bool,
+) -> None:
+    """
+    Runs the jobs by the engine.
+
+    The jobs are recorded to the queue of the save path, so the task can be resumed after a crash.
+    """
+
+    if http2 and engine != "async":
+        raise click.UsageError("HTTP/2 is supported by the async engine only (--engine async).")
+    if http2 and find_spec("h2") is None:
+        raise click.UsageError("HTTP/2 requires h2 (the poetry extra 'http2').")
+    if processes > 1 and engine != "sync":
+        raise click.UsageError("Worker processes run the sync engine only (--engine sync).")
+    if processes > 1 and metrics_file is not None:
+        raise click.UsageError("Metrics are exported by a single process (without --processes).")
+
+    click.echo(f'Path to the saved files is "{save_path}".\n')
+    if storage is not None:
+        click.echo(f'Files are uploaded to "{storage.with_password(None)}".\n')
+
+    counter = DownloadCounter()
+    options = get_options(
+        save_path,
+        segments,
+        hash_algorithm,
+        store_path,
+        dedupe,
+        connections,
+        limit_rate,
+        limit_rate_per_host,
+        http2,
+        mirrors,
+        storage,
+    )
+    options = replace(options, deferred=DeferredJobs())  # the service does not defer the jobs
+    queue = get_queue(options.jobs_path)
+    if queue is not None:
+        queue.add(job for job in jobs if job.album is None)  # the albums are already expanded
+    if processes > 1:
+        run_sharded(
+            jobs,
+            processes,
+            shard_by,
+            workers,
+            options,
+            counter,
+            cache_ttl,
+            cache_dir,
+            trace_file,
+        )
+        return
+
+    cache = ResponseCache(cache_ttl, directory=cache_dir)
+
+    with observing(cache, metrics_file, metrics_format, trace_file):
+        match engine:
+            case "sync":
+                run(jobs, workers, options, counter, cache)
+            case "async":
+                import asyncio
+
+                asyncio.run(run_async(jobs, workers, options, counter, cache))
+            case _ as unreachable:
+                assert_never(unreachable)
+
+
+def get_options(
+    save_path: Path,
+    segments: int,
+    hash_algorithm: str,
+    store_path: Path | None,
+    dedupe: bool,
+    connections: int | None,
+    limit_rate: float | None = None,
+    limit_rate_per_host: float | None = None,
+    http2: bool = False,
+    mirrors: tuple[str, ...] = (),
+    storage: URL | None = None,
+) -> DownloadOptions:
+    """The options of the task, the files in the remote storage are not deduplicated (linked)."""
+
+    dedupe = dedupe and storage is None
+    if dedupe:
+        store_path = (store_path or save_path.joinpath(STORE_NAME)).absolute()
+
+    return DownloadOptions(
+        segments,
+        hash_algorithm,
+        store_path if dedupe else None,
+        connections,
+        http2,
+        save_path.joinpath(JOBS_NAME),
+        bandwidth=(
+            BandwidthLimiter(limit_rate, limit_rate_per_host)
+            if limit_rate is not None or limit_rate_per_host is not None
+            else None
+        ),
+        health=HealthTracker(),
+        mirrors=Mirrors(get_mirror_domains(mirrors)),
+        storage=factory.get_storage(storage, save_path) if storage is not None else None,
+    )
+
+
+def get_mirror_domains(extra: tuple[str, ...]) -> dict[str, list[str]]:
+    """The mirrors of the config with the domains passed by --mirror."""
+
+    domains = {hosting: list(hosting_domains) for hosting, hosting_domains in MIRRORS.items()}
+    for domain in extra:
+        domains.setdefault(factory.get_hosting(URL.build(scheme="https", host=domain)), []).append(
+            domain
+        )
+
+    return domains
+
+
+@contextmanager
+def observing(
+    cache: ResponseCache,
+    metrics_file: Path | None,
+    metrics_format: Format,
+    trace_file: Path | None,
+) -> Iterator[None]:
+    """Exports the metrics and the spans while the task (or the service) runs, then closes the cache."""
+
+    with ExitStack() as stack:
+        stack.callback(cache.close)
+        if metrics_file is not None:
+            stack.enter_context(MetricsExporter(metrics_file, metrics_format))
+        if trace_file is not None:
+            start_tracing(trace_file)
+            stack.callback(stop_tracing)
+
+        yield
 
 
 if __name__ == "__main__":
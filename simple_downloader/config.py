@@ -1,26 +1,94 @@
+import os
 from pathlib import Path
 
 
 BASE_DIR = Path(__file__).resolve().parent.parent
+USER_CACHE_DIR = Path(os.environ.get("XDG_CACHE_HOME") or Path.home().joinpath(".cache")).joinpath(
+    "simple-downloader"
+)  # the files kept between the runs (not the downloads)
 
 LEAVE_PROGRESS_BAR: bool = True
 
 SAVE_FOLDER_NAME = "saves"
+MANIFEST_NAME = ".manifest.sqlite3"  # list of downloaded files, it is kept in each save folder
+STORE_NAME = ".store.sqlite3"  # index of all downloaded files, it is kept in the save path
+JOBS_NAME = ".jobs.sqlite3"  # state of the requested URLs and album files, kept in the save path
+JOBS_FLUSH_INTERVAL: float = 1  # seconds between the writes of the job states
+JOBS_BATCH_SIZE: int = 500  # job states written by one transaction at most
 SUCCESS = "[+]"
 INFO = "[!]"
 FAILURE = "[-]"
 UNKNOWN = "[?]"
 
-DEFAULT_DELAY: float | tuple[float, float] | None = (1.1, 3.1)
+RATE_LIMIT = {
+    "rate": 0.5,
+    "burst": 5,
+    "min_rate": 0.05,
+    "max_rate": 5,
+}  # requests per second (host)
+RATE_RECOVERY = 20  # successful requests in a row after which the rate of the host is increased
+CACHE_TTL: float = 600  # seconds, unless the response has "Cache-Control: max-age" shorter
+CACHE_SIZE = 128  # responses kept in memory
+CACHE_NAME = "responses.sqlite3"  # on-disk store in the cache directory
+POOL_CONNECTIONS: int = 32  # hosts (e.g. CDN shards) whose idle connections are kept open at once
+KEEPALIVE_EXPIRY: float = 30  # seconds an idle connection is kept open (the async engine)
 TIMEOUT: float | tuple[float, float] | None = (3.03, 42)  # connect and read timeout
+USER_AGENTS_PATH = USER_CACHE_DIR.joinpath("user_agents.json")  # the pool of browser user agents
+USER_AGENTS_SIZE: int = 50  # user agents sampled into the pool
+USER_AGENTS_TTL: float = 7 * 24 * 3600  # seconds, then the pool is sampled again
 MAX_REDIRECTS = 3
 TOTAL_RETRIES = 5
 RETRY_STRATEGY = {"multiplier": 10, "min": 10, "max": 160}  # (2 ^ attempt - 1) * mult
+CIRCUIT_THRESHOLD: int = 3  # failed requests in a row after which the host fails fast
+CIRCUIT_COOLDOWN: float = 30  # seconds the host fails fast, then one request probes it
+CIRCUIT_MAX_COOLDOWN: float = 600  # the cooldown is doubled by every failed probe up to it
+HEALTH_WINDOW: int = 50  # last requests of the host its error rate is computed by
+DEFERRED_ROUNDS: int = 3  # runs of the jobs deferred because their host failed fast
+MIRRORS = {
+    "bunkr": (
+        "bunkr.si",
+        "bunkr.la",
+        "bunkr.black",
+        "bunkr.su",
+        "bunkr.ru",
+        "bunkr.ph",
+        "bunkr.ws",
+    ),
+}  # interchangeable domains of the hostings (with their CDN subdomains), see --mirror
+MIRRORS_PROBE_TTL: float = 600  # seconds, then the latencies of the mirrors are probed again
+MIRRORS_PROBE_TIMEOUT: float = 5  # seconds the mirror has to respond to the probe
+MIRRORS_SMOOTHING: float = 0.3  # weight of the last response time in the latency of the host
+
+METRICS_INTERVAL: float = 15  # seconds between the writes of the metrics file
+
+SERVICE_HOST = "127.0.0.1"  # the API of the service is local, it has no authentication
+SERVICE_PORT: int = 8765
+SERVICE_KEEPALIVE: float = 15  # seconds between the comments of an idle event stream
+SERVICE_TASKS_KEPT: int = 1000  # finished tasks reported by the API, older ones are forgotten
+
+DEFAULT_WORKERS: int = 1  # files of an album processed at the same time
+PIPELINE_SIZE: int = 8  # resolved files of an album waiting for the download
+DEFAULT_ENGINE = "sync"  # "async" requires httpx
+DEFAULT_PROCESSES: int = 1  # worker processes the URLs are sharded across
+SHARDING_POLL_INTERVAL: float = 0.5  # seconds between the checks of the worker processes
 
 DEFAULT_ALBUM_NAME = "unknown album"
+HTML_FEED_SIZE: int = 16 * 1024  # characters of a page parsed at once until the elements are found
 
 BASE_CHUNK: int = 1024
-DEFAULT_CHUNK_MULTIPLIER: int = 8
+DEFAULT_SEGMENTS: int = 1  # byte ranges of a file downloaded at the same time (1 - one stream)
+SEGMENT_MIN_SIZE: int = 16 * BASE_CHUNK**2  # smaller files are not split
+DEFAULT_CHUNK_MULTIPLIER: int = 8  # initial chunk size, it grows with the throughput
+MAX_CHUNK_SIZE: int = 4 * BASE_CHUNK**2  # the read buffer of each stream
+WRITE_BUFFER_SIZE: int = 4 * BASE_CHUNK**2  # the chunks written by one call of a thread (async)
+CHUNK_READ_TIME: float = 0.1  # seconds, the chunk size is adapted to fill it about this time
+BANDWIDTH_BURST: float = 0.5  # seconds of the bandwidth limit received at once after a pause
+DISK_SPACE_MARGIN: int = 64 * BASE_CHUNK**2  # left free on the disk (manifests, job queue, logs)
+S3_PART_SIZE: int = 8 * BASE_CHUNK**2  # each part of the multipart upload (5 MiB at least)
+S3_MAX_PARTS: int = 10_000  # parts of one upload at most, larger files are cut into larger parts
+S3_UPLOAD_THREADS: int = 8  # parts of all the files uploaded at the same time
+S3_PARTS_IN_FLIGHT: int = 3  # parts of one file kept in memory while they wait or are uploaded
+HASH_ALGORITHM = "sha256"  # checksum of the received content, also "blake2b" and "xxh3_128"
 BAR_FORMAT = f"{SUCCESS} " + "{desc} {percentage:3.0f}% [{bar:20}] {n_fmt}/{total_fmt} | {rate_fmt}"
 
 SUPPORTED_EXTENSIONS = frozenset(
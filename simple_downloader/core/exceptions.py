@@ -1,7 +1,5 @@
 from pathlib import Path
-from typing import Any
 
-from requests import HTTPError
 from yarl import URL
 
 
@@ -12,18 +10,6 @@ class DownloadError(Exception):
         super().__init__(message)
 
 
-class CustomHTTPError(HTTPError):
-    """
-    Exception wrapper for HTTPError.
-
-    The error occurs if the request fails and the response status code
-    is included in the list of codes for which retry applies.
-    """
-
-    def __init__(self, *args: Any, **kwargs: Any) -> None:
-        super().__init__(*args, **kwargs)
-
-
 class CrawlerNotFound(DownloadError):
     """The error occurs if the crawler was not found for the host."""
 
@@ -79,6 +65,72 @@ class DeviceSpaceRunOutError(DownloadError):
         super().__init__("No space left on device")
 
 
+class NotEnoughSpaceError(DownloadError):
+    """The error occurs if the file does not fit on the disk, it is checked before the download."""
+
+    def __init__(self, title: str, size: int, free: int) -> None:
+        self.title = title
+        self.size = size
+        self.free = free
+        super().__init__(
+            f'File "{title}" does not fit on the disk: {size} bytes are needed, {free} are free'
+        )
+
+
+class StorageError(DownloadError):
+    """The error occurs if the file cannot be saved to the remote storage."""
+
+    def __init__(self, key: str, error: str) -> None:
+        self.key = key
+        self.error = error
+        super().__init__(f'Unable to save "{key}" to the storage: {error}')
+
+
+class WorkerError(DownloadError):
+    """The error occurs if a worker process was stopped by an unexpected error."""
+
+    def __init__(self, error: str) -> None:
+        self.error = error
+        super().__init__(f"Worker process failed: {error}")
+
+
+class CircuitOpenError(DownloadError):
+    """The error occurs if the host failed many requests in a row, its requests fail fast for a while."""
+
+    def __init__(self, host: str, retry_in: float) -> None:
+        self.host = host
+        self.retry_in = retry_in
+        super().__init__(
+            f'Host "{host}" is unavailable, it is probed again in {retry_in:.0f} seconds'
+        )
+
+
+class PartialContentError(DownloadError):
+    """The error occurs if the server returned a range that does not continue the partial file."""
+
+    def __init__(self, content_range: str | None) -> None:
+        self.content_range = content_range
+        super().__init__(f'Unexpected "content-range" of the partial content: {self.content_range}')
+
+
+class SegmentError(DownloadError):
+    """The error occurs if not all segments of the file were received."""
+
+    def __init__(self, title: str) -> None:
+        self.title = title
+        super().__init__(f'Not all segments of "{self.title}" were received')
+
+
+class IntegrityError(DownloadError):
+    """The error occurs if the received file does not match the size or checksum from the host."""
+
+    def __init__(self, title: str, expected: str | int, received: str | int) -> None:
+        self.title = title
+        self.expected = expected
+        self.received = received
+        super().__init__(f'File "{self.title}" is broken: expected {expected}, received {received}')
+
+
 # ------------------------------
 
 
@@ -0,0 +1,221 @@
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from enum import StrEnum
+from itertools import groupby
+from logging import getLogger
+from pathlib import Path
+import sqlite3
+from threading import Event, Lock, Thread
+from typing import Iterable
+
+from yarl import URL
+
+from simple_downloader.config import JOBS_BATCH_SIZE, JOBS_FLUSH_INTERVAL
+from simple_downloader.core.models import MediaAlbum
+
+
+logger = getLogger(__name__)
+
+SCHEMA = """
+PRAGMA journal_mode = WAL;
+PRAGMA synchronous = NORMAL;
+CREATE TABLE IF NOT EXISTS jobs (
+    url TEXT NOT NULL,
+    save_path TEXT NOT NULL,
+    album TEXT,
+    state TEXT NOT NULL,
+    reason TEXT,
+    updated_at TEXT NOT NULL,
+    UNIQUE (url, save_path)
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state);
+"""
+
+_queues: dict[Path, "JobQueue"] = {}
+_queues_lock = Lock()
+
+
+class JobState(StrEnum):
+    PENDING = "pending"
+    RESOLVING = "resolving"
+    EXPANDED = "expanded"  # the files of the album are recorded
+    DOWNLOADING = "downloading"
+    DEFERRED = "deferred"  # the host failed fast, the job is run again later
+    QUEUED = "queued"  # the file does not fit on the disk, it is downloaded by the resume
+    DONE = "done"
+    FAILED = "failed"
+
+
+@dataclass(frozen=True, slots=True)
+class Job:
+    url: URL
+    save_path: Path
+    album: MediaAlbum | None = None  # the rest of the album expanded before the restart
+
+
+class JobQueue:
+    """
+    The state of every requested URL and every file of the expanded albums.
+
+    The albums are expanded into the queue before their files are downloaded, so after a crash
+    the rest of the files is downloaded without parsing the album again. The states are buffered
+    and written by one transaction per batch in the background. An update lost by the crash
+    leaves the file in its previous state, so it is checked again on resume (and skipped by the
+    manifest if it is complete).
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        flush_interval: float = JOBS_FLUSH_INTERVAL,
+        batch_size: int = JOBS_BATCH_SIZE,
+    ) -> None:
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.executescript(SCHEMA)
+        self._connection_lock = Lock()
+
+        self._updates: dict[tuple[str, str], tuple[str, str | None, str]] = {}
+        self._updates_lock = Lock()
+        self._flushing = Event()
+        self._stopped = Event()
+        self._writer = Thread(target=self._write, name="jobs", daemon=True)
+        self._writer.start()
+
+    def add(self, jobs: Iterable[Job]) -> None:
+        """Records the requested URLs, the URL requested again is pending again."""
+
+        now = _now()
+        rows = [(str(job.url), str(job.save_path), JobState.PENDING, now) for job in jobs]
+        with self._updates_lock:  # the buffered state of the previous request would overwrite it
+            for url, save_path, *_ in rows:
+                self._updates.pop((url, save_path), None)
+
+        with self._connection_lock, self._connection:
+            self._connection.executemany(
+                "INSERT INTO jobs (url, save_path, state, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (url, save_path) DO UPDATE SET "
+                "state = excluded.state, reason = NULL, updated_at = excluded.updated_at",
+                rows,
+            )
+
+    def expand(self, album_url: URL, save_path: Path, file_urls: list[URL]) -> None:
+        """Records the files of the album (at once, so they are not lost by a crash)."""
+
+        with self._updates_lock:  # the buffered state of the album would overwrite "expanded"
+            self._updates = {
+                key: value for key, value in self._updates.items() if key[0] != str(album_url)
+            }
+
+        now = _now()
+        rows = [
+            (str(url), str(save_path), str(album_url), JobState.PENDING, now) for url in file_urls
+        ]
+        with self._connection_lock, self._connection:
+            self._connection.executemany(
+                "INSERT OR IGNORE INTO jobs (url, save_path, album, state, updated_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._connection.execute(
+                "UPDATE jobs SET state = ?, updated_at = ? WHERE url = ? AND album IS NULL",
+                (JobState.EXPANDED, now, str(album_url)),
+            )
+
+    def update(self, url: URL, save_path: Path, state: JobState, reason: str | None = None) -> None:
+        with self._updates_lock:
+            self._updates[(str(url), str(save_path))] = (state, reason, _now())
+            if len(self._updates) >= self.batch_size:
+                self._flushing.set()
+
+    def get_jobs(self) -> list[Job]:
+        """
+        Returns the unfinished jobs: the requested URLs and the rest of the expanded albums.
+
+        The album is restored from the queue, its folder is the save path of its files.
+        """
+
+        self.flush()
+        with self._connection_lock:
+            requested = self._connection.execute(
+                "SELECT url, save_path FROM jobs "
+                "WHERE album IS NULL AND state NOT IN (?, ?) ORDER BY rowid",
+                (JobState.DONE, JobState.EXPANDED),
+            ).fetchall()
+            files = self._connection.execute(
+                "SELECT files.album, files.save_path, files.url FROM jobs AS files "
+                "JOIN jobs AS albums ON albums.url = files.album AND albums.album IS NULL "
+                "WHERE files.state != ? AND albums.state IN (?, ?) "
+                "ORDER BY files.album, files.save_path, files.rowid",
+                (JobState.DONE, JobState.DONE, JobState.EXPANDED),
+            ).fetchall()
+
+        jobs = [Job(URL(url), Path(save_path)) for url, save_path in requested]
+        for (album_url, save_path), rows in groupby(files, key=lambda row: row[:2]):
+            album_path = Path(save_path)
+            album = MediaAlbum(album_path.name, URL(album_url), iter([URL(r[2]) for r in rows]))
+            jobs.append(Job(album.url, album_path.parent, album))
+
+        return jobs
+
+    def flush(self) -> None:
+        with self._updates_lock:
+            updates, self._updates = self._updates, {}
+
+        if not updates:
+            return
+
+        rows = [
+            (state, reason, updated_at, url, save_path)
+            for (url, save_path), (state, reason, updated_at) in updates.items()
+        ]
+        with self._connection_lock, self._connection:
+            self._connection.executemany(
+                "UPDATE jobs SET state = ?, reason = ?, updated_at = ? "
+                "WHERE url = ? AND save_path = ?",
+                rows,
+            )
+        logger.debug("%s job states are written", len(rows))
+
+    def close(self) -> None:
+        self._stopped.set()
+        self._flushing.set()
+        self._writer.join()
+        self.flush()
+        with self._connection_lock:
+            self._connection.close()
+
+    def _write(self) -> None:
+        while not self._stopped.is_set():
+            self._flushing.wait(self.flush_interval)
+            self._flushing.clear()
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                logger.warning("Job states are not written to %s: %s", self.path, e)
+
+
+def get_queue(path: Path | None) -> JobQueue | None:
+    if path is None:
+        return None
+
+    with _queues_lock:
+        queue = _queues.get(path)
+        if queue is None:
+            queue = _queues[path] = JobQueue(path)
+
+        return queue
+
+
+def close_queues() -> None:
+    with _queues_lock:
+        for queue in _queues.values():
+            queue.close()
+        _queues.clear()
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec="seconds")
@@ -2,6 +2,7 @@ from logging import getLogger
 
 from tenacity import RetryCallState
 
+from simple_downloader.core.metrics import RETRIES, get_host
 from simple_downloader.core.utils import get_url_from_args
 
 
@@ -52,7 +53,11 @@ def log_retry(retry_state: RetryCallState) -> None:
     if retry_state.outcome.failed:
         exception = retry_state.outcome.exception()
         verb, value = "raised", f"{exception.__class__.__name__}: {exception}"
+        reason = exception.__class__.__name__
     else:
         verb, value = "returned", retry_state.outcome.result()
+        reason = "result"
+
+    RETRIES.inc(host=get_host(get_url_from_args(retry_state.args)), reason=reason)
 
     logger.info("Retry in %s seconds as it %s %s", retry_state.next_action.sleep, verb, value)
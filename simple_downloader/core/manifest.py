@@ -0,0 +1,120 @@
+from datetime import datetime, timezone
+from logging import getLogger
+from pathlib import Path
+import sqlite3
+from threading import Lock
+
+from yarl import URL
+
+from simple_downloader.config import MANIFEST_NAME
+from simple_downloader.core.models import MediaFile
+
+
+logger = getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    url TEXT PRIMARY KEY,
+    filename TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    etag TEXT,
+    checksum TEXT,
+    downloaded_at TEXT NOT NULL
+)
+"""
+
+_manifests: dict[Path, "Manifest"] = {}
+_manifests_lock = Lock()
+
+
+class Manifest:
+    """
+    The list of files downloaded to the directory, it is stored in the directory itself.
+
+    Files are keyed by the URLs of the media (page, redirected page and stream URLs), so a complete
+    file is skipped before the crawler resolves it. The file is complete if it is still on the disk
+    and has the recorded size. The file of a remote storage is not checked, it is recorded only
+    after its upload is complete.
+    """
+
+    def __init__(self, directory: Path) -> None:
+        self.directory = directory
+        self.path = directory.joinpath(MANIFEST_NAME)
+        self._connection: sqlite3.Connection | None = None
+        self._lock = Lock()
+
+    def is_complete(self, url: URL | str, local: bool = True) -> bool:
+        with self._lock:
+            connection = self._connect(create=False)
+            if connection is None:
+                return False
+
+            row = connection.execute(
+                "SELECT filename, size FROM files WHERE url = ?", (str(url),)
+            ).fetchone()
+
+        if row is None:
+            return False
+
+        filename, size = row
+        if not local:
+            return True
+        try:
+            return self.directory.joinpath(filename).stat().st_size == size
+        except OSError:
+            return False
+
+    def add(self, file: MediaFile, *urls: URL | str) -> None:
+        """Records the downloaded file with the URLs by which it can be found."""
+
+        keys = {str(url) for url in (file.url, file.stream_url, *urls)}
+        downloaded_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        rows = [
+            (key, str(file.filename), file.size, file.etag, file.checksum, downloaded_at)
+            for key in keys
+        ]
+
+        with self._lock:
+            connection = self._connect(create=True)
+            if connection is None:
+                return
+
+            with connection:
+                connection.executemany(
+                    "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)", rows
+                )
+
+        logger.debug('"%s" is added to the manifest %s', file.filename, self.path)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    def _connect(self, create: bool) -> sqlite3.Connection | None:
+        if self._connection is None and (create or self.path.exists()):
+            try:
+                self._connection = sqlite3.connect(self.path, check_same_thread=False)
+                self._connection.execute(SCHEMA)
+            except sqlite3.Error as e:
+                logger.warning("Manifest %s is not available: %s", self.path, e)
+                return None
+
+        return self._connection
+
+
+def get_manifest(directory: Path) -> Manifest:
+    with _manifests_lock:
+        manifest = _manifests.get(directory)
+        if manifest is None:
+            manifest = _manifests[directory] = Manifest(directory)
+
+        return manifest
+
+
+def close_manifests() -> None:
+    with _manifests_lock:
+        for manifest in _manifests.values():
+            manifest.close()
+        _manifests.clear()
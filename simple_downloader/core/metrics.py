@@ -0,0 +1,228 @@
+from dataclasses import dataclass, field
+import json
+from logging import getLogger
+import os
+from pathlib import Path
+from threading import Event, Lock, Thread
+from time import time
+from types import TracebackType
+from typing import Literal, Self, TypeAlias
+
+from yarl import URL
+
+from simple_downloader.config import METRICS_INTERVAL
+
+
+logger = getLogger(__name__)
+
+PREFIX = "simple_downloader_"
+TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)  # seconds
+THROUGHPUT_BUCKETS = tuple(2.0**power for power in range(14, 31, 2))  # 16 KiB/s ... 1 GiB/s
+
+Labels: TypeAlias = tuple[tuple[str, str], ...]
+Sample: TypeAlias = tuple[str, Labels, float]  # name with the suffix, labels, value
+Format: TypeAlias = Literal["prometheus", "jsonl"]
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str) -> None:
+        self.name = f"{PREFIX}{name}"
+        self.documentation = documentation
+        self._values: dict[Labels, float] = {}
+        self._lock = Lock()
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = _get_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def collect(self) -> list[Sample]:
+        with self._lock:
+            return [(self.name, labels, value) for labels, value in self._values.items()]
+
+    def get_total(self) -> float:
+        with self._lock:
+            return sum(self._values.values())
+
+
+@dataclass(slots=True)
+class HistogramValue:
+    counts: list[int]  # observations in each bucket (not cumulative)
+    sum: float = 0
+    count: int = 0
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, buckets: tuple[float, ...]) -> None:
+        self.name = f"{PREFIX}{name}"
+        self.documentation = documentation
+        self.buckets = buckets
+        self._values: dict[Labels, HistogramValue] = {}
+        self._lock = Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = _get_key(labels)
+        index = next((i for i, bound in enumerate(self.buckets) if value <= bound), -1)
+        with self._lock:
+            histogram = self._values.get(key)
+            if histogram is None:
+                histogram = self._values[key] = HistogramValue([0] * (len(self.buckets) + 1))
+
+            histogram.counts[index] += 1  # the last one is "+Inf"
+            histogram.sum += value
+            histogram.count += 1
+
+    def collect(self) -> list[Sample]:
+        samples: list[Sample] = []
+        with self._lock:
+            for labels, histogram in self._values.items():
+                cumulative = 0
+                for bound, count in zip((*self.buckets, float("inf")), histogram.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else _format(bound)
+                    samples.append((f"{self.name}_bucket", (*labels, ("le", le)), cumulative))
+                samples.append((f"{self.name}_sum", labels, histogram.sum))
+                samples.append((f"{self.name}_count", labels, histogram.count))
+
+        return samples
+
+
+@dataclass(slots=True)
+class Registry:
+    metrics: list[Counter | Histogram] = field(default_factory=list)
+
+    def counter(self, name: str, documentation: str) -> Counter:
+        metric = Counter(name, documentation)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, documentation: str, buckets: tuple[float, ...]) -> Histogram:
+        metric = Histogram(name, documentation, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def render_prometheus(self) -> str:
+        """The text exposition format, e.g. for the textfile collector of the node exporter."""
+
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.collect():
+                lines.append(f"{name}{_format_labels(labels)} {_format(value)}")
+
+        return "\n".join(lines) + "\n"
+
+    def render_jsonl(self) -> str:
+        timestamp = round(time(), 3)
+        return "".join(
+            json.dumps({"time": timestamp, "name": name, "labels": dict(labels), "value": value})
+            + "\n"
+            for metric in self.metrics
+            for name, labels, value in metric.collect()
+        )
+
+    def write(self, path: Path, format: Format) -> None:
+        """The Prometheus file is replaced at once (it may be read at any moment), JSON is appended."""
+
+        try:
+            if format == "jsonl":
+                with path.open("a", encoding="utf-8") as f_out:
+                    f_out.write(self.render_jsonl())
+            else:
+                temporary = path.with_name(f"{path.name}.tmp")
+                temporary.write_text(self.render_prometheus(), encoding="utf-8")
+                os.replace(temporary, path)
+        except OSError as e:
+            logger.warning("Metrics are not written to %s: %s", path, e)
+
+
+REGISTRY = Registry()
+
+REQUESTS = REGISTRY.counter("requests_total", "HTTP requests by host and status code.")
+CONNECTIONS = REGISTRY.counter(
+    "connections_total", "New connections (TCP and TLS handshakes) by host."
+)
+RETRIES = REGISTRY.counter("retries_total", "Retried requests and downloads by host and error.")
+RECEIVED_BYTES = REGISTRY.counter("received_bytes_total", "Bytes of the files received by host.")
+TTFB = REGISTRY.histogram(
+    "ttfb_seconds", "Time from sending a request to the response headers.", TIME_BUCKETS
+)
+THROUGHPUT = REGISTRY.histogram(
+    "file_throughput_bytes_per_second", "Transfer rate of each file.", THROUGHPUT_BUCKETS
+)
+RATE_LIMIT_DELAY = REGISTRY.histogram(
+    "rate_limit_delay_seconds", "Time the requests waited for the rate limiter.", TIME_BUCKETS
+)
+THROTTLED = REGISTRY.counter(
+    "throttled_seconds_total", "Time the transfers waited for the bandwidth limiter by host."
+)
+CIRCUIT_TRIPS = REGISTRY.counter(
+    "circuit_trips_total", "Times the host failed many requests in a row and was failing fast."
+)
+
+
+class MetricsExporter:
+    """Writes the metrics to the file periodically in the background and once more at the end."""
+
+    def __init__(
+        self,
+        path: Path,
+        format: Format = "prometheus",
+        interval: float = METRICS_INTERVAL,
+        registry: Registry = REGISTRY,
+    ) -> None:
+        self.path = path
+        self.format: Format = format
+        self.interval = interval
+        self.registry = registry
+        self._stopped = Event()
+        self._thread = Thread(target=self._export, name="metrics", daemon=True)
+
+    def _export(self) -> None:
+        while not self._stopped.wait(self.interval):
+            self.registry.write(self.path, self.format)
+
+    def __enter__(self) -> Self:
+        self._thread.start()
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_val: BaseException | None,
+        exc_tb: TracebackType | None,
+    ) -> None:
+        self._stopped.set()
+        self._thread.join()
+        self.registry.write(self.path, self.format)
+        logger.debug("Metrics are written to %s", self.path)
+
+
+def get_host(url: URL | str) -> str:
+    host = url.host if isinstance(url, URL) else URL(url).host
+    return host or "unknown"
+
+
+def _get_key(labels: dict[str, str]) -> Labels:
+    return tuple(sorted(labels.items()))
+
+
+def _format(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+
+    pairs = ",".join(f'{key}="{_escape(value)}"' for key, value in labels)
+    return f"{{{pairs}}}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
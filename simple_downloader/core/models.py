@@ -1,14 +1,39 @@
 from abc import ABC, abstractmethod
-from dataclasses import dataclass
-from typing import TYPE_CHECKING, Iterator
+from dataclasses import dataclass, field
+from pathlib import Path
+from threading import Lock
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    ClassVar,
+    ContextManager,
+    Iterator,
+    Mapping,
+    Protocol,
+    TypeAlias,
+)
 
 from yarl import URL
 
-from simple_downloader.config import SUPPORTED_EXTENSIONS
+from simple_downloader.config import DEFAULT_SEGMENTS, HASH_ALGORITHM, SUPPORTED_EXTENSIONS
 from simple_downloader.core.exceptions import ExtensionNotSupported
 
 if TYPE_CHECKING:
+    from simple_downloader.core.jobs import JobState
+    from simple_downloader.handlers.async_requester import AsyncRequester
+    from simple_downloader.handlers.health import DeferredJobs, HealthTracker
+    from simple_downloader.handlers.integrity import Hasher
+    from simple_downloader.handlers.mirrors import Mirrors
+    from simple_downloader.handlers.rate_limiter import (
+        BandwidthLimiter,
+        ConcurrencyLimiter,
+        RateLimiter,
+    )
     from simple_downloader.handlers.requester import Requester
+    from simple_downloader.sharding import FileClaims
+
+Totals: TypeAlias = tuple[int, int, int, int, int, int, int]  # the counter sent by a worker process
 
 
 @dataclass(frozen=True, slots=True)
@@ -46,30 +71,112 @@ class MediaFile:
     url: URL
     stream_url: URL
     is_downloaded: bool = False
+    size: int | None = None
+    etag: str | None = None
+    checksum: str | None = None  # "{algorithm}:{hexdigest}" of the received content
+    expected_size: int | None = None  # as the host reports it
+    expected_checksum: str | None = None
+    source_id: str | None = None  # "{hosting}:{id}" of the file, the same on all mirrors
 
     def mark_downloaded(self) -> None:
         self.is_downloaded = True
 
 
+@dataclass(frozen=True, slots=True)
+class DownloadOptions:
+    """Options of the task passed down to the HTTP clients and the downloader of each file."""
+
+    segments: int = DEFAULT_SEGMENTS
+    hash_algorithm: str = HASH_ALGORITHM
+    store_path: Path | None = None  # index of the downloaded files shared by albums (deduplication)
+    connections: int | None = None  # kept open per host, by default enough for all the workers
+    http2: bool = False  # the async engine only
+    jobs_path: Path | None = None  # queue of the task, it is resumed by it after a crash
+    limiter: "ConcurrencyLimiter | None" = None  # budget of the downloads shared by the tasks
+    bandwidth: "BandwidthLimiter | None" = None  # shared by the sessions of all the hostings
+    listener: "Callable[[URL, JobState, str | None], None] | None" = None  # job state changes
+    rate_limiter: "RateLimiter | None" = None  # shared by the worker processes, see sharding
+    claims: "FileClaims | None" = None  # the files being downloaded by the worker processes
+    health: "HealthTracker | None" = None  # circuits of the hosts shared by the sessions
+    deferred: "DeferredJobs | None" = None  # the jobs failed fast by the circuits, run again later
+    mirrors: "Mirrors | None" = None  # the requests go to the fastest domain of the hosting
+    storage: "Storage | None" = None  # where the files are saved, by default the save path
+
+
 @dataclass(slots=True)
 class DownloadCounter:
     _attempts: int = 0
+    _albums: int = 0
     successes: int = 0
+    skips: int = 0
+    links: int = 0
+    deferrals: int = 0  # the attempts which are made again later
+    queued: int = 0  # the files which do not fit on the disk, they are left for the resume
+    _lock: Lock = field(default_factory=Lock, init=False, repr=False, compare=False)
 
     @property
     def attempts(self):
-        # -1 in case an album is parsed (album is counted as a file)
-        return self._attempts - 1 if self._attempts > 1 else self._attempts
+        # parsed albums are not counted, only their files (an album is counted as a file at first)
+        return self._attempts - self._albums
 
     @property
     def failures(self) -> int:
-        return self.attempts - self.successes
+        return (
+            self.attempts - self.successes - self.skips - self.links - self.deferrals - self.queued
+        )
 
     def add_attempt(self) -> None:
-        self._attempts += 1
+        with self._lock:
+            self._attempts += 1
+
+    def add_album(self) -> None:
+        with self._lock:
+            self._albums += 1
 
     def add_success(self) -> None:
-        self.successes += 1
+        with self._lock:
+            self.successes += 1
+
+    def add_skip(self) -> None:
+        with self._lock:
+            self.skips += 1
+
+    def add_link(self) -> None:
+        with self._lock:
+            self.links += 1
+
+    def add_deferral(self) -> None:
+        with self._lock:
+            self.deferrals += 1
+
+    def add_queued(self) -> None:
+        with self._lock:
+            self.queued += 1
+
+    def get_totals(self) -> Totals:
+        with self._lock:
+            return (
+                self._attempts,
+                self._albums,
+                self.successes,
+                self.skips,
+                self.links,
+                self.deferrals,
+                self.queued,
+            )
+
+    def merge(self, totals: Totals) -> None:
+        """Adds the totals of the counter of another process."""
+
+        attempts, albums, successes, skips, links, deferrals, queued = totals
+        with self._lock:
+            self._attempts += attempts
+            self._albums += albums
+            self.successes += successes
+            self.skips += skips
+            self.links += links
+            self.deferrals += deferrals
+            self.queued += queued
 
 
 @dataclass(frozen=True, slots=True)
@@ -78,3 +185,58 @@ class Crawler(ABC):
 
     @abstractmethod
     def get_media(self, url: URL) -> MediaAlbum | MediaFile: ...
+
+
+@dataclass(frozen=True, slots=True)
+class AsyncCrawler(ABC):
+    http_client: "AsyncRequester"
+
+    @abstractmethod
+    async def get_media(self, url: URL) -> MediaAlbum | MediaFile: ...
+
+
+class Writer(Protocol):
+    def write(self, data: bytes | memoryview, /) -> Any: ...
+
+
+class StoredFile(ABC):
+    """
+    The file being saved to the storage.
+
+    The download may be continued from the offset if the storage keeps the received part,
+    the file is verified and completed after the last byte, or discarded.
+    """
+
+    @property
+    @abstractmethod
+    def offset(self) -> int: ...
+
+    @abstractmethod
+    def get_range_headers(self) -> dict[str, str]: ...
+
+    @abstractmethod
+    def get_resume_offset(self, status_code: int, headers: Mapping[str, str]) -> int: ...
+
+    @abstractmethod
+    def get_hasher(self, offset: int, algorithm: str) -> "Hasher": ...
+
+    @abstractmethod
+    def writing(self, offset: int, length: int | None, title: str) -> ContextManager[Writer]: ...
+
+    @abstractmethod
+    def complete(self, file: MediaFile) -> None: ...
+
+    @abstractmethod
+    def discard(self) -> None: ...
+
+
+class Storage(ABC):
+    """Where the downloaded files are saved, the files are addressed by their local paths."""
+
+    is_local: ClassVar[bool] = False  # the files can be resumed, preallocated and linked
+
+    @abstractmethod
+    def get_file(self, path: Path) -> StoredFile: ...
+
+    def close(self) -> None:
+        """Closes the connections of the storage."""
@@ -1,9 +1,10 @@
-from re import compile
-from typing import Iterator
+from dataclasses import dataclass
+from re import IGNORECASE, compile
+from typing import TYPE_CHECKING, Callable, Iterator
 
-from bs4 import BeautifulSoup, NavigableString, Tag
 from yarl import URL
 
+from simple_downloader.config import HTML_FEED_SIZE
 from simple_downloader.core.exceptions import (
     ExtensionNotFoundError,
     FileTableNotFoundError,
@@ -14,67 +15,116 @@ from simple_downloader.core.exceptions import (
 from simple_downloader.core.models import Extension, Filename
 from simple_downloader.core.utils import decode_cloudflare_email_protection, sanitize
 
+if TYPE_CHECKING:
+    from lxml.etree import _Element as Element
+
 
 FILENAME = compile(r"(.*)(\.\w+$)")
+DOWNLOAD = compile(r"download", IGNORECASE)
+
+
+@dataclass(frozen=True, slots=True)
+class Target:
+    """An element the page is parsed until, e.g. the title of the file page."""
+
+    tag: str
+    matches: Callable[["Element"], bool] = lambda element: True
+
+
+def has_class(name: str) -> str:
+    """XPath predicate of the CSS class selector (".name")."""
+
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+
+def _is_download_hyperlink(element: "Element") -> bool:
+    if element.get("href") is None:
+        return False
+
+    string = _get_string(element)
+    return string is not None and DOWNLOAD.search(string) is not None
+
+
+TITLE = Target("h1")
+DOWNLOAD_HYPERLINK = Target("a", _is_download_hyperlink)
+
+
+def get_document(html_page: str, *targets: Target) -> "Element":
+    """
+    Parses the page into the lxml tree (the elements are not wrapped into Python objects).
 
+    With the targets the page is parsed by parts and the parsing stops once every target is
+    found, the rest of the page is not in the tree. The page without some target is parsed
+    completely.
+    """
 
-def get_soup(html_page: str, parser: str = "lxml") -> BeautifulSoup:
-    return BeautifulSoup(html_page, parser)
+    from lxml import etree  # type: ignore[reportAttributeAccessIssue] (no stubs)
 
+    if not targets or not html_page.strip():
+        document = etree.HTML(html_page)
+        return etree.Element("html") if document is None else document  # the page is empty
 
-def parse_title(soup: BeautifulSoup) -> str:
+    parser = etree.HTMLPullParser(events=("end",), tag={target.tag for target in targets})
+    remaining = list(targets)
+    for start in range(0, len(html_page), HTML_FEED_SIZE):
+        parser.feed(html_page[start : start + HTML_FEED_SIZE])
+        for _, element in parser.read_events():
+            remaining = [target for target in remaining if not _is_found(target, element)]
+            if not remaining:
+                parser.close()
+                return element.getroottree().getroot()
+
+    return parser.close()
+
+
+def parse_title(document: "Element") -> str:
     """Title parsing, considering the protection of emails from CloudFlare (sometimes used in filenames)."""
 
-    def has_cloudflare_protection(tag: Tag) -> bool:
-        return tag.select_one(".__cf_email__") is not None
-
-    def parse_title_from_h1_with_cloudflare_protection(tag: Tag) -> str:
-        match tag.next:
-            case Tag() as tag_with_protection:  # title is completely consistent with the email
-                return decode(tag_with_protection)
-            case NavigableString() as html_string:  # first is a str, and the second is encoded
-                tag_with_protection: Tag = html_string.next  # type: ignore[reportArgumentType]
-                return f"{html_string.get_text(strip=True)}{decode(tag_with_protection)}"
-            case _:
-                raise ParsingError
-
-    def decode(tag_with_protection: Tag) -> str:
-        encoded_data: str = tag_with_protection["data-cfemail"]  # type: ignore[reportAssignmentType]
+    def parse_title_from_h1_with_cloudflare_protection(tag: "Element") -> str:
+        tag_with_protection = tag[0] if len(tag) else None
+        if tag_with_protection is None or tag_with_protection.get("data-cfemail") is None:
+            raise ParsingError
+
+        # the title is completely consistent with the email or the first part is a string
+        return f"{(tag.text or '').strip()}{decode(tag_with_protection)}"
+
+    def decode(tag_with_protection: "Element") -> str:
+        encoded_data: str = tag_with_protection.get("data-cfemail")  # type: ignore[reportAssignmentType]
         return decode_cloudflare_email_protection(encoded_data)
 
-    h1_tag: Tag | None = soup.h1
+    h1_tag = next(iter(document.iter("h1")), None)
     if h1_tag is None:
         raise TitleNotFoundError
 
-    if has_cloudflare_protection(h1_tag):
+    if h1_tag.xpath(f"boolean(.//*[{has_class('__cf_email__')}])"):
         return parse_title_from_h1_with_cloudflare_protection(h1_tag)
 
-    return h1_tag.get_text(strip=True)
+    return _get_text(h1_tag)
 
 
-def parse_download_hyperlink(soup: BeautifulSoup) -> URL:
+def parse_download_hyperlink(document: "Element") -> URL:
     """Return the URL from a hyperlink named "Download"."""
 
-    tag_with_hyperlink = soup.find("a", href=True, string=compile(r"(?i)download"))
+    tag_with_hyperlink = next(filter(_is_download_hyperlink, document.iter("a")), None)
     if tag_with_hyperlink is None:
         raise HyperlinkNotFoundError("Download")
 
-    return URL(tag_with_hyperlink["href"])  # type: ignore[reportArgumentType]
+    return URL(tag_with_hyperlink.get("href"))  # type: ignore[reportArgumentType]
 
 
 def parse_file_urls(
-    soup: BeautifulSoup,
-    file_table_selector: str,
+    document: "Element",
+    file_table_path: str,
     base_url: URL | None = None,
 ) -> Iterator[URL]:
-    """Parses file URLs from the album page using selectors from SoupSieve built into BeautifulSoup."""
+    """Parses file URLs from the album page, the path is XPath of the hyperlinks."""
 
-    tags_with_file_urls = soup.select(file_table_selector)
-    if not tags_with_file_urls:
+    hyperlinks: list[str] = document.xpath(f"{file_table_path}/@href")  # type: ignore[reportAssignmentType]
+    if not hyperlinks:
         raise FileTableNotFoundError
 
-    for tag in tags_with_file_urls:
-        yield URL(tag["href"]) if base_url is None else URL(base_url.with_path(tag["href"]))  # type: ignore[reportArgumentType]
+    for href in hyperlinks:
+        yield URL(href) if base_url is None else URL(base_url.with_path(href))
 
 
 def parse_filename(name: str) -> Filename:
@@ -84,3 +134,27 @@ def parse_filename(name: str) -> Filename:
         return Filename(sanitize(stem), Extension(ext))
 
     raise ExtensionNotFoundError(name)
+
+
+def _is_found(target: Target, element: "Element") -> bool:
+    return element.tag == target.tag and target.matches(element)
+
+
+def _get_string(element: "Element") -> str | None:
+    """
+    The only string of the element, as .string of BeautifulSoup: the text of the element without
+    children or the string of its only child, otherwise None (e.g. "Download" is a part of the text).
+    """
+
+    if not len(element):
+        return element.text
+    if len(element) == 1 and not element.text and not element[0].tail:
+        return _get_string(element[0])
+
+    return None
+
+
+def _get_text(element: "Element") -> str:
+    """The stripped strings of the element joined, as get_text(strip=True) of BeautifulSoup."""
+
+    return "".join(text.strip() for text in element.xpath(".//text()"))  # type: ignore[reportGeneralTypeIssues]
@@ -0,0 +1,268 @@
+from dataclasses import dataclass
+from logging import getLogger
+import os
+from pathlib import Path
+import shutil
+import sqlite3
+import sys
+from threading import Lock
+
+from simple_downloader.core.models import MediaFile
+
+
+logger = getLogger(__name__)
+
+SCHEMA = """
+PRAGMA journal_mode = WAL;
+PRAGMA synchronous = NORMAL;
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    size INTEGER NOT NULL,
+    checksum TEXT
+);
+CREATE INDEX IF NOT EXISTS files_checksum ON files (checksum);
+CREATE TABLE IF NOT EXISTS sources (
+    source_id TEXT PRIMARY KEY,
+    file_id INTEGER NOT NULL REFERENCES files (id) ON DELETE CASCADE
+) WITHOUT ROWID;
+"""
+LINK_SUFFIX = ".link"
+FICLONE = 0x40049409  # linux/fs.h, the copy-on-write clone of the whole file (btrfs, xfs)
+
+_stores: dict[Path, "ContentStore"] = {}
+_stores_lock = Lock()
+
+
+@dataclass(frozen=True, slots=True)
+class StoreEntry:
+    """The file recorded in the store."""
+
+    path: Path
+    size: int
+    checksum: str | None
+
+
+class ContentStore:
+    """
+    The index of all downloaded files, so the same file is not downloaded into another album again.
+
+    Files are found by the ID of the file on the host (the same on all its mirrors) or by the
+    checksum reported by the host. A found file is hardlinked into the new directory, if it is not
+    possible (another device) it is reflinked or copied. Every lookup is a search by the primary key
+    or the index, so it does not slow down with the size of the store.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._connection: sqlite3.Connection | None = None
+        self._lock = Lock()
+
+    def find(self, file: MediaFile) -> StoreEntry | None:
+        queries = []
+        if file.source_id is not None:
+            queries.append(
+                (
+                    "SELECT files.id, path, size, checksum FROM sources "
+                    "JOIN files ON files.id = sources.file_id WHERE source_id = ?",
+                    file.source_id,
+                )
+            )
+        if file.expected_checksum is not None:
+            queries.append(
+                (
+                    "SELECT id, path, size, checksum FROM files WHERE checksum = ?",
+                    file.expected_checksum.lower(),
+                )
+            )
+
+        for query, key in queries:
+            with self._lock:
+                connection = self._connect()
+                if connection is None:
+                    return None
+                rows = connection.execute(query, (key,)).fetchall()
+
+            for file_id, path, size, checksum in rows:
+                stored = self._check(file_id, StoreEntry(Path(path), size, checksum))
+                if stored is not None and file.expected_size in (None, stored.size):
+                    return stored
+
+        return None
+
+    def link(self, file: MediaFile, directory: Path) -> str | None:
+        """
+        Places the stored copy of the file into the directory instead of the download.
+
+        Returns the way it was placed ("hardlink", "reflink", "copy" or "stored" if the stored file
+        is the target itself) or None if it is not found.
+        """
+
+        stored = self.find(file)
+        if stored is None:
+            return None
+
+        path = directory.joinpath(str(file.filename)).absolute()
+        method = "stored" if path == stored.path else place(stored.path, path)
+        if method is None:
+            return None
+
+        file.size = stored.size
+        file.checksum = stored.checksum
+        file.mark_downloaded()
+        self._index(file, path)
+        logger.debug('"%s" is placed from the store (%s) %s', file.filename, method, stored.path)
+        return method
+
+    def add(self, file: MediaFile, directory: Path) -> None:
+        """
+        Records the downloaded file.
+
+        If the store already has the same content under another ID, the received copy is replaced
+        by a hardlink (or a reflink) to it, so the disk keeps one copy.
+        """
+
+        path = directory.joinpath(str(file.filename)).absolute()
+        if file.checksum is not None and file.size is not None:
+            duplicate = self._find_duplicate(file.checksum, file.size, path)
+            if duplicate is not None and place(duplicate.path, path, copy=False) is not None:
+                logger.debug('"%s" is the same as %s', file.filename, duplicate.path)
+
+        self._index(file, path)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    def _index(self, file: MediaFile, path: Path) -> None:
+        with self._lock:
+            connection = self._connect()
+            if connection is None:
+                return
+
+            with connection:
+                (file_id,) = connection.execute(
+                    "INSERT INTO files (path, size, checksum) VALUES (?, ?, ?) "
+                    "ON CONFLICT (path) DO UPDATE SET size = excluded.size, "
+                    "checksum = excluded.checksum RETURNING id",
+                    (str(path), file.size, file.checksum and file.checksum.lower()),
+                ).fetchone()
+                if file.source_id is not None:
+                    connection.execute(
+                        "INSERT OR REPLACE INTO sources VALUES (?, ?)", (file.source_id, file_id)
+                    )
+
+    def _find_duplicate(self, checksum: str, size: int, path: Path) -> StoreEntry | None:
+        with self._lock:
+            connection = self._connect()
+            if connection is None:
+                return None
+            rows = connection.execute(
+                "SELECT id, path, size, checksum FROM files WHERE checksum = ? AND path != ?",
+                (checksum.lower(), str(path)),
+            ).fetchall()
+
+        for file_id, stored_path, stored_size, stored_checksum in rows:
+            if stored_size == size:
+                stored = self._check(file_id, StoreEntry(Path(stored_path), size, stored_checksum))
+                if stored is not None:
+                    return stored
+
+        return None
+
+    def _check(self, file_id: int, stored: StoreEntry) -> StoreEntry | None:
+        """The stored file may be deleted or changed by the user, then it is removed from the index."""
+
+        try:
+            if stored.path.stat().st_size == stored.size:
+                return stored
+        except OSError:
+            pass
+
+        logger.debug("%s is no longer in the store", stored.path)
+        with self._lock:
+            if self._connection is not None:
+                with self._connection:
+                    self._connection.execute("DELETE FROM files WHERE id = ?", (file_id,))
+
+        return None
+
+    def _connect(self) -> sqlite3.Connection | None:
+        if self._connection is None:
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                self._connection = sqlite3.connect(self.path, check_same_thread=False)
+                self._connection.executescript(SCHEMA)
+                self._connection.execute("PRAGMA foreign_keys = ON")
+            except (OSError, sqlite3.Error) as e:
+                logger.warning("Store %s is not available: %s", self.path, e)
+                return None
+
+        return self._connection
+
+
+def place(source: Path, target: Path, copy: bool = True) -> str | None:
+    """
+    Places the file to the target path by a hardlink, a reflink or a copy (if it is allowed).
+
+    The target is replaced at once, so it is never left half-written.
+    """
+
+    temporary = target.with_name(f"{target.name}{LINK_SUFFIX}")
+    temporary.unlink(missing_ok=True)
+    try:
+        try:
+            os.link(source, temporary)
+            method = "hardlink"
+        except OSError:
+            try:
+                _reflink(source, temporary)
+                method = "reflink"
+            except OSError:
+                if not copy:
+                    return None
+                shutil.copyfile(source, temporary)
+                method = "copy"
+
+        temporary.replace(target)
+    except OSError as e:
+        logger.debug(e)
+        temporary.unlink(missing_ok=True)
+        return None
+
+    return method
+
+
+def _reflink(source: Path, target: Path) -> None:
+    if sys.platform != "linux":
+        raise OSError("Reflinks are supported only on Linux")
+
+    import fcntl
+
+    with source.open("br") as bf_in, target.open("bw") as bf_out:
+        try:
+            fcntl.ioctl(bf_out.fileno(), FICLONE, bf_in.fileno())
+        except OSError:
+            target.unlink(missing_ok=True)
+            raise
+
+
+def get_store(path: Path | None) -> ContentStore | None:
+    if path is None:
+        return None
+
+    with _stores_lock:
+        store = _stores.get(path)
+        if store is None:
+            store = _stores[path] = ContentStore(path)
+
+        return store
+
+
+def close_stores() -> None:
+    with _stores_lock:
+        for store in _stores.values():
+            store.close()
+        _stores.clear()
@@ -0,0 +1,74 @@
+from contextlib import contextmanager
+import json
+from logging import getLogger
+from pathlib import Path
+from threading import Lock
+from time import perf_counter, time
+from typing import Any, Iterator, TextIO
+
+from yarl import URL
+
+
+logger = getLogger(__name__)
+
+_trace: TextIO | None = None
+_trace_lock = Lock()
+
+
+@contextmanager
+def span(name: str, url: URL | str, **attributes: Any) -> Iterator[None]:
+    """
+    Writes the timing of the stage of the file processing as a JSON line to the trace file.
+
+    The stages are "crawl" (the page of the requested URL), "resolve" (the file of an album),
+    "connect" (until the response headers of the stream), "transfer" and "fsync". A failed stage
+    has the name of the exception. Does nothing if the tracing is not started.
+    """
+
+    if _trace is None:
+        yield
+        return
+
+    started_at, timer = time(), perf_counter()
+    error = None
+    try:
+        yield
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        record = {
+            "span": name,
+            "url": str(url),
+            "start": round(started_at, 6),
+            "duration": round(perf_counter() - timer, 6),
+            **attributes,
+        }
+        if error is not None:
+            record["error"] = error
+        _write(record)
+
+
+def start_tracing(path: Path) -> None:
+    global _trace
+
+    with _trace_lock:
+        # each line is written at once, so the worker processes append to the same file
+        _trace = path.open("a", buffering=1, encoding="utf-8")
+    logger.debug("Spans are written to %s", path)
+
+
+def stop_tracing() -> None:
+    global _trace
+
+    with _trace_lock:
+        if _trace is not None:
+            _trace.close()
+            _trace = None
+
+
+def _write(record: dict[str, Any]) -> None:
+    line = json.dumps(record, ensure_ascii=False) + "\n"
+    with _trace_lock:
+        if _trace is not None:
+            _trace.write(line)
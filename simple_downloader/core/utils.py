@@ -1,18 +1,21 @@
 from http import HTTPStatus
 from logging import getLogger
 from pathlib import Path
-from random import uniform
-from time import sleep
+import re
+from typing import Iterable, Iterator
 
+import click
 from yarl import URL
 
-from simple_downloader.config import DEFAULT_ALBUM_NAME
+from simple_downloader.config import DEFAULT_ALBUM_NAME, FAILURE
 from simple_downloader.core.models import MediaAlbum, MediaFile
 
 
 logger = getLogger(__name__)
 
 ILLEGAL_CHARS = '/<>:"\\|?*'  # https://en.wikipedia.org/wiki/Filename#Reserved_characters_and_words
+RATE_PATTERN = re.compile(r"(\d+(?:\.\d+)?)\s*([KMG]?)(bit)?(?:/s)?", re.IGNORECASE)
+RATE_UNITS = "KMG"
 
 
 def get_updated_parent_path(parent_path: Path, parent_name: str = DEFAULT_ALBUM_NAME) -> Path:
@@ -31,17 +34,13 @@ def get_updated_parent_path(parent_path: Path, parent_name: str = DEFAULT_ALBUM_
     return updated_parent_path
 
 
-def apply_delay(delay: float | tuple[float, float] | None) -> None:
-    match delay:
-        case float():
-            sleep_time = delay
-        case tuple():
-            sleep_time = uniform(*delay)
-        case _:
-            sleep_time = 0
+def echo(message: str, err: bool = False) -> None:
+    """Prints a message to the CLI without breaking the progress bars of the running downloads."""
 
-    logger.debug("Delay %s seconds", f"{sleep_time:.2f}")
-    sleep(sleep_time)
+    from tqdm import tqdm  # the progress bars are loaded with the downloader
+
+    with tqdm.external_write_mode():
+        click.echo(message, err=err)
 
 
 def get_url_from_args(arguments: tuple) -> URL | str:
@@ -54,6 +53,46 @@ def get_url_from_args(arguments: tuple) -> URL | str:
     return "<unknown URL>"
 
 
+def read_urls(lines: Iterable[str]) -> Iterator[URL]:
+    """Reads URLs one per line, empty lines and comments ("#") are skipped."""
+
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+
+        try:
+            url = URL(line)
+        except ValueError:
+            url = None
+
+        if url is None or not url.is_absolute():
+            logger.info("Skip invalid URL %s", line)
+            echo(f"{FAILURE} Invalid URL: {line}", err=True)
+            continue
+
+        yield url
+
+
+def parse_rate(value: str) -> float:
+    """
+    Parses the bandwidth into bytes per second.
+
+    Bytes are binary ("512K", "10M" - 10 MiB/s), bits are decimal as in the network
+    ("300Mbit" - 300 * 10^6 bits per second).
+    """
+
+    match = RATE_PATTERN.fullmatch(value.strip())
+    if match is None or not float(match[1]):
+        raise ValueError(f'Invalid rate "{value}", e.g. "10M" or "300Mbit"')
+
+    number, unit, bits = float(match[1]), match[2].upper(), match[3]
+    power = RATE_UNITS.index(unit) + 1 if unit else 0
+    if bits:
+        return number * 1000**power / 8
+    return number * 1024**power
+
+
 def sanitize(name: str, separator: str = "_") -> str:
     """Removes illegal characters from the directory and filenames."""
 
@@ -1,9 +1,35 @@
-from .cyberdrop import Cyberdrop
-from .bunkr import Bunkr
-from .pixeldrain import Pixeldrain
+from importlib import import_module
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from .cyberdrop import AsyncCyberdrop, Cyberdrop
+    from .bunkr import AsyncBunkr, Bunkr
+    from .pixeldrain import AsyncPixeldrain, Pixeldrain
 
 __all__ = [
     "Cyberdrop",
     "Bunkr",
     "Pixeldrain",
+    "AsyncCyberdrop",
+    "AsyncBunkr",
+    "AsyncPixeldrain",
 ]
+
+MODULES = {
+    "Cyberdrop": "cyberdrop",
+    "Bunkr": "bunkr",
+    "Pixeldrain": "pixeldrain",
+    "AsyncCyberdrop": "cyberdrop",
+    "AsyncBunkr": "bunkr",
+    "AsyncPixeldrain": "pixeldrain",
+}
+
+
+def __getattr__(name: str) -> Any:
+    """The crawler is imported on the first use, so only the parser of the requested hosting is loaded."""
+
+    module = MODULES.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    return getattr(import_module(f".{module}", __name__), name)
@@ -1,52 +1,94 @@
-from bs4 import BeautifulSoup
+from typing import TYPE_CHECKING
+
 from yarl import URL
 
 from simple_downloader.core.exceptions import UndefinedMediaTypeError
-from simple_downloader.core.models import Crawler, MediaAlbum, MediaFile
+from simple_downloader.core.models import AsyncCrawler, Crawler, MediaAlbum, MediaFile
 from simple_downloader.core.parsing import (
-    get_soup,
+    DOWNLOAD_HYPERLINK,
+    TITLE,
+    get_document,
+    has_class,
     parse_download_hyperlink,
     parse_file_urls,
     parse_filename,
     parse_title,
 )
 
+if TYPE_CHECKING:
+    from simple_downloader.core.parsing import Element
+
 
 class Bunkr(Crawler):
     def get_media(self, url: URL) -> MediaAlbum | MediaFile:
         response = self.http_client.get_response(url)
         url_after_redirects = URL(response.url)  # a lot of old urls whose media type is not parsed
-        soup = get_soup(response.text)
-        return self._parse_media(url_after_redirects, soup)
+        return self._parse_media(url_after_redirects, response.text)
 
-    def _parse_media(self, url: URL, soup: BeautifulSoup) -> MediaAlbum | MediaFile:
+    def _parse_media(self, url: URL, html_page: str) -> MediaAlbum | MediaFile:
         media_type = url.parts[1]
         match media_type:
             case "a":
-                return self._parse_album(url, soup)
+                return _parse_album(url, html_page)
             case "i" | "v" | "d":
-                return self._parse_file(url, soup)
+                return self._parse_file(url, html_page)
             case _:
                 raise UndefinedMediaTypeError(url, media_type)
 
-    @staticmethod
-    def _parse_album(album_url: URL, soup: BeautifulSoup) -> MediaAlbum:
-        return MediaAlbum(
-            title=parse_title(soup),
-            url=album_url,
-            file_urls=parse_file_urls(soup, ".grid-images a"),
+    def _parse_file(self, file_url: URL, html_page: str) -> MediaFile:
+        document = get_document(html_page, TITLE, DOWNLOAD_HYPERLINK)  # the rest is not needed
+        title = parse_title(document)
+        return MediaFile(
+            title=title,
+            filename=parse_filename(title),
+            url=file_url,
+            stream_url=self._parse_stream_url(document),
+            source_id=f"bunkr:{file_url.name}",  # the same slug for "/i/", "/v/" and "/d/"
         )
 
-    def _parse_file(self, file_url: URL, soup: BeautifulSoup) -> MediaFile:
-        title = parse_title(soup)
+    def _parse_stream_url(self, document: "Element") -> URL:
+        url_with_hyperlink = parse_download_hyperlink(document)
+        page = self.http_client.get_response(url_with_hyperlink, cache=False).text
+        return parse_download_hyperlink(get_document(page, DOWNLOAD_HYPERLINK))
+
+
+class AsyncBunkr(AsyncCrawler):
+    async def get_media(self, url: URL) -> MediaAlbum | MediaFile:
+        response = await self.http_client.get_response(url)
+        url_after_redirects = URL(str(response.url))
+        return await self._parse_media(url_after_redirects, response.text)
+
+    async def _parse_media(self, url: URL, html_page: str) -> MediaAlbum | MediaFile:
+        media_type = url.parts[1]
+        match media_type:
+            case "a":
+                return _parse_album(url, html_page)
+            case "i" | "v" | "d":
+                return await self._parse_file(url, html_page)
+            case _:
+                raise UndefinedMediaTypeError(url, media_type)
+
+    async def _parse_file(self, file_url: URL, html_page: str) -> MediaFile:
+        document = get_document(html_page, TITLE, DOWNLOAD_HYPERLINK)  # the rest is not needed
+        title = parse_title(document)
         return MediaFile(
             title=title,
             filename=parse_filename(title),
             url=file_url,
-            stream_url=self._parse_stream_url(soup),
+            stream_url=await self._parse_stream_url(document),
+            source_id=f"bunkr:{file_url.name}",
         )
 
-    def _parse_stream_url(self, soup: BeautifulSoup) -> URL:
-        url_with_hyperlink = parse_download_hyperlink(soup)
-        soup = get_soup(self.http_client.get_response(url_with_hyperlink).text)
-        return parse_download_hyperlink(soup)
+    async def _parse_stream_url(self, document: "Element") -> URL:
+        url_with_hyperlink = parse_download_hyperlink(document)
+        page = (await self.http_client.get_response(url_with_hyperlink, cache=False)).text
+        return parse_download_hyperlink(get_document(page, DOWNLOAD_HYPERLINK))
+
+
+def _parse_album(album_url: URL, html_page: str) -> MediaAlbum:
+    document = get_document(html_page)
+    return MediaAlbum(
+        title=parse_title(document),
+        url=album_url,
+        file_urls=parse_file_urls(document, f"//*[{has_class('grid-images')}]//a"),
+    )
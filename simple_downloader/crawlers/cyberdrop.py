@@ -1,9 +1,19 @@
+from typing import TypeAlias
+
 from yarl import URL
 
 from simple_downloader.core.exceptions import UndefinedMediaTypeError
-from simple_downloader.core.models import Crawler, MediaAlbum, MediaFile
-from simple_downloader.core.parsing import get_soup, parse_file_urls, parse_filename, parse_title
+from simple_downloader.core.models import AsyncCrawler, Crawler, MediaAlbum, MediaFile
+from simple_downloader.core.parsing import (
+    get_document,
+    has_class,
+    parse_file_urls,
+    parse_filename,
+    parse_title,
+)
+
 
+Json: TypeAlias = dict
 
 BASE_API = URL("https://cyberdrop.me/api")
 
@@ -20,19 +30,56 @@ class Cyberdrop(Crawler):
                 raise UndefinedMediaTypeError(url, media_type)
 
     def _parse_album(self, album_url: URL) -> MediaAlbum:
-        soup = get_soup(self.http_client.get_response(album_url).text)
-        return MediaAlbum(
-            title=parse_title(soup),
-            url=album_url,
-            file_urls=parse_file_urls(soup, "#table .image", album_url.origin()),
-        )
+        html_page = self.http_client.get_response(album_url).text
+        return _build_album(album_url, html_page)
 
     def _parse_file(self, file_url: URL) -> MediaFile:
-        api = BASE_API.joinpath(file_url.path[1:])  # [1] is "/"
-        file_info = self.http_client.get_response(api).json()
-        return MediaFile(
-            title=file_info["name"],
-            filename=parse_filename(file_info["name"]),
-            url=file_url,
-            stream_url=file_info["url"],
-        )
+        file_info = self.http_client.get_response(_get_file_api(file_url), cache=False).json()
+        return _build_file(file_url, file_info)
+
+
+class AsyncCyberdrop(AsyncCrawler):
+    async def get_media(self, url: URL) -> MediaAlbum | MediaFile:
+        media_type = url.parts[1]
+        match media_type:
+            case "a":
+                return await self._parse_album(url)
+            case "f":
+                return await self._parse_file(url)
+            case _:
+                raise UndefinedMediaTypeError(url, media_type)
+
+    async def _parse_album(self, album_url: URL) -> MediaAlbum:
+        html_page = (await self.http_client.get_response(album_url)).text
+        return _build_album(album_url, html_page)
+
+    async def _parse_file(self, file_url: URL) -> MediaFile:
+        file_info = (
+            await self.http_client.get_response(_get_file_api(file_url), cache=False)
+        ).json()
+        return _build_file(file_url, file_info)
+
+
+def _get_file_api(file_url: URL) -> URL:
+    return BASE_API.joinpath(file_url.path[1:])  # [1] is "/"
+
+
+def _build_album(album_url: URL, html_page: str) -> MediaAlbum:
+    document = get_document(html_page)
+    return MediaAlbum(
+        title=parse_title(document),
+        url=album_url,
+        file_urls=parse_file_urls(
+            document, f"//*[@id='table']//*[{has_class('image')}]", album_url.origin()
+        ),
+    )
+
+
+def _build_file(file_url: URL, file_info: Json) -> MediaFile:
+    return MediaFile(
+        title=file_info["name"],
+        filename=parse_filename(file_info["name"]),
+        url=file_url,
+        stream_url=URL(file_info["url"]),
+        source_id=f"cyberdrop:{file_url.name}",
+    )
@@ -3,7 +3,7 @@ from typing import TypeAlias
 from yarl import URL
 
 from simple_downloader.core.exceptions import UndefinedMediaTypeError
-from simple_downloader.core.models import Crawler, MediaAlbum, MediaFile
+from simple_downloader.core.models import AsyncCrawler, Crawler, MediaAlbum, MediaFile
 from simple_downloader.core.parsing import parse_filename
 
 
@@ -32,30 +32,80 @@ class Pixeldrain(Crawler):
         This means that it must be handled differently, as it is not possible to easily obtain the file ID.
         """
 
-        item_number = int(item_url.fragment.rsplit("=", 1)[1])  # fragment scheme "item={number}"
         album_info = self._get_album_info(item_url)
-        file_id = album_info["files"][item_number]["id"]
-        file_url = item_url.with_path(f"u/{file_id}")
-        return self._parse_file(file_url)
+        return self._parse_file(_get_album_item_url(item_url, album_info))
 
     def _parse_album(self, album_url: URL) -> MediaAlbum:
-        album_info = self._get_album_info(album_url)
-        return MediaAlbum(
-            title=album_info["title"],
-            url=album_url,
-            file_urls=(album_url.with_path(f'u/{f_info["id"]}') for f_info in album_info["files"]),
-        )
+        return _build_album(album_url, self._get_album_info(album_url))
 
     def _parse_file(self, file_url: URL) -> MediaFile:
-        api = BASE_API.joinpath(f"file/{file_url.name}/info")
-        file_info = self.http_client.get_response(api).json()
-        return MediaFile(
-            title=file_info["name"],
-            filename=parse_filename(file_info["name"]),
-            url=file_url,
-            stream_url=BASE_API.joinpath(f"file/{file_url.name}"),
-        )
+        file_info = self.http_client.get_response(_get_file_info_api(file_url)).json()
+        return _build_file(file_url, file_info)
 
     def _get_album_info(self, album_url: URL) -> Json:
-        api = BASE_API.joinpath(f"list/{album_url.name}")
-        return self.http_client.get_response(api).json()
+        return self.http_client.get_response(_get_album_info_api(album_url)).json()
+
+
+class AsyncPixeldrain(AsyncCrawler):
+    async def get_media(self, url: URL) -> MediaAlbum | MediaFile:
+        if url.fragment:  # is this a part of the album?
+            return await self._parse_album_item(url)
+
+        media_type = url.parts[1]
+        match media_type:
+            case "l":
+                return await self._parse_album(url)
+            case "u":
+                return await self._parse_file(url)
+            case _:
+                raise UndefinedMediaTypeError(url, media_type)
+
+    async def _parse_album_item(self, item_url: URL) -> MediaFile:
+        album_info = await self._get_album_info(item_url)
+        return await self._parse_file(_get_album_item_url(item_url, album_info))
+
+    async def _parse_album(self, album_url: URL) -> MediaAlbum:
+        return _build_album(album_url, await self._get_album_info(album_url))
+
+    async def _parse_file(self, file_url: URL) -> MediaFile:
+        file_info = (await self.http_client.get_response(_get_file_info_api(file_url))).json()
+        return _build_file(file_url, file_info)
+
+    async def _get_album_info(self, album_url: URL) -> Json:
+        return (await self.http_client.get_response(_get_album_info_api(album_url))).json()
+
+
+def _get_file_info_api(file_url: URL) -> URL:
+    return BASE_API.joinpath(f"file/{file_url.name}/info")
+
+
+def _get_album_info_api(album_url: URL) -> URL:
+    return BASE_API.joinpath(f"list/{album_url.name}")
+
+
+def _get_album_item_url(item_url: URL, album_info: Json) -> URL:
+    item_number = int(item_url.fragment.rsplit("=", 1)[1])  # fragment scheme "item={number}"
+    file_id = album_info["files"][item_number]["id"]
+    return item_url.with_path(f"u/{file_id}")
+
+
+def _build_album(album_url: URL, album_info: Json) -> MediaAlbum:
+    return MediaAlbum(
+        title=album_info["title"],
+        url=album_url,
+        file_urls=(album_url.with_path(f'u/{f_info["id"]}') for f_info in album_info["files"]),
+    )
+
+
+def _build_file(file_url: URL, file_info: Json) -> MediaFile:
+    return MediaFile(
+        title=file_info["name"],
+        filename=parse_filename(file_info["name"]),
+        url=file_url,
+        stream_url=BASE_API.joinpath(f"file/{file_url.name}"),
+        source_id=f"pixeldrain:{file_url.name}",
+        expected_size=file_info.get("size"),
+        expected_checksum=(
+            f"sha256:{file_info['hash_sha256']}" if "hash_sha256" in file_info else None
+        ),
+    )
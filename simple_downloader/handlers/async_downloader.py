@@ -0,0 +1,173 @@
+import asyncio
+from contextlib import AsyncExitStack, asynccontextmanager
+from logging import getLogger
+from pathlib import Path
+from time import perf_counter
+from typing import AsyncIterator, ContextManager, TypeVar
+
+import httpx
+from requests import HTTPError
+from requests.exceptions import ChunkedEncodingError
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_exponential
+from tqdm import tqdm
+
+from simple_downloader.config import (
+    BASE_CHUNK,
+    DEFAULT_CHUNK_MULTIPLIER,
+    HASH_ALGORITHM,
+    LEAVE_PROGRESS_BAR,
+    RETRY_STRATEGY,
+    SUCCESS,
+    TOTAL_RETRIES,
+    WRITE_BUFFER_SIZE,
+)
+from simple_downloader.core.exceptions import (
+    DeviceSpaceRunOutError,
+    IntegrityError,
+    PartialContentError,
+)
+from simple_downloader.core.logs import log_download, log_retry
+from simple_downloader.core.metrics import RECEIVED_BYTES, THROUGHPUT, get_host
+from simple_downloader.core.models import MediaFile, Storage, StoredFile, Writer
+from simple_downloader.core.tracing import span
+from simple_downloader.core.utils import echo
+from simple_downloader.handlers import space
+from simple_downloader.handlers.async_requester import AsyncRequester
+from simple_downloader.handlers.downloader import RANGE_NOT_SATISFIABLE, TQDM_PARAMS
+from simple_downloader.handlers.integrity import Hasher, get_checksum, get_content_length
+from simple_downloader.storages.local import LocalStorage
+
+
+logger = getLogger(__name__)
+
+T = TypeVar("T")
+
+
+@retry(
+    reraise=True,
+    stop=stop_after_attempt(TOTAL_RETRIES),
+    wait=wait_exponential(**RETRY_STRATEGY),
+    retry=retry_if_exception_type((ChunkedEncodingError, PartialContentError, IntegrityError)),
+    before=log_download,
+    before_sleep=log_retry,
+)
+async def download(
+    file: MediaFile,
+    save_path: Path,
+    http_client: AsyncRequester,
+    chunk_multiplier: int = DEFAULT_CHUNK_MULTIPLIER,
+    leave_progress_bar: bool = LEAVE_PROGRESS_BAR,
+    hash_algorithm: str = HASH_ALGORITHM,
+    storage: Storage | None = None,
+) -> None:
+    """
+    Asynchronous counterpart of the downloader.download().
+
+    The file is hashed again (if the download is resumed), allocated, flushed and moved by a thread,
+    so a large file does not stop the other downloads of the event loop. The received chunks are
+    collected up to WRITE_BUFFER_SIZE and then written and hashed by a thread as well (the write may
+    wait for the disk or for the upload to the remote storage).
+    """
+
+    storage = storage or LocalStorage()
+    partial = storage.get_file(save_path.joinpath(str(file.filename)))
+    host = get_host(file.stream_url)
+    if storage.is_local and file.expected_size is not None:
+        space.check(save_path, file.expected_size - partial.offset, file.title)
+
+    async with get_stream(file, http_client, partial) as stream:
+        offset = partial.get_resume_offset(stream.status_code, stream.headers)
+        size = offset + int(stream.headers.get("content-length", 0))
+        length = get_content_length(stream.headers)
+        hasher = await asyncio.to_thread(partial.get_hasher, offset, hash_algorithm)
+        chunk_size = BASE_CHUNK * chunk_multiplier
+        received, started_at = 0, perf_counter()
+
+        async with in_thread(partial.writing(offset, length, file.title)) as bf_out:
+            with tqdm(
+                desc=file.title,
+                total=size,
+                initial=offset,
+                leave=leave_progress_bar,
+                **TQDM_PARAMS,
+            ) as bar, span("transfer", file.url, offset=offset):
+                pending: list[bytes] = []
+                pending_size = 0
+                try:
+                    async for chunk in http_client.iter_content(stream, chunk_size):
+                        pending.append(chunk)
+                        pending_size += len(chunk)
+                        bar.update(len(chunk))
+                        received += len(chunk)
+                        if pending_size >= WRITE_BUFFER_SIZE:
+                            chunks, pending, pending_size = pending, [], 0
+                            await asyncio.to_thread(_write, bf_out, hasher, chunks)
+                finally:
+                    RECEIVED_BYTES.inc(received, host=host)
+                    if pending:  # the received bytes of a broken stream are kept for the retry
+                        await asyncio.to_thread(_write, bf_out, hasher, pending)
+
+        if length is not None and partial.offset != offset + length:  # resumed by the retry
+            raise ChunkedEncodingError(f'Received {partial.offset} of {size} bytes "{file.title}"')
+
+        seconds = perf_counter() - started_at
+        if seconds:
+            THROUGHPUT.observe(received / seconds, host=host)
+
+        file.size = partial.offset
+        file.etag = stream.headers.get("etag")
+        file.checksum = get_checksum(hash_algorithm, hasher)
+        await asyncio.to_thread(partial.complete, file)
+        file.mark_downloaded()
+        logger.info('Downloaded "%s"', file.title)
+
+    if not leave_progress_bar:
+        echo(f"{SUCCESS} {file.title} | {tqdm.format_sizeof(size, 'B', BASE_CHUNK)}")
+
+
+def _write(bf_out: Writer, hasher: Hasher, chunks: list[bytes]) -> None:
+    try:
+        for chunk in chunks:
+            bf_out.write(chunk)
+            hasher.update(chunk)
+    except OSError:
+        raise DeviceSpaceRunOutError
+
+
+@asynccontextmanager
+async def get_stream(
+    file: MediaFile,
+    http_client: AsyncRequester,
+    partial: StoredFile,
+) -> AsyncIterator[httpx.Response]:
+    """Asynchronous counterpart of the downloader.get_stream()."""
+
+    async with AsyncExitStack() as stack:
+        with span("connect", file.url):
+            try:
+                stream = await stack.enter_async_context(
+                    http_client.get_stream(file.stream_url, partial.get_range_headers())
+                )
+            except HTTPError as e:
+                if e.response is None or e.response.status_code != RANGE_NOT_SATISFIABLE:
+                    raise
+
+                logger.debug('Range is not satisfiable, "%s" is downloaded again', file.title)
+                await asyncio.to_thread(partial.discard)
+                stream = await stack.enter_async_context(http_client.get_stream(file.stream_url))
+
+        yield stream
+
+
+@asynccontextmanager
+async def in_thread(manager: ContextManager[T]) -> AsyncIterator[T]:
+    """Enters and exits the context manager of the blocking I/O by a thread."""
+
+    value = await asyncio.to_thread(manager.__enter__)
+    try:
+        yield value
+    except BaseException as e:
+        if not await asyncio.to_thread(manager.__exit__, type(e), e, e.__traceback__):
+            raise
+    else:
+        await asyncio.to_thread(manager.__exit__, None, None, None)
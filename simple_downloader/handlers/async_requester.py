@@ -0,0 +1,323 @@
+import asyncio
+from contextlib import asynccontextmanager, contextmanager
+from http import HTTPStatus
+from logging import getLogger
+from time import perf_counter
+from types import TracebackType
+from typing import Any, AsyncIterator, Iterator, Self
+
+import httpx
+from requests import (
+    ConnectionError,
+    ConnectTimeout,
+    HTTPError,
+    ReadTimeout,
+    RequestException,
+    Timeout,
+    TooManyRedirects,
+)
+from requests.exceptions import ChunkedEncodingError
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_exponential
+from yarl import URL
+
+from simple_downloader.config import (
+    KEEPALIVE_EXPIRY,
+    MAX_REDIRECTS,
+    MIRRORS_PROBE_TIMEOUT,
+    RETRY_STRATEGY,
+    TIMEOUT,
+    TOTAL_RETRIES,
+)
+from simple_downloader.core.exceptions import CircuitOpenError, EmptyContentTypeError
+from simple_downloader.core.logs import log_request, log_retry
+from simple_downloader.core.metrics import CONNECTIONS, REQUESTS, TTFB, get_host
+from simple_downloader.handlers.cache import CachedResponse, ResponseCache
+from simple_downloader.handlers.health import HealthTracker
+from simple_downloader.handlers.mirrors import Mirrors
+from simple_downloader.handlers.rate_limiter import (
+    BandwidthLimiter,
+    RateLimiter,
+    parse_retry_after,
+)
+from simple_downloader.handlers.requester import (
+    FAILURE_CODES,
+    MIRROR_ERRORS,
+    RETRY_CODES,
+    CustomHTTPError,
+)
+from simple_downloader.handlers.user_agents import get_user_agent
+
+
+logger = getLogger(__name__)
+
+DEFAULT_MAX_CONNECTIONS = 100
+
+
+class AsyncRequester:
+    """
+    Asynchronous counterpart of the Requester based on httpx.
+
+    The httpx exceptions are converted to the requests ones, so the retry strategies
+    and the CLI error handling are the same for both engines.
+
+    With HTTP/2 (requires h2, the poetry extra "http2") the requests to a host are multiplexed
+    over one connection, so the metadata of many files is fetched without new handshakes.
+    """
+
+    def __init__(
+        self,
+        rate_limiter: RateLimiter | None = None,
+        max_connections: int = DEFAULT_MAX_CONNECTIONS,
+        cache: ResponseCache | None = None,
+        http2: bool = False,
+        bandwidth: BandwidthLimiter | None = None,
+        health: HealthTracker | None = None,
+        mirrors: Mirrors | None = None,
+    ) -> None:
+        self._client = httpx.AsyncClient(
+            headers={"user-agent": get_user_agent()},
+            timeout=_get_timeout(TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,  # idle connections are not closed
+                keepalive_expiry=KEEPALIVE_EXPIRY,
+            ),
+            http2=http2,
+            follow_redirects=True,
+            max_redirects=MAX_REDIRECTS,
+        )
+        logger.debug("Async client is open".upper())
+        logger.debug("Client parameters %s", self._client.headers)
+
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.cache = cache or ResponseCache()
+        self.bandwidth = bandwidth
+        self.health = health or HealthTracker()
+        self.mirrors = mirrors or Mirrors()
+
+    async def close_client(self) -> None:
+        await self._client.aclose()
+        logger.debug("Async client is closed".upper())
+
+    async def get_response(
+        self,
+        url: URL,
+        headers: dict[str, str] | None = None,
+        cache: bool = True,
+    ) -> httpx.Response:
+        """Pages and API responses (not ranges) are cached as in the Requester."""
+
+        if headers or not cache:
+            return await self._make_request(url, headers=headers)
+
+        cached = self.cache.get(url)
+        if cached is not None and cached.is_fresh:
+            logger.debug("Cached response for %s", url)
+            return _build_response(cached)
+
+        conditional_headers = cached.get_conditional_headers() if cached is not None else None
+        response = await self._make_request(url, headers=conditional_headers)
+        if cached is not None and response.status_code == HTTPStatus.NOT_MODIFIED:
+            logger.debug("Cached response for %s is not modified", url)
+            return _build_response(self.cache.refresh(url, cached, response.headers))
+
+        if response.status_code == HTTPStatus.OK:
+            self.cache.store(
+                url, str(response.url), response.status_code, response.headers, response.content
+            )
+        return response
+
+    @asynccontextmanager
+    async def get_stream(
+        self,
+        url: URL,
+        headers: dict[str, str] | None = None,
+    ) -> AsyncIterator[httpx.Response]:
+        """The response body is not loaded, it must be read by iter_content() inside the context."""
+
+        response = await self._make_request(url, stream=True, headers=headers)
+        try:
+            yield response
+        finally:
+            await response.aclose()
+
+    async def iter_content(self, response: httpx.Response, chunk_size: int) -> AsyncIterator[bytes]:
+        """
+        A broken stream raises ChunkedEncodingError as it does in requests.
+
+        The stream is shaped by the bandwidth limiter as in chunks.iter_chunks().
+        """
+
+        host = get_host(str(response.url))
+        if self.bandwidth is not None:
+            chunk_size = self.bandwidth.get_chunk_size(host, chunk_size)
+
+        try:
+            async for chunk in response.aiter_bytes(chunk_size):
+                if self.bandwidth is not None:
+                    await self.bandwidth.consume_async(host, len(chunk))
+                yield chunk
+        except httpx.TransportError as e:
+            raise ChunkedEncodingError(e) from e
+
+    @retry(
+        reraise=True,
+        stop=stop_after_attempt(TOTAL_RETRIES),
+        wait=wait_exponential(**RETRY_STRATEGY),
+        retry=retry_if_exception_type((ConnectionError, CustomHTTPError, Timeout)),
+        before=log_request,
+        before_sleep=log_retry,
+    )
+    async def _make_request(
+        self,
+        url: URL,
+        stream: bool = False,
+        headers: dict[str, str] | None = None,
+    ) -> httpx.Response:
+        """Every attempt goes to the mirrors of the host from the fastest one, as in the Requester."""
+
+        candidates = await self._get_candidates(url)
+        for candidate, fallback in zip(candidates, candidates[1:]):
+            try:
+                return await self._send(candidate, stream, headers)
+            except MIRROR_ERRORS as e:
+                self.mirrors.observe(candidate, None)
+                logger.info("%s failed (%s), it is sent to %s", candidate, e, fallback.host)
+
+        return await self._send(candidates[-1], stream, headers)
+
+    async def _get_candidates(self, url: URL) -> list[URL]:
+        hosting = self.mirrors.get_hosting(url)
+        if hosting is None:
+            return [url]
+
+        if self.mirrors.claim_probe(hosting):
+            urls = self.mirrors.get_probe_urls(hosting, url)
+            latencies = await asyncio.gather(*(self._probe(probe_url) for probe_url in urls))
+            for probe_url, latency in zip(urls, latencies):
+                self.mirrors.set_latency(probe_url, latency)
+            logger.info("Mirrors of %s: %s", hosting, self.mirrors.report(hosting))
+
+        return self.mirrors.get_candidates(url, self.health)
+
+    async def _probe(self, url: URL) -> float | None:
+        started_at = perf_counter()
+        try:
+            response = await self._client.head(str(url), timeout=MIRRORS_PROBE_TIMEOUT)
+        except httpx.HTTPError as e:
+            logger.debug("Mirror %s is not available: %s", url.host, e)
+            return None
+
+        return None if response.status_code in FAILURE_CODES else perf_counter() - started_at
+
+    async def _send(
+        self,
+        url: URL,
+        stream: bool,
+        headers: dict[str, str] | None,
+    ) -> httpx.Response:
+        host = get_host(url)
+        retry_in = self.health.admit(url)
+        if retry_in:
+            raise CircuitOpenError(host, retry_in)
+
+        await self.rate_limiter.acquire_async(url)
+        started_at = perf_counter()
+        try:
+            with _convert_exceptions():
+                request = self._client.build_request(
+                    "get",
+                    str(url),
+                    headers=headers,
+                    extensions={"trace": _count_connections},
+                )
+                response = await self._client.send(request, stream=stream)
+        except RequestException as e:
+            REQUESTS.inc(host=host, status=type(e).__name__)
+            self.health.record(url, failed=isinstance(e, (ConnectionError, Timeout)))
+            raise
+
+        REQUESTS.inc(host=host, status=str(response.status_code))
+        self.health.record(url, failed=response.status_code in FAILURE_CODES)
+        ttfb = perf_counter() - started_at
+        TTFB.observe(ttfb, host=host)
+        self.mirrors.observe(url, ttfb)
+
+        try:
+            self._raise_http_exception(url, response)
+        except BaseException:
+            await response.aclose()
+            raise
+
+        self.rate_limiter.speed_up(url)
+        return response
+
+    def _raise_http_exception(self, url: URL, response: httpx.Response) -> None:
+        if response.is_error:
+            code, phrase = response.status_code, response.reason_phrase
+            error_message = f"{code} Error: {phrase} for url: {response.url}"
+            if response.status_code in RETRY_CODES:
+                retry_after = parse_retry_after(response.headers)
+                if response.status_code == HTTPStatus.TOO_MANY_REQUESTS or retry_after:
+                    self.rate_limiter.slow_down(url, retry_after)
+
+                raise CustomHTTPError(error_message, response=response)  # type: ignore[reportArgumentType]
+            raise HTTPError(error_message, response=response)  # type: ignore[reportArgumentType]
+
+        if response.status_code == HTTPStatus.NOT_MODIFIED:
+            return  # the answer to the conditional request has no content
+
+        if not response.headers.get("content-type"):
+            logger.debug("HTTP response headers %s", response.headers)
+            raise EmptyContentTypeError
+
+    async def __aenter__(self) -> Self:
+        return self
+
+    async def __aexit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_val: BaseException | None,
+        exc_tb: TracebackType | None,
+    ) -> None:
+        if self._client:
+            await self.close_client()
+
+
+async def _count_connections(event: str, info: dict[str, Any]) -> None:
+    """The trace hook of httpcore, it is called for new connections only (not for reused ones)."""
+
+    if event == "connection.connect_tcp.started":
+        CONNECTIONS.inc(host=info.get("host") or "unknown")
+
+
+@contextmanager
+def _convert_exceptions() -> Iterator[None]:
+    try:
+        yield
+    except httpx.ConnectTimeout as e:
+        raise ConnectTimeout(e) from e
+    except httpx.TimeoutException as e:
+        raise ReadTimeout(e) from e
+    except httpx.TooManyRedirects as e:
+        raise TooManyRedirects(e) from e
+    except httpx.TransportError as e:
+        raise ConnectionError(e) from e
+
+
+def _build_response(cached: CachedResponse) -> httpx.Response:
+    return httpx.Response(
+        cached.status,
+        headers=cached.headers,
+        content=cached.content,
+        request=httpx.Request("get", cached.url),
+    )
+
+
+def _get_timeout(timeout: float | tuple[float, float] | None) -> httpx.Timeout:
+    match timeout:
+        case tuple():
+            connect, read = timeout
+            return httpx.Timeout(read, connect=connect)
+        case _:
+            return httpx.Timeout(timeout)
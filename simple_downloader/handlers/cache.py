@@ -0,0 +1,200 @@
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+import json
+from logging import getLogger
+from pathlib import Path
+from re import compile
+import sqlite3
+from threading import Lock
+from time import time
+from typing import Mapping
+
+from yarl import URL
+
+from simple_downloader.config import CACHE_NAME, CACHE_SIZE, CACHE_TTL
+
+
+logger = getLogger(__name__)
+
+# the content is stored decoded, so these headers do not describe it anymore
+DECODED_HEADERS = frozenset({"content-encoding", "content-length", "transfer-encoding"})
+MAX_AGE = compile(r"max-age=(\d+)")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    url TEXT PRIMARY KEY,
+    final_url TEXT NOT NULL,
+    status INTEGER NOT NULL,
+    headers TEXT NOT NULL,
+    content BLOB NOT NULL,
+    expires_at REAL NOT NULL
+)
+"""
+
+
+@dataclass(frozen=True, slots=True)
+class CachedResponse:
+    url: str  # after redirects
+    status: int
+    headers: dict[str, str]
+    content: bytes
+    expires_at: float
+
+    @property
+    def is_fresh(self) -> bool:
+        return time() < self.expires_at
+
+    def get_conditional_headers(self) -> dict[str, str]:
+        headers = {}
+        if etag := self.headers.get("etag"):
+            headers["if-none-match"] = etag
+        if last_modified := self.headers.get("last-modified"):
+            headers["if-modified-since"] = last_modified
+
+        return headers
+
+
+class ResponseCache:
+    """
+    Cache of the pages and API responses (not the file streams).
+
+    Responses are kept in the LRU in memory and, if the directory is set, in the SQLite store,
+    so they are available in the next run. The lifetime is taken from "Cache-Control: max-age"
+    or the TTL, "no-store" responses are not cached. A stale response with ETag or Last-Modified
+    is revalidated by the conditional request.
+    """
+
+    def __init__(
+        self,
+        ttl: float = CACHE_TTL,
+        max_entries: int = CACHE_SIZE,
+        directory: Path | None = None,
+    ) -> None:
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+        self._entries: OrderedDict[str, CachedResponse] = OrderedDict()
+        self._lock = Lock()
+        self._connection: sqlite3.Connection | None = None
+        if directory is not None:
+            self._connection = self._connect(directory.joinpath(CACHE_NAME))
+
+    def get(self, url: URL) -> CachedResponse | None:
+        key = str(url)
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None:
+                self._entries.move_to_end(key)
+                return cached
+
+            cached = self._load(key)
+            if cached is not None:
+                self._remember(key, cached)
+
+            return cached
+
+    def store(
+        self,
+        url: URL,
+        final_url: str,
+        status: int,
+        headers: Mapping[str, str],
+        content: bytes,
+    ) -> None:
+        lifetime = self._get_lifetime(headers)
+        if lifetime is None:
+            return
+
+        lowered = {
+            key.lower(): value
+            for key, value in headers.items()
+            if key.lower() not in DECODED_HEADERS
+        }
+        cached = CachedResponse(final_url, status, lowered, content, time() + lifetime)
+        with self._lock:
+            self._remember(str(url), cached)
+            self._save(str(url), cached)
+
+    def refresh(
+        self,
+        url: URL,
+        cached: CachedResponse,
+        headers: Mapping[str, str],
+    ) -> CachedResponse:
+        """Extends the lifetime of the cached response after "304 Not Modified"."""
+
+        lifetime = self._get_lifetime(headers)
+        if lifetime is None:
+            return cached
+
+        cached = replace(cached, expires_at=time() + lifetime)
+        with self._lock:
+            self._remember(str(url), cached)
+            self._save(str(url), cached)
+
+        return cached
+
+    def close(self) -> None:
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    def _get_lifetime(self, headers: Mapping[str, str]) -> float | None:
+        cache_control = headers.get("cache-control", "").lower()
+        if "no-store" in cache_control:
+            return None
+        if "no-cache" in cache_control:
+            return 0  # it is stored, but always revalidated
+
+        max_age = MAX_AGE.search(cache_control)
+        return min(int(max_age[1]), self.ttl) if max_age is not None else self.ttl
+
+    def _remember(self, key: str, cached: CachedResponse) -> None:
+        self._entries[key] = cached
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _load(self, key: str) -> CachedResponse | None:
+        if self._connection is None:
+            return None
+
+        row = self._connection.execute(
+            "SELECT final_url, status, headers, content, expires_at FROM responses WHERE url = ?",
+            (key,),
+        ).fetchone()
+        if row is None:
+            return None
+
+        final_url, status, headers, content, expires_at = row
+        return CachedResponse(final_url, status, json.loads(headers), content, expires_at)
+
+    def _save(self, key: str, cached: CachedResponse) -> None:
+        if self._connection is None:
+            return
+
+        with self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    key,
+                    cached.url,
+                    cached.status,
+                    json.dumps(cached.headers),
+                    cached.content,
+                    cached.expires_at,
+                ),
+            )
+
+    @staticmethod
+    def _connect(path: Path) -> sqlite3.Connection | None:
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            connection = sqlite3.connect(path, check_same_thread=False)
+            connection.execute(SCHEMA)
+        except (OSError, sqlite3.Error) as e:
+            logger.warning("Cache %s is not available: %s", path, e)
+            return None
+
+        return connection
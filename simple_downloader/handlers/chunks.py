@@ -0,0 +1,100 @@
+from contextlib import contextmanager
+from logging import getLogger
+from time import perf_counter
+from typing import Iterator
+
+from requests import ConnectionError, Response
+from requests.exceptions import ChunkedEncodingError, ContentDecodingError, SSLError
+from urllib3.exceptions import DecodeError, ProtocolError, ReadTimeoutError
+from urllib3.exceptions import SSLError as Urllib3SSLError
+
+from simple_downloader.config import CHUNK_READ_TIME, MAX_CHUNK_SIZE
+from simple_downloader.core.metrics import get_host
+from simple_downloader.handlers.rate_limiter import BandwidthLimiter
+
+
+logger = getLogger(__name__)
+
+
+class ChunkSize:
+    """
+    Size of the next read, adapted to the measured throughput.
+
+    The size is doubled while the reads are filled faster than the target time and halved
+    when they take much longer, so a fast connection is read by MiB-scale chunks (few Python
+    iterations per GB) and a slow one still updates the progress regularly.
+    """
+
+    def __init__(
+        self,
+        initial: int,
+        maximum: int = MAX_CHUNK_SIZE,
+        read_time: float = CHUNK_READ_TIME,
+    ) -> None:
+        self.minimum = min(initial, maximum)
+        self.maximum = maximum
+        self.read_time = read_time
+        self.size = self.minimum
+
+    def update(self, received: int, seconds: float) -> None:
+        if received == self.size and seconds < self.read_time / 2:
+            self.size = min(self.size * 2, self.maximum)
+        elif seconds > self.read_time * 2:
+            self.size = max(self.size // 2, self.minimum)
+
+
+def iter_chunks(
+    response: Response,
+    buffer: bytearray,
+    chunk_size: ChunkSize,
+    limit: int | None = None,
+    bandwidth: BandwidthLimiter | None = None,
+) -> Iterator[memoryview]:
+    """
+    Reads the stream into the reusable buffer (it must fit the maximum chunk size).
+
+    The yielded view is valid until the next chunk is read. The limit stops the reading after
+    the number of bytes (e.g. the end of the segment), the server may send more.
+    The bandwidth limiter shapes the reading by the chunks (not larger than it lets receive at once).
+    A broken stream raises the same exceptions as Response.iter_content().
+    """
+
+    view = memoryview(buffer)
+    host = get_host(response.url)
+    response.raw.decode_content = True  # as iter_content() does, the content may be compressed
+
+    with _convert_exceptions():
+        while limit is None or limit > 0:
+            size = chunk_size.size if limit is None else min(chunk_size.size, limit)
+            if bandwidth is not None:
+                size = bandwidth.get_chunk_size(host, size)
+            started_at = perf_counter()
+            received = response.raw.readinto(view[:size])
+            if not received:
+                return
+
+            chunk_size.update(received, perf_counter() - started_at)
+            if bandwidth is not None:
+                bandwidth.consume(host, received)
+            if limit is not None:
+                limit -= received
+
+            yield view[:received]
+
+
+def get_buffer() -> bytearray:
+    return bytearray(MAX_CHUNK_SIZE)
+
+
+@contextmanager
+def _convert_exceptions() -> Iterator[None]:
+    try:
+        yield
+    except ProtocolError as e:
+        raise ChunkedEncodingError(e)
+    except DecodeError as e:
+        raise ContentDecodingError(e)
+    except ReadTimeoutError as e:
+        raise ConnectionError(e)
+    except Urllib3SSLError as e:
+        raise SSLError(e)
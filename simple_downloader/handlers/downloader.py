@@ -1,6 +1,9 @@
+from http import HTTPStatus
 from pathlib import Path
 from logging import getLogger
+from time import perf_counter
 
+from requests import HTTPError, Response
 from requests.exceptions import ChunkedEncodingError
 from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_exponential
 from tqdm import tqdm
@@ -9,14 +12,28 @@ from simple_downloader.config import (
     BAR_FORMAT,
     BASE_CHUNK,
     DEFAULT_CHUNK_MULTIPLIER,
+    DEFAULT_SEGMENTS,
+    HASH_ALGORITHM,
     LEAVE_PROGRESS_BAR,
     RETRY_STRATEGY,
+    SUCCESS,
     TOTAL_RETRIES,
 )
-from simple_downloader.core.exceptions import DeviceSpaceRunOutError, FileOpenError
-from simple_downloader.core.models import MediaFile
+from simple_downloader.core.exceptions import (
+    DeviceSpaceRunOutError,
+    IntegrityError,
+    PartialContentError,
+)
+from simple_downloader.core.models import MediaFile, Storage, StoredFile
 from simple_downloader.core.logs import log_download, log_retry
+from simple_downloader.core.metrics import RECEIVED_BYTES, THROUGHPUT, get_host
+from simple_downloader.core.tracing import span
+from simple_downloader.core.utils import echo
+from simple_downloader.handlers import segmented, space
+from simple_downloader.handlers.chunks import ChunkSize, get_buffer, iter_chunks
+from simple_downloader.handlers.integrity import get_checksum, get_content_length
 from simple_downloader.handlers.requester import Requester
+from simple_downloader.storages.local import LocalStorage
 
 
 logger = getLogger(__name__)
@@ -27,17 +44,18 @@ TQDM_PARAMS = {
     "unit": "B",
     "unit_scale": True,
     "unit_divisor": BASE_CHUNK,
-    "miniters": 1,
+    "mininterval": 0.5,  # seconds between redraws, the bar is not redrawn on every chunk
     "ascii": True,
-    "leave": LEAVE_PROGRESS_BAR,
 }
 
+RANGE_NOT_SATISFIABLE = HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE
+
 
 @retry(
     reraise=True,
     stop=stop_after_attempt(TOTAL_RETRIES),
     wait=wait_exponential(**RETRY_STRATEGY),
-    retry=retry_if_exception_type(ChunkedEncodingError),
+    retry=retry_if_exception_type((ChunkedEncodingError, PartialContentError, IntegrityError)),
     before=log_download,
     before_sleep=log_retry,
 )
@@ -46,28 +64,141 @@ def download(
     save_path: Path,
     http_client: Requester,
     chunk_multiplier: int = DEFAULT_CHUNK_MULTIPLIER,
+    leave_progress_bar: bool = LEAVE_PROGRESS_BAR,
+    segments: int = DEFAULT_SEGMENTS,
+    hash_algorithm: str = HASH_ALGORITHM,
+    storage: Storage | None = None,
 ) -> None:
-    stream = http_client.get_response(file.stream_url, stream=True)
-    size = int(stream.headers.get("content-length", 0))
+    """
+    Streams the file to the save path.
 
-    def save() -> None:
-        abs_save_path = save_path.joinpath(str(file.filename))
+    The content is written to the ".part" file, which is renamed after the download is complete,
+    so a retry or the next run continues the download from the received byte.
 
-        try:
-            bf_out = abs_save_path.open("bw")
-        except IOError:
-            raise FileOpenError(abs_save_path)
-        else:
-            with bf_out, tqdm(desc=file.title, total=size, **TQDM_PARAMS) as bar:
-                for chunk in stream.iter_content(BASE_CHUNK * chunk_multiplier):
+    The checksum is computed while the content is written, the file is verified by the size
+    and checksum from the host (if the crawler knows them) and downloaded again if it is broken.
+
+    Large files can be downloaded by several segments at the same time (see segmented.download()).
+
+    The file that does not fit on the disk is not downloaded: its size is checked before the request
+    (if the host reports it), and the whole file is allocated before the first byte is written.
+
+    The remote storage receives the content while it is downloaded (see storages), such a file
+    is neither resumed nor split into segments.
+
+    When several files are downloaded at the same time, their progress bars should not be left
+    on the screen (they overlap each other), so a short line is printed after the download instead.
+    """
+
+    storage = storage or LocalStorage()
+    if storage.is_local and file.expected_size is not None:
+        received = storage.get_file(save_path.joinpath(str(file.filename))).offset
+        space.check(save_path, file.expected_size - received, file.title)
+
+    if (
+        segments > 1
+        and storage.is_local
+        and segmented.download(
+            file,
+            save_path,
+            http_client,
+            segments,
+            TQDM_PARAMS | {"leave": leave_progress_bar},
+            chunk_multiplier,
+            hash_algorithm,
+        )
+    ):
+        size = file.size or 0
+    else:
+        size = _download(
+            file,
+            save_path,
+            http_client,
+            chunk_multiplier,
+            leave_progress_bar,
+            hash_algorithm,
+            storage,
+        )
+
+    if not leave_progress_bar:
+        echo(f"{SUCCESS} {file.title} | {tqdm.format_sizeof(size, 'B', BASE_CHUNK)}")
+
+
+def _download(
+    file: MediaFile,
+    save_path: Path,
+    http_client: Requester,
+    chunk_multiplier: int,
+    leave_progress_bar: bool,
+    hash_algorithm: str,
+    storage: Storage,
+) -> int:
+    partial = storage.get_file(save_path.joinpath(str(file.filename)))
+    host = get_host(file.stream_url)
+
+    with get_stream(file, http_client, partial) as stream:
+        offset = partial.get_resume_offset(stream.status_code, stream.headers)
+        size = offset + int(stream.headers.get("content-length", 0))
+        length = get_content_length(stream.headers)
+        hasher = partial.get_hasher(offset, hash_algorithm)
+        chunk_size = ChunkSize(BASE_CHUNK * chunk_multiplier)
+        received, started_at = 0, perf_counter()
+
+        with partial.writing(offset, length, file.title) as bf_out, tqdm(
+            desc=file.title,
+            total=size,
+            initial=offset,
+            leave=leave_progress_bar,
+            **TQDM_PARAMS,
+        ) as bar, span("transfer", file.url, offset=offset):
+            try:
+                for chunk in iter_chunks(
+                    stream, get_buffer(), chunk_size, bandwidth=http_client.bandwidth
+                ):
                     try:
                         bf_out.write(chunk)
                     except OSError:
                         raise DeviceSpaceRunOutError
                     else:
+                        hasher.update(chunk)
                         bar.update(len(chunk))
+                        received += len(chunk)
+            finally:
+                RECEIVED_BYTES.inc(received, host=host)
+
+        if length is not None and partial.offset != offset + length:  # resumed by the retry
+            raise ChunkedEncodingError(f'Received {partial.offset} of {size} bytes "{file.title}"')
+
+        seconds = perf_counter() - started_at
+        if seconds:
+            THROUGHPUT.observe(received / seconds, host=host)
 
-                file.mark_downloaded()
-                logger.info('Downloaded "%s"', file.title)
+        file.size = partial.offset
+        file.etag = stream.headers.get("etag")
+        file.checksum = get_checksum(hash_algorithm, hasher)
+        partial.complete(file)
+        file.mark_downloaded()
+        logger.info('Downloaded "%s"', file.title)
+
+    return size
+
+
+def get_stream(file: MediaFile, http_client: Requester, partial: StoredFile) -> Response:
+    """
+    Requests the rest of the file if it was partially downloaded.
+
+    If the range cannot be satisfied (e.g. the partial file is broken), the file is requested again.
+    """
+
+    with span("connect", file.url):
+        try:
+            return http_client.get_response(
+                file.stream_url, stream=True, headers=partial.get_range_headers()
+            )
+        except HTTPError as e:
+            if e.response is None or e.response.status_code != RANGE_NOT_SATISFIABLE:
+                raise
 
-    save()
+            logger.debug('Range is not satisfiable, "%s" is downloaded again', file.title)
+            partial.discard()
+            return http_client.get_response(file.stream_url, stream=True)
@@ -1,37 +1,71 @@
 from logging import getLogger
+from pathlib import Path
+from typing import TYPE_CHECKING
 
 from yarl import URL
 
-from simple_downloader import crawlers
+from simple_downloader import crawlers, storages
 from simple_downloader.core.exceptions import CrawlerNotFound
-from simple_downloader.core.models import Crawler
-from simple_downloader.handlers.requester import Requester
+from simple_downloader.core.models import AsyncCrawler, Crawler
+
+if TYPE_CHECKING:
+    from simple_downloader.handlers.async_requester import AsyncRequester
+    from simple_downloader.handlers.requester import Requester
+    from simple_downloader.storages.remote import RemoteStorage
 
 
 logger = getLogger(__name__)
 
+# the names of the crawlers, the module of the crawler (and its parser) is imported on the first use
 MAPPING = {
-    "cyberdrop": crawlers.Cyberdrop,
-    "bunkr": crawlers.Bunkr,
-    "pixeldrain": crawlers.Pixeldrain,
+    "cyberdrop": "Cyberdrop",
+    "bunkr": "Bunkr",
+    "pixeldrain": "Pixeldrain",
+}
+
+ASYNC_MAPPING = {
+    "cyberdrop": "AsyncCyberdrop",
+    "bunkr": "AsyncBunkr",
+    "pixeldrain": "AsyncPixeldrain",
+}
+
+# the storages by the scheme of the URL, and the packages they require (the poetry extras of the scheme)
+STORAGES = {
+    "s3": "S3Storage",
+    "sftp": "SftpStorage",
+}
+
+STORAGE_PACKAGES = {
+    "s3": "boto3",
+    "sftp": "paramiko",
 }
 
 
-def get_crawler(url: URL, http_client: Requester) -> Crawler:
-    crawler = _choice_crawler(url)
-    if crawler is None:
+def get_hosting(url: URL) -> str:
+    """Returns the key of the mappings, URLs of the same hosting are processed by one session."""
+
+    key = next((key for key in MAPPING.keys() if url.host and key in url.host), None)
+    if key is None:
         raise CrawlerNotFound(url)
 
+    return key
+
+
+def get_crawler(url: URL, http_client: "Requester") -> Crawler:
+    crawler: type[Crawler] = getattr(crawlers, MAPPING[get_hosting(url)])
     logger.debug("Received <%s> crawler for %s", crawler.__module__, url)
     return crawler(http_client)
 
 
-def _choice_crawler(url: URL) -> type[Crawler] | None:
-    if url.host is None:
-        return None
+def get_async_crawler(url: URL, http_client: "AsyncRequester") -> AsyncCrawler:
+    crawler: type[AsyncCrawler] = getattr(crawlers, ASYNC_MAPPING[get_hosting(url)])
+    logger.debug("Received <%s> async crawler for %s", crawler.__module__, url)
+    return crawler(http_client)
 
-    key = next((key for key in MAPPING.keys() if key in url.host), None)
-    if key is None:
-        return None
 
-    return MAPPING[key]
+def get_storage(url: URL, root: Path) -> "RemoteStorage":
+    """The remote storage by its URL, the save path (root) keeps the manifests and the job queue."""
+
+    storage: type["RemoteStorage"] = getattr(storages, STORAGES[url.scheme])
+    logger.debug("Received <%s> storage for %s", storage.__module__, url.with_password(None))
+    return storage.from_url(url, root)
@@ -0,0 +1,178 @@
+from collections import deque
+from dataclasses import dataclass, field
+from logging import getLogger
+from threading import Lock
+from time import monotonic
+from typing import Literal, TypeAlias
+
+from yarl import URL
+
+from simple_downloader.config import (
+    CIRCUIT_COOLDOWN,
+    CIRCUIT_MAX_COOLDOWN,
+    CIRCUIT_THRESHOLD,
+    HEALTH_WINDOW,
+)
+from simple_downloader.core.jobs import Job
+from simple_downloader.core.metrics import CIRCUIT_TRIPS, get_host
+
+
+logger = getLogger(__name__)
+
+CircuitState: TypeAlias = Literal["closed", "open", "half-open"]
+
+
+@dataclass(slots=True)
+class HostHealth:
+    outcomes: deque[bool]  # the last requests, True - failed
+    cooldown: float
+    state: CircuitState = "closed"
+    opened_until: float = 0  # the host is probed after it
+    requests: int = 0
+    failures: int = 0
+    failures_in_row: int = 0
+    trips: int = 0  # times the circuit was opened
+
+
+@dataclass(frozen=True, slots=True)
+class HostReport:
+    host: str
+    state: CircuitState
+    requests: int
+    failures: int
+    error_rate: float  # of the last requests
+    trips: int
+
+
+class HealthTracker:
+    """
+    Circuit breaker with the health of each host.
+
+    Every request is recorded as a success or a failure (a connection error, a timeout or
+    a server error). After the threshold of failures in a row the circuit of the host is open:
+    its requests fail fast instead of the retries. After the cooldown the circuit is half-open,
+    one request probes the host. Its success closes the circuit, its failure opens it again
+    for the doubled cooldown. A probe whose result is lost is repeated after the cooldown.
+    """
+
+    def __init__(
+        self,
+        threshold: int = CIRCUIT_THRESHOLD,
+        cooldown: float = CIRCUIT_COOLDOWN,
+        max_cooldown: float = CIRCUIT_MAX_COOLDOWN,
+        window: int = HEALTH_WINDOW,
+    ) -> None:
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.window = window
+
+        self._hosts: dict[str, HostHealth] = {}
+        self._merged: list[HostReport] = []
+        self._lock = Lock()
+
+    def admit(self, url: URL) -> float:
+        """Returns 0 if the request can be sent, otherwise the seconds until the host is probed."""
+
+        with self._lock:
+            host = self._get_host(url)
+            if host.state == "closed":
+                return 0
+
+            now = monotonic()
+            if now < host.opened_until:
+                return host.opened_until - now
+
+            host.state = "half-open"
+            host.opened_until = now + host.cooldown  # the next requests wait for the probe
+            logger.info("Circuit of %s is half-open, the host is probed", get_host(url))
+            return 0
+
+    def is_open(self, url: URL) -> bool:
+        """Whether the requests to the host fail fast now (unlike admit(), it does not probe)."""
+
+        with self._lock:
+            host = self._hosts.get(get_host(url))
+            return host is not None and host.state != "closed" and monotonic() < host.opened_until
+
+    def record(self, url: URL, failed: bool) -> None:
+        with self._lock:
+            host = self._get_host(url)
+            host.requests += 1
+            host.outcomes.append(failed)
+            if not failed:
+                if host.state != "closed":
+                    logger.info("Circuit of %s is closed, the host responds", get_host(url))
+                host.state, host.failures_in_row, host.cooldown = "closed", 0, self.cooldown
+                return
+
+            host.failures += 1
+            host.failures_in_row += 1
+            if host.state == "half-open":
+                host.cooldown = min(self.max_cooldown, host.cooldown * 2)
+                self._open(url, host)
+            elif host.state == "closed" and host.failures_in_row >= self.threshold:
+                self._open(url, host)
+
+    def get_report(self) -> list[HostReport]:
+        with self._lock:
+            reports = [
+                HostReport(
+                    key,
+                    host.state,
+                    host.requests,
+                    host.failures,
+                    sum(host.outcomes) / len(host.outcomes) if host.outcomes else 0,
+                    host.trips,
+                )
+                for key, host in self._hosts.items()
+            ]
+            return reports + self._merged
+
+    def merge(self, report: list[HostReport]) -> None:
+        """Adds the hosts reported by the tracker of another process."""
+
+        with self._lock:
+            self._merged.extend(report)
+
+    def _open(self, url: URL, host: HostHealth) -> None:
+        host.state = "open"
+        host.opened_until = monotonic() + host.cooldown
+        host.trips += 1
+        CIRCUIT_TRIPS.inc(host=get_host(url))
+        logger.warning(
+            "Circuit of %s is open for %s seconds after %s failed requests in a row",
+            get_host(url),
+            f"{host.cooldown:.0f}",
+            host.failures_in_row,
+        )
+
+    def _get_host(self, url: URL) -> HostHealth:
+        key = get_host(url)
+        host = self._hosts.get(key)
+        if host is None:
+            host = self._hosts[key] = HostHealth(deque(maxlen=self.window), self.cooldown)
+
+        return host
+
+
+@dataclass(slots=True)
+class DeferredJobs:
+    """The jobs failed fast by the open circuit of the host, they are run again when it is probed."""
+
+    _jobs: list[Job] = field(default_factory=list)
+    _ready_at: float = 0
+    _lock: Lock = field(default_factory=Lock, repr=False, compare=False)
+
+    def add(self, job: Job, retry_in: float) -> None:
+        with self._lock:
+            self._jobs.append(job)
+            self._ready_at = max(self._ready_at, monotonic() + retry_in)
+
+    def take(self) -> tuple[list[Job], float]:
+        """Returns the jobs and the seconds until the circuits of their hosts are half-open."""
+
+        with self._lock:
+            jobs, self._jobs = self._jobs, []
+            ready_at, self._ready_at = self._ready_at, 0
+            return jobs, max(0, ready_at - monotonic())
@@ -0,0 +1,90 @@
+import hashlib
+from importlib.util import find_spec
+from logging import getLogger
+from pathlib import Path
+from typing import Mapping, Protocol
+
+from simple_downloader.config import HASH_ALGORITHM
+from simple_downloader.core.exceptions import IntegrityError
+from simple_downloader.core.models import MediaFile
+
+
+logger = getLogger(__name__)
+
+XXHASH_ALGORITHMS = ("xxh3_64", "xxh3_128")  # require xxhash (the poetry extra "xxhash")
+
+
+class Hasher(Protocol):
+    def update(self, data: bytes | memoryview, /) -> None: ...
+
+    def hexdigest(self) -> str: ...
+
+
+def get_algorithms() -> list[str]:
+    algorithms = ["sha256", "blake2b"]
+    if find_spec("xxhash") is not None:
+        algorithms.extend(XXHASH_ALGORITHMS)
+
+    return algorithms
+
+
+def new_hasher(algorithm: str = HASH_ALGORITHM) -> Hasher:
+    if algorithm in XXHASH_ALGORITHMS:
+        import xxhash
+
+        return getattr(xxhash, algorithm)()
+
+    return hashlib.new(algorithm)
+
+
+def get_checksum(algorithm: str, hasher: Hasher) -> str:
+    return f"{algorithm}:{hasher.hexdigest()}"
+
+
+def get_content_length(headers: Mapping[str, str]) -> int | None:
+    """The length of the encoded content (e.g. gzip) does not match the received bytes."""
+
+    if headers.get("content-encoding", "identity") != "identity":
+        return None
+
+    length = headers.get("content-length")
+    return int(length) if length is not None and length.isdigit() else None
+
+
+def verify(file: MediaFile) -> None:
+    """
+    Compares the received file with the size and checksum reported by the host.
+
+    The checksum is compared only if the host uses the same algorithm.
+    """
+
+    if file.expected_size is not None and file.size != file.expected_size:
+        raise IntegrityError(file.title, file.expected_size, file.size or 0)
+
+    if file.expected_checksum is None or file.checksum is None:
+        return
+
+    algorithm = file.checksum.split(":", 1)[0]
+    if file.expected_checksum.startswith(f"{algorithm}:") and (
+        file.expected_checksum.lower() != file.checksum.lower()
+    ):
+        raise IntegrityError(file.title, file.expected_checksum, file.checksum)
+
+    logger.debug('Integrity of "%s" is verified', file.title)
+
+
+def get_checksum_file(path: Path, checksum: str) -> tuple[Path, str]:
+    """The file of the checksum next to the file and its line in the format of "sha256sum"."""
+
+    algorithm, hexdigest = checksum.split(":", 1)
+    return path.with_name(f"{path.name}.{algorithm}"), f"{hexdigest}  {path.name}\n"
+
+
+def save_checksum(path: Path, checksum: str) -> None:
+    """Writes the checksum next to the file in the format of "sha256sum" ("{filename}.sha256")."""
+
+    checksum_path, line = get_checksum_file(path, checksum)
+    try:
+        checksum_path.write_text(line, encoding="utf-8")
+    except OSError as e:
+        logger.debug(e)
@@ -0,0 +1,139 @@
+from logging import getLogger
+from math import inf
+from threading import Lock
+from time import monotonic
+from typing import TYPE_CHECKING, Any, Iterable, Mapping
+
+from yarl import URL
+
+from simple_downloader.config import MIRRORS_PROBE_TIMEOUT, MIRRORS_PROBE_TTL, MIRRORS_SMOOTHING
+
+if TYPE_CHECKING:
+    from simple_downloader.handlers.health import HealthTracker
+
+
+logger = getLogger(__name__)
+
+
+class Mirrors:
+    """
+    The interchangeable domains of the hostings, e.g. the mirrors of Bunkr with their CDN subdomains.
+
+    A request to any of the domains is sent to the fastest host whose circuit is not open,
+    the other hosts are the fallbacks. The domains are probed by the first request of the
+    hosting (and again after the TTL), then the latency of each host follows the response
+    times of its requests. The failed host is the last one until the next probe. The host
+    that was never measured (e.g. the CDN subdomain on another mirror) is taken as slow as
+    the probe timeout, the requested one is the first of such hosts.
+    """
+
+    def __init__(
+        self,
+        domains: Mapping[str, Iterable[str]] | None = None,
+        probe_ttl: float = MIRRORS_PROBE_TTL,
+        smoothing: float = MIRRORS_SMOOTHING,
+    ) -> None:
+        self.domains = {
+            hosting: tuple(dict.fromkeys(hosting_domains))
+            for hosting, hosting_domains in (domains or {}).items()
+        }
+        self.probe_ttl = probe_ttl
+        self.smoothing = smoothing
+
+        self._latencies: dict[str, float] = {}  # seconds to the response headers by host
+        self._probed_at: dict[str, float] = {}
+        self._lock = Lock()
+
+    def __reduce__(self) -> tuple[Any, ...]:
+        return Mirrors, (self.domains, self.probe_ttl, self.smoothing)  # measured by each process
+
+    def get_hosting(self, url: URL) -> str | None:
+        """The hosting of the URL if it has mirrors."""
+
+        match = self._match(url)
+        return match[0] if match is not None else None
+
+    def get_candidates(self, url: URL, health: "HealthTracker") -> list[URL]:
+        """The URL on every mirror, from the fastest healthy one."""
+
+        match = self._match(url)
+        if match is None:
+            return [url]
+
+        hosting, domain = match
+        subdomain = url.raw_host[: -len(domain)]  # type: ignore[reportOptionalSubscript]
+        candidates = [url.with_host(subdomain + mirror) for mirror in self.domains[hosting]]
+        with self._lock:
+            latencies = dict(self._latencies)
+
+        return sorted(
+            candidates,
+            key=lambda candidate: (
+                health.is_open(candidate),
+                latencies.get(candidate.raw_host or "", MIRRORS_PROBE_TIMEOUT),
+                candidate.raw_host != url.raw_host,
+            ),
+        )
+
+    def claim_probe(self, hosting: str) -> bool:
+        """Whether the caller has to probe the mirrors (the others do not wait for it)."""
+
+        with self._lock:
+            now = monotonic()
+            if now - self._probed_at.get(hosting, -inf) < self.probe_ttl:
+                return False
+
+            self._probed_at[hosting] = now
+            return True
+
+    def get_probe_urls(self, hosting: str, url: URL) -> list[URL]:
+        """The root of every domain of the hosting (by the scheme and the port of the URL)."""
+
+        return [
+            URL.build(scheme=url.scheme, host=domain, port=url.explicit_port, path="/")
+            for domain in self.domains[hosting]
+        ]
+
+    def set_latency(self, url: URL, seconds: float | None) -> None:
+        """The result of the probe, None - the host has not responded."""
+
+        with self._lock:
+            self._latencies[url.raw_host or ""] = inf if seconds is None else seconds
+
+    def observe(self, url: URL, seconds: float | None) -> None:
+        """The response time of the request (moving average), None - the request failed."""
+
+        host = url.raw_host or ""
+        with self._lock:
+            latency = self._latencies.get(host, inf)  # not measured or failed
+            if seconds is None:
+                self._latencies[host] = inf
+            elif latency == inf:
+                self._latencies[host] = seconds
+            else:
+                self._latencies[host] = latency + self.smoothing * (seconds - latency)
+
+    def report(self, hosting: str) -> str:
+        with self._lock:
+            latencies = [
+                (domain, self._latencies.get(domain, inf)) for domain in self.domains[hosting]
+            ]
+
+        return ", ".join(
+            f"{domain} {'-' if latency == inf else f'{latency * 1000:.0f}ms'}"
+            for domain, latency in sorted(latencies, key=lambda item: item[1])
+        )
+
+    def _match(self, url: URL) -> tuple[str, str] | None:
+        host = url.raw_host
+        if not host:
+            return None
+
+        for hosting, domains in self.domains.items():
+            if len(domains) < 2:
+                continue
+            for domain in domains:
+                if host == domain or host.endswith(f".{domain}"):
+                    return hosting, domain
+
+        return None
@@ -0,0 +1,214 @@
+from contextlib import contextmanager
+from dataclasses import dataclass
+import hashlib
+from http import HTTPStatus
+import json
+from logging import getLogger
+import os
+from pathlib import Path
+from re import compile
+from typing import Any, BinaryIO, Iterator, Mapping
+
+from simple_downloader.config import HASH_ALGORITHM
+from simple_downloader.core.exceptions import (
+    FileOpenError,
+    IntegrityError,
+    NotEnoughSpaceError,
+    PartialContentError,
+)
+from simple_downloader.core.models import MediaFile, StoredFile
+from simple_downloader.core.tracing import span
+from simple_downloader.handlers import space
+from simple_downloader.handlers.integrity import Hasher, new_hasher, save_checksum, verify
+
+
+logger = getLogger(__name__)
+
+PART_SUFFIX = ".part"
+SIDECAR_SUFFIX = ".json"
+CONTENT_RANGE = compile(r"bytes (\d+)-(\d+)/(\d+|\*)")
+
+
+@dataclass(frozen=True, slots=True)
+class PartialFile(StoredFile):
+    """
+    The file being downloaded to the local disk, it is written next to the target with the ".part"
+    suffix.
+
+    The sidecar keeps the validators of the first response (ETag or Last-Modified), so the download
+    can be continued by the "Range" request after a retry or in the next run. If the file on the
+    server has changed, it responds with the whole content and the download starts over.
+
+    In the segmented mode the partial file is preallocated, so instead of its size the sidecar
+    keeps the received bytes of each segment.
+    """
+
+    path: Path
+
+    @property
+    def part_path(self) -> Path:
+        return self.path.with_name(f"{self.path.name}{PART_SUFFIX}")
+
+    @property
+    def sidecar_path(self) -> Path:
+        return self.path.with_name(f"{self.path.name}{PART_SUFFIX}{SIDECAR_SUFFIX}")
+
+    @property
+    def offset(self) -> int:
+        try:
+            return self.part_path.stat().st_size
+        except OSError:
+            return 0
+
+    def get_range_headers(self) -> dict[str, str]:
+        offset = self.offset
+        validators = self._load_validators()
+        if "segments" in validators:  # the preallocated file cannot be continued by one request
+            self.discard()
+            return {}
+
+        if not offset or validators.get("accept-ranges") == "none":
+            return {}
+
+        headers = {"range": f"bytes={offset}-"}
+        validator = validators.get("etag") or validators.get("last-modified")
+        if validator is not None:
+            headers["if-range"] = validator
+
+        logger.debug('Resume "%s" from %s byte', self.path.name, offset)
+        return headers
+
+    def get_resume_offset(self, status_code: int, headers: Mapping[str, str]) -> int:
+        """
+        Returns the position in the partial file from which the response body should be written.
+
+        The server may ignore the "Range" header and return the whole content, then it is 0.
+        """
+
+        if status_code != HTTPStatus.PARTIAL_CONTENT:
+            self._save_validators(headers)
+            return 0
+
+        match = CONTENT_RANGE.fullmatch(headers.get("content-range", ""))
+        if match is None or int(match[1]) != self.offset:
+            self.discard()
+            raise PartialContentError(headers.get("content-range"))
+
+        return self.offset
+
+    @contextmanager
+    def writing(self, offset: int, length: int | None, title: str) -> Iterator[BinaryIO]:
+        """
+        Opens the partial file at the offset. If the length of the rest is known, it is reserved
+        on the disk before the first byte is written, the size of the file stays the received
+        bytes (even if the process is killed), so the next attempt continues from them.
+        """
+
+        try:
+            bf_out = self.part_path.open("r+b" if offset else "wb")
+            bf_out.seek(offset)
+        except OSError:
+            raise FileOpenError(self.part_path)
+
+        with bf_out:
+            if length is not None:
+                try:
+                    space.allocate(bf_out, self.part_path, offset + length, title)
+                except NotEnoughSpaceError:
+                    if not offset:
+                        bf_out.close()
+                        self.discard()
+                    raise
+
+            try:
+                yield bf_out
+            finally:
+                if length is not None:
+                    bf_out.truncate()  # the blocks reserved for the rest are released
+
+    def get_segments(self, headers: Mapping[str, str] | None = None) -> list[list[int]] | None:
+        """
+        Returns the segments saved earlier if the file on the server has not changed (it is checked
+        if the headers of the response are passed).
+        """
+
+        saved = self._load_validators()
+        if "segments" not in saved:
+            return None
+        if headers is None:
+            return saved["segments"]
+
+        validators = _get_validators(headers)
+        if any(saved.get(key) != value for key, value in validators.items()):
+            logger.debug('File "%s" has been changed on the server', self.path.name)
+            return None
+
+        return saved["segments"]  # type: ignore[reportReturnType]
+
+    def save_segments(self, headers: Mapping[str, str], segments: list[list[int]]) -> None:
+        self._save_validators(headers, segments=segments)
+
+    def get_hasher(self, offset: int, algorithm: str = HASH_ALGORITHM) -> Hasher:
+        """Returns the hasher with the content received earlier (if the download is resumed)."""
+
+        hasher = new_hasher(algorithm)
+        if offset:
+            with self.part_path.open("br") as bf_in:
+                hashlib.file_digest(bf_in, lambda: hasher)  # type: ignore[reportArgumentType]
+
+        return hasher
+
+    def complete(self, file: MediaFile) -> None:
+        """
+        Verifies the received file and moves it to the target with its checksum.
+
+        A broken file is discarded, so the next attempt downloads it again. The content is flushed
+        to the disk before the rename, so after a crash the target is never empty or cut off.
+        """
+
+        try:
+            verify(file)
+        except IntegrityError:
+            self.discard()
+            raise
+
+        with span("fsync", file.url, size=file.size):
+            _fsync(self.part_path)
+        self.part_path.replace(self.path)
+        self.sidecar_path.unlink(missing_ok=True)
+        if file.checksum is not None:
+            save_checksum(self.path, file.checksum)
+
+    def discard(self) -> None:
+        self.part_path.unlink(missing_ok=True)
+        self.sidecar_path.unlink(missing_ok=True)
+
+    def _load_validators(self) -> dict[str, Any]:
+        try:
+            return json.loads(self.sidecar_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return {}
+
+    def _save_validators(self, headers: Mapping[str, str], **extra: Any) -> None:
+        validators = _get_validators(headers) | extra
+        try:
+            self.sidecar_path.write_text(json.dumps(validators), encoding="utf-8")
+        except OSError as e:
+            logger.debug(e)
+
+
+def _get_validators(headers: Mapping[str, str]) -> dict[str, str | None]:
+    etag = headers.get("etag")
+    return {
+        "etag": None if etag is None or etag.startswith("W/") else etag,  # weak is not allowed
+        "last-modified": headers.get("last-modified"),
+        "accept-ranges": headers.get("accept-ranges"),
+    }
+
+
+def _fsync(path: Path) -> None:
+    try:
+        with path.open("r+b") as bf_out:
+            os.fsync(bf_out.fileno())
+    except OSError as e:
+        logger.debug(e)
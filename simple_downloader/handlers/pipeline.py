@@ -0,0 +1,124 @@
+from dataclasses import dataclass
+from logging import getLogger
+from queue import Empty, Full, Queue
+from threading import Event, Thread
+from types import TracebackType
+from typing import Callable, Iterable, Iterator, Self
+
+from yarl import URL
+
+from simple_downloader.config import PIPELINE_SIZE
+from simple_downloader.core.models import Crawler, MediaAlbum, MediaFile
+from simple_downloader.core.tracing import span
+
+
+logger = getLogger(__name__)
+
+POLL_INTERVAL = 0.5  # seconds, how often the stop is checked while waiting for the queue
+
+
+@dataclass(frozen=True, slots=True)
+class Resolved:
+    url: URL
+    media: MediaAlbum | MediaFile | None = None
+    error: Exception | None = None
+
+    @property
+    def is_skipped(self) -> bool:
+        return self.media is None and self.error is None
+
+    def get_media(self) -> MediaAlbum | MediaFile:
+        """Raises the error of the resolution, so it is handled as if the file was resolved here."""
+
+        if self.error is not None:
+            raise self.error
+
+        assert self.media is not None
+        return self.media
+
+
+class Resolver:
+    """
+    Resolves the file URLs of the album by the crawler in a separate thread (producer).
+
+    The URLs are taken from the album lazily and the resolved files wait in the bounded queue,
+    so the next file is known while the previous one is downloaded, and the resolver does not
+    run far ahead of the downloads (stream links may expire). Several consumers can iterate
+    over one resolver. The error of a file is passed with its URL, the error of the album itself
+    (e.g. the file table is not found) is raised by the iteration.
+    """
+
+    def __init__(
+        self,
+        urls: Iterable[URL],
+        crawler: Crawler,
+        skip: Callable[[URL], bool],
+        maxsize: int = PIPELINE_SIZE,
+    ) -> None:
+        self._urls = urls
+        self._crawler = crawler
+        self._skip = skip
+        self._queue: Queue[Resolved | Exception | None] = Queue(maxsize)  # None - no more files
+        self._stopped = Event()
+        self._thread = Thread(target=self._produce, name="resolver", daemon=True)
+
+    def __iter__(self) -> Iterator[Resolved]:
+        while not self._stopped.is_set():
+            try:
+                item = self._queue.get(timeout=POLL_INTERVAL)
+            except Empty:
+                continue
+
+            match item:
+                case None:
+                    self._queue.put(None)  # for the other consumers
+                    return
+                case Exception():
+                    raise item
+                case _:
+                    yield item
+
+    def _produce(self) -> None:
+        try:
+            for url in self._urls:
+                if self._stopped.is_set():
+                    return
+
+                if self._skip(url):
+                    self._put(Resolved(url))
+                    continue
+
+                try:
+                    with span("resolve", url):
+                        media = self._crawler.get_media(url)
+                except Exception as e:
+                    self._put(Resolved(url, error=e))
+                else:
+                    self._put(Resolved(url, media))
+        except Exception as e:
+            self._put(e)
+        finally:
+            self._put(None)
+
+    def _put(self, item: Resolved | Exception | None) -> None:
+        while not self._stopped.is_set():
+            try:
+                self._queue.put(item, timeout=POLL_INTERVAL)
+            except Full:
+                continue
+            else:
+                return
+
+    def __enter__(self) -> Self:
+        self._thread.start()
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_val: BaseException | None,
+        exc_tb: TracebackType | None,
+    ) -> None:
+        # the thread is not joined, the current request of the resolver may take long (retries)
+        self._stopped.set()
+        logger.debug("Resolver is stopped")
@@ -0,0 +1,276 @@
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from logging import getLogger
+from threading import BoundedSemaphore, Lock
+from time import monotonic, sleep
+from typing import Iterator, Mapping
+
+from yarl import URL
+
+from simple_downloader.config import BANDWIDTH_BURST, CHUNK_READ_TIME, RATE_LIMIT, RATE_RECOVERY
+from simple_downloader.core.metrics import RATE_LIMIT_DELAY, THROTTLED, get_host
+
+
+logger = getLogger(__name__)
+
+
+@dataclass(slots=True)
+class TokenBucket:
+    """
+    Tokens are added at the rate per second up to the capacity (burst).
+
+    A reservation can take a token in advance, then the tokens become negative and the caller
+    has to wait until the debt is repaid. So concurrent callers are queued one after another.
+    """
+
+    rate: float
+    capacity: float
+    tokens: float = field(init=False)
+    updated_at: float = field(default_factory=monotonic, init=False)
+    blocked_until: float = field(default=0, init=False)
+
+    def __post_init__(self) -> None:
+        self.tokens = self.capacity
+
+    def reserve(self, amount: float = 1) -> float:
+        """Takes the tokens and returns the number of seconds to wait before using them."""
+
+        now = monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        self.tokens -= amount
+
+        wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        return max(wait, self.blocked_until - now)
+
+    def block(self, seconds: float) -> None:
+        self.blocked_until = max(self.blocked_until, monotonic() + seconds)
+
+
+@dataclass(slots=True)
+class HostState:
+    bucket: TokenBucket
+    successes: int = 0
+
+
+class RateLimiter:
+    """
+    Adaptive rate limiter with a token bucket for each host.
+
+    The rate of the host is halved when it responds with "429 Too Many Requests" (or with another
+    retry code and "retry-after") and the host is blocked for "retry-after" seconds. After a series
+    of successful requests the rate grows again up to the maximum.
+    """
+
+    def __init__(
+        self,
+        rate: float = RATE_LIMIT["rate"],
+        burst: float = RATE_LIMIT["burst"],
+        min_rate: float = RATE_LIMIT["min_rate"],
+        max_rate: float = RATE_LIMIT["max_rate"],
+        recovery: int = RATE_RECOVERY,
+    ) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.recovery = recovery
+
+        self._hosts: dict[str, HostState] = {}
+        self._lock = Lock()
+
+    def reserve(self, url: URL) -> float:
+        with self._lock:
+            delay = self._get_host(url).bucket.reserve()
+
+        RATE_LIMIT_DELAY.observe(delay, host=get_host(url))
+        if delay:
+            logger.debug("Delay %s seconds for %s", f"{delay:.2f}", url.host)
+        return delay
+
+    def acquire(self, url: URL) -> None:
+        sleep(self.reserve(url))
+
+    async def acquire_async(self, url: URL) -> None:
+        import asyncio  # the sync engine does not need it
+
+        await asyncio.sleep(self.reserve(url))
+
+    def slow_down(self, url: URL, retry_after: float | None = None) -> None:
+        with self._lock:
+            host = self._get_host(url)
+            host.successes = 0
+            host.bucket.rate = max(self.min_rate, host.bucket.rate / 2)
+            if retry_after:
+                host.bucket.block(retry_after)
+
+            logger.info("Rate for %s is reduced to %s rps", url.host, f"{host.bucket.rate:.2f}")
+
+    def speed_up(self, url: URL) -> None:
+        with self._lock:
+            host = self._get_host(url)
+            host.successes += 1
+            if host.successes < self.recovery or host.bucket.rate >= self.max_rate:
+                return
+
+            host.successes = 0
+            host.bucket.rate = min(self.max_rate, host.bucket.rate * 1.5)
+            logger.debug("Rate for %s is increased to %s rps", url.host, f"{host.bucket.rate:.2f}")
+
+    def _get_host(self, url: URL) -> HostState:
+        key = url.host or ""
+        host = self._hosts.get(key)
+        if host is None:
+            host = self._hosts[key] = HostState(TokenBucket(self.rate, self.burst))
+
+        return host
+
+
+def parse_retry_after(headers: Mapping[str, str]) -> float | None:
+    """The "retry-after" header contains either seconds or the HTTP date."""
+
+    value = headers.get("retry-after")
+    if not value:
+        return None
+
+    try:
+        return max(0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+
+    return max(0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+class ConcurrencyLimiter:
+    """
+    Limits the files downloaded at the same time: in total and from each hosting.
+
+    The slot of the hosting is taken first, so a download waiting for its hosting does not hold
+    the total budget while the files of other hostings could be downloaded.
+    """
+
+    def __init__(self, total: int, per_host: int | None = None) -> None:
+        self.total = total
+        self.per_host = min(per_host or total, total)
+
+        self._total = BoundedSemaphore(total)
+        self._hosts: dict[str, BoundedSemaphore] = {}
+        self._lock = Lock()
+
+    @contextmanager
+    def hold(self, host: str) -> Iterator[None]:
+        with self._get_host(host), self._total:
+            yield
+
+    def _get_host(self, host: str) -> BoundedSemaphore:
+        with self._lock:
+            semaphore = self._hosts.get(host)
+            if semaphore is None:
+                semaphore = self._hosts[host] = BoundedSemaphore(self.per_host)
+
+            return semaphore
+
+
+class BandwidthLimiter:
+    """
+    Shapes the received bytes of all transfers: in total and per host (bytes per second).
+
+    Each chunk reserves its bytes in the global bucket and in the bucket of its host and waits
+    for the longer debt. The reservations are queued one after another, and the chunks are not
+    larger than a fraction of a second of the rate, so the concurrent files take turns and share
+    the bandwidth evenly. The limits can be changed (or removed) while the transfers run.
+    """
+
+    def __init__(
+        self,
+        total: float | None = None,
+        per_host: float | None = None,
+        burst: float = BANDWIDTH_BURST,
+        chunk_time: float = CHUNK_READ_TIME,
+    ) -> None:
+        self.burst = burst
+        self.chunk_time = chunk_time
+
+        self._total: TokenBucket | None = None
+        self._per_host: float | None = None
+        self._hosts: dict[str, TokenBucket] = {}
+        self._lock = Lock()
+        self.set_limits(total, per_host)
+
+    @property
+    def limits(self) -> tuple[float | None, float | None]:
+        with self._lock:
+            return (self._total.rate if self._total is not None else None), self._per_host
+
+    def set_limits(self, total: float | None, per_host: float | None) -> None:
+        if any(rate is not None and rate <= 0 for rate in (total, per_host)):
+            raise ValueError("Bandwidth limit must be positive")
+
+        with self._lock:
+            self._total = self._update_bucket(self._total, total)
+            self._per_host = per_host
+            for host, bucket in list(self._hosts.items()):
+                updated = self._update_bucket(bucket, per_host)
+                if updated is None:
+                    del self._hosts[host]
+                else:
+                    self._hosts[host] = updated
+
+        logger.info("Bandwidth is limited to %s in total, %s per host", total, per_host)
+
+    def get_chunk_size(self, host: str, size: int) -> int:
+        """The chunk of the transfer is not larger than the limit lets receive at once."""
+
+        total, per_host = self.limits
+        rates = [rate for rate in (total, per_host) if rate is not None]
+        if not rates:
+            return size
+
+        return max(1, min(size, int(min(rates) * self.chunk_time)))
+
+    def reserve(self, host: str, amount: int) -> float:
+        with self._lock:
+            buckets = [self._total, self._get_host(host)]
+            delay = max(
+                (bucket.reserve(amount) for bucket in buckets if bucket is not None), default=0
+            )
+
+        if delay:
+            THROTTLED.inc(delay, host=host)
+        return delay
+
+    def consume(self, host: str, amount: int) -> None:
+        sleep(self.reserve(host, amount))
+
+    async def consume_async(self, host: str, amount: int) -> None:
+        import asyncio
+
+        await asyncio.sleep(self.reserve(host, amount))
+
+    def _get_host(self, host: str) -> TokenBucket | None:
+        if self._per_host is None:
+            return None
+
+        bucket = self._hosts.get(host)
+        if bucket is None:
+            bucket = self._hosts[host] = TokenBucket(self._per_host, self._per_host * self.burst)
+
+        return bucket
+
+    def _update_bucket(self, bucket: TokenBucket | None, rate: float | None) -> TokenBucket | None:
+        if rate is None:
+            return None
+        if bucket is None:
+            return TokenBucket(rate, rate * self.burst)
+
+        bucket.reserve(0)  # the tokens received at the previous rate are added up to now
+        bucket.rate, bucket.capacity = rate, rate * self.burst
+        bucket.tokens = min(bucket.tokens, bucket.capacity)
+        return bucket
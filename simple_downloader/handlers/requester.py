@@ -1,23 +1,38 @@
+from concurrent.futures import ThreadPoolExecutor
 from http import HTTPStatus
 from logging import getLogger
+from time import perf_counter
 from types import TracebackType
 from typing import Any, Literal, Self
 
-from fake_useragent import UserAgent
-from requests import ConnectionError, HTTPError, Response, Session, Timeout
+from requests import ConnectionError, HTTPError, RequestException, Response, Session, Timeout
+from requests.adapters import DEFAULT_POOLBLOCK, DEFAULT_POOLSIZE, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
 from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_exponential
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
 from yarl import URL
 
 from simple_downloader.config import (
-    DEFAULT_DELAY,
     MAX_REDIRECTS,
+    MIRRORS_PROBE_TIMEOUT,
+    POOL_CONNECTIONS,
     RETRY_STRATEGY,
     TIMEOUT,
     TOTAL_RETRIES,
 )
-from simple_downloader.core.exceptions import CustomHTTPError, EmptyContentTypeError
+from simple_downloader.core.exceptions import CircuitOpenError, EmptyContentTypeError
 from simple_downloader.core.logs import log_request, log_retry
-from simple_downloader.core.utils import apply_delay
+from simple_downloader.core.metrics import CONNECTIONS, REQUESTS, TTFB, get_host
+from simple_downloader.handlers.cache import CachedResponse, ResponseCache
+from simple_downloader.handlers.health import HealthTracker
+from simple_downloader.handlers.mirrors import Mirrors
+from simple_downloader.handlers.rate_limiter import (
+    BandwidthLimiter,
+    RateLimiter,
+    parse_retry_after,
+)
+from simple_downloader.handlers.user_agents import get_user_agent
 
 
 logger = getLogger(__name__)
@@ -32,26 +47,132 @@ RETRY_CODES = frozenset(
         HTTPStatus.GATEWAY_TIMEOUT,
     }
 )
+# the host that answers "429 Too Many Requests" is alive, it is slowed down by the rate limiter
+FAILURE_CODES = RETRY_CODES - {HTTPStatus.TOO_MANY_REQUESTS}
+
+
+class CustomHTTPError(HTTPError):
+    """
+    Exception wrapper for HTTPError.
+
+    The error occurs if the request fails and the response status code
+    is included in the list of codes for which retry applies.
+    """
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+
+
+# the errors of the mirror, the request is sent to another one
+MIRROR_ERRORS = (ConnectionError, Timeout, CustomHTTPError, CircuitOpenError)
+
+
+class CountingHTTPConnectionPool(HTTPConnectionPool):
+    def _new_conn(self):  # type: ignore[reportIncompatibleMethodOverride]
+        CONNECTIONS.inc(host=self.host)
+        return super()._new_conn()
+
+
+class CountingHTTPSConnectionPool(HTTPSConnectionPool):
+    def _new_conn(self):  # type: ignore[reportIncompatibleMethodOverride]
+        CONNECTIONS.inc(host=self.host)
+        return super()._new_conn()
+
+
+class PoolAdapter(HTTPAdapter):
+    """
+    The adapter keeps the pools of many hosts at once and counts the new connections.
+
+    Files are served by many CDN shards (subdomains), with the default 10 pools the pool of
+    a shard is dropped with its open connections and the next file there makes the handshakes again.
+    """
+
+    def __init__(
+        self,
+        pool_connections: int = POOL_CONNECTIONS,
+        pool_maxsize: int = DEFAULT_POOLSIZE,
+    ) -> None:
+        super().__init__(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+
+    def init_poolmanager(
+        self, connections: int, maxsize: int, block: bool = DEFAULT_POOLBLOCK, **pool_kwargs: Any
+    ) -> None:
+        super().init_poolmanager(connections, maxsize, block, **pool_kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": CountingHTTPConnectionPool,
+            "https": CountingHTTPSConnectionPool,
+        }
 
 
 class Requester:
-    def __init__(self, delay: float | tuple[float, float] | None = DEFAULT_DELAY) -> None:
+    def __init__(
+        self,
+        rate_limiter: RateLimiter | None = None,
+        pool_maxsize: int = DEFAULT_POOLSIZE,
+        cache: ResponseCache | None = None,
+        pool_connections: int = POOL_CONNECTIONS,
+        bandwidth: BandwidthLimiter | None = None,
+        health: HealthTracker | None = None,
+        mirrors: Mirrors | None = None,
+    ) -> None:
         self._session: Session = Session()
         logger.debug("Session is open".upper())
 
-        self.delay = delay
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.cache = cache or ResponseCache()
+        self.bandwidth = bandwidth  # shared by the sessions, the limit is for all the transfers
+        self.health = health or HealthTracker()
+        self.mirrors = mirrors or Mirrors()
+
+        # the pool of a host should not be smaller than the number of workers,
+        # otherwise connections are dropped
+        adapter = PoolAdapter(pool_connections, max(pool_maxsize, DEFAULT_POOLSIZE))
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
 
         self._session.max_redirects = MAX_REDIRECTS
-        self._session.headers.update({"user-agent": UserAgent().random})
+        self._session.headers.update({"user-agent": get_user_agent()})
         logger.debug("Session parameters %s", self._session.headers)
 
     def close_session(self) -> None:
         self._session.close()
         logger.debug("Session is closed".upper())
 
-    def get_response(self, url: URL, stream: bool = False) -> Response:
-        apply_delay(self.delay)
-        return self._make_request("get", url, stream=stream)
+    def get_response(
+        self,
+        url: URL,
+        stream: bool = False,
+        headers: dict[str, str] | None = None,
+        cache: bool = True,
+    ) -> Response:
+        """
+        Pages and API responses (not streams and not ranges) are cached. The responses with
+        the stream URLs are not (cache=False), the signed URLs expire sooner than the cache.
+        """
+
+        if stream or headers or not cache:
+            return self._make_request("get", url, stream=stream, headers=headers)
+        return self._get_cached_response(url)
+
+    def _get_cached_response(self, url: URL) -> Response:
+        """A fresh response is returned without the request, so the rate limit is not applied."""
+
+        cached = self.cache.get(url)
+        if cached is not None and cached.is_fresh:
+            logger.debug("Cached response for %s", url)
+            return _build_response(cached)
+
+        conditional_headers = cached.get_conditional_headers() if cached is not None else None
+        response = self._make_request("get", url, headers=conditional_headers)
+        if cached is not None and response.status_code == HTTPStatus.NOT_MODIFIED:
+            logger.debug("Cached response for %s is not modified", url)
+            return _build_response(self.cache.refresh(url, cached, response.headers))
+
+        if response.status_code == HTTPStatus.OK:
+            self.cache.store(
+                url, response.url, response.status_code, response.headers, response.content
+            )
+        return response
 
     @retry(
         reraise=True,
@@ -62,24 +183,90 @@ class Requester:
         before_sleep=log_retry,
     )
     def _make_request(self, method: Literal["get"], url: URL, **kwargs: Any) -> Response:
-        response = self._session.request(method, str(url), timeout=TIMEOUT, **kwargs)
-        self._raise_http_exception(response)
+        """
+        Every attempt goes to the mirrors of the host from the fastest one, the request which
+        failed on a mirror is sent to the next one at once.
+        """
+
+        candidates = self._get_candidates(url)
+        for candidate, fallback in zip(candidates, candidates[1:]):
+            try:
+                return self._send(method, candidate, **kwargs)
+            except MIRROR_ERRORS as e:
+                self.mirrors.observe(candidate, None)
+                logger.info("%s failed (%s), it is sent to %s", candidate, e, fallback.host)
+
+        return self._send(method, candidates[-1], **kwargs)
+
+    def _get_candidates(self, url: URL) -> list[URL]:
+        hosting = self.mirrors.get_hosting(url)
+        if hosting is None:
+            return [url]
+
+        if self.mirrors.claim_probe(hosting):
+            urls = self.mirrors.get_probe_urls(hosting, url)
+            with ThreadPoolExecutor(len(urls), "probe") as pool:
+                for probe_url, latency in zip(urls, pool.map(self._probe, urls)):
+                    self.mirrors.set_latency(probe_url, latency)
+            logger.info("Mirrors of %s: %s", hosting, self.mirrors.report(hosting))
+
+        return self.mirrors.get_candidates(url, self.health)
+
+    def _probe(self, url: URL) -> float | None:
+        """Seconds to the response headers of the mirror, None if it has not responded."""
+
+        started_at = perf_counter()
+        try:
+            response = self._session.head(str(url), timeout=MIRRORS_PROBE_TIMEOUT)
+        except RequestException as e:
+            logger.debug("Mirror %s is not available: %s", url.host, e)
+            return None
+
+        response.close()
+        return None if response.status_code in FAILURE_CODES else perf_counter() - started_at
+
+    def _send(self, method: Literal["get"], url: URL, **kwargs: Any) -> Response:
+        """The request to the host with the open circuit fails fast, it is not retried."""
+
+        host = get_host(url)
+        retry_in = self.health.admit(url)
+        if retry_in:
+            raise CircuitOpenError(host, retry_in)
+
+        self.rate_limiter.acquire(url)
+        started_at = perf_counter()
+        try:
+            response = self._session.request(method, str(url), timeout=TIMEOUT, **kwargs)
+        except RequestException as e:
+            REQUESTS.inc(host=host, status=type(e).__name__)
+            self.health.record(url, failed=isinstance(e, (ConnectionError, Timeout)))
+            raise
+
+        REQUESTS.inc(host=host, status=str(response.status_code))
+        self.health.record(url, failed=response.status_code in FAILURE_CODES)
+        ttfb = perf_counter() - started_at
+        TTFB.observe(ttfb, host=host)
+        self.mirrors.observe(url, ttfb)
+        self._raise_http_exception(url, response)
+        self.rate_limiter.speed_up(url)
         return response
 
-    @staticmethod
-    def _raise_http_exception(response: Response) -> None:
+    def _raise_http_exception(self, url: URL, response: Response) -> None:
         try:
             response.raise_for_status()
         except HTTPError as e:
             if e.response.status_code in RETRY_CODES:
-                if e.response.status_code == HTTPStatus.TOO_MANY_REQUESTS:
-                    sleep_time_until_retry = int(e.response.headers.get("retry-after", 0))
-                    apply_delay(sleep_time_until_retry)
+                retry_after = parse_retry_after(e.response.headers)
+                if e.response.status_code == HTTPStatus.TOO_MANY_REQUESTS or retry_after:
+                    self.rate_limiter.slow_down(url, retry_after)
 
                 error_message = str(e)
                 raise CustomHTTPError(error_message, **e.__dict__)  # unpacking for the parent class
             raise
 
+        if response.status_code == HTTPStatus.NOT_MODIFIED:
+            return  # the answer to the conditional request has no content
+
         if not response.headers.get("content-type"):
             logger.debug("HTTP response headers %s", response.headers)
             raise EmptyContentTypeError
@@ -95,3 +282,13 @@ class Requester:
     ) -> None:
         if self._session:
             self.close_session()
+
+
+def _build_response(cached: CachedResponse) -> Response:
+    response = Response()
+    response.status_code = cached.status
+    response.url = cached.url
+    response.headers = CaseInsensitiveDict(cached.headers)
+    response.encoding = get_encoding_from_headers(response.headers)
+    response._content = cached.content
+    return response
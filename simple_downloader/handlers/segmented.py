@@ -0,0 +1,316 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from http import HTTPStatus
+from logging import getLogger
+import os
+from pathlib import Path
+from threading import Lock
+from time import perf_counter
+from typing import Callable, Mapping
+
+from requests import ConnectionError, HTTPError, Response, Timeout
+from requests.exceptions import ChunkedEncodingError
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_exponential
+from tqdm import tqdm
+from yarl import URL
+
+from simple_downloader.config import (
+    BASE_CHUNK,
+    DEFAULT_CHUNK_MULTIPLIER,
+    HASH_ALGORITHM,
+    RETRY_STRATEGY,
+    SEGMENT_MIN_SIZE,
+    TOTAL_RETRIES,
+)
+from simple_downloader.core.exceptions import (
+    DeviceSpaceRunOutError,
+    FileOpenError,
+    NotEnoughSpaceError,
+    PartialContentError,
+    SegmentError,
+)
+from simple_downloader.core.logs import log_download, log_retry
+from simple_downloader.core.metrics import RECEIVED_BYTES, THROUGHPUT, get_host
+from simple_downloader.core.models import MediaFile
+from simple_downloader.core.tracing import span
+from simple_downloader.handlers import space
+from simple_downloader.handlers.chunks import ChunkSize, get_buffer, iter_chunks
+from simple_downloader.handlers.integrity import get_checksum
+from simple_downloader.handlers.partial import CONTENT_RANGE, PartialFile
+from simple_downloader.handlers.requester import Requester
+
+
+logger = getLogger(__name__)
+
+RANGE_NOT_SATISFIABLE = HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE
+
+
+@dataclass(slots=True)
+class Segment:
+    start: int
+    end: int  # inclusive, as in the "Range" header
+    received: int = 0
+    response: Response | None = field(default=None, repr=False)  # opened before the download
+
+    @property
+    def length(self) -> int:
+        return self.end - self.start + 1
+
+    @property
+    def is_complete(self) -> bool:
+        return self.received == self.length
+
+    def get_range_headers(self) -> dict[str, str]:
+        return {"range": f"bytes={self.start + self.received}-{self.end}"}
+
+    def pop_response(self) -> Response | None:
+        """Returns the response opened for the segment beforehand, it is used once."""
+
+        response, self.response = self.response, None
+        return response
+
+
+def download(
+    file: MediaFile,
+    save_path: Path,
+    http_client: Requester,
+    segments_number: int,
+    tqdm_params: Mapping,
+    chunk_multiplier: int = DEFAULT_CHUNK_MULTIPLIER,
+    hash_algorithm: str = HASH_ALGORITHM,
+) -> bool:
+    """
+    Downloads the file by several byte ranges at the same time over the shared session.
+
+    Every segment is written at its offset to the preallocated ".part" file and retried on its own.
+    The progress of the segments is kept in the sidecar, so the next attempt requests only
+    the rest of them. Returns False if the file cannot be split (no range support or the host
+    reports the size that is too small), then it should be downloaded by one stream.
+
+    No request is sent only to find out the size: the first segment is requested before the rest,
+    its response tells the size and if the server supports ranges. If the size is unknown, the
+    first request asks for the whole file and the response is read up to the end of the segment
+    (a small file is received by it as one segment).
+    """
+
+    if file.expected_size is not None and file.expected_size < SEGMENT_MIN_SIZE:
+        return False
+
+    partial = PartialFile(save_path.joinpath(str(file.filename)))
+    saved_segments = partial.get_segments() if partial.part_path.exists() else None
+    if saved_segments is not None:
+        segments = [Segment(start, end, received) for start, end, received in saved_segments]
+    elif file.expected_size is not None:
+        segments = _split(file.expected_size, segments_number)
+    else:
+        segments = []
+
+    try:
+        with span("connect", file.url, segments=segments_number):
+            response, size = _open(file.stream_url, http_client, segments)
+    except HTTPError as e:
+        if e.response is None or e.response.status_code != RANGE_NOT_SATISFIABLE:
+            raise
+
+        logger.debug('Range is not satisfiable, "%s" is downloaded by one stream', file.title)
+        partial.discard()  # e.g. the file is empty or has been cut on the server
+        return False
+    if size is None:
+        response.close()
+        return False
+
+    headers = response.headers
+    if saved_segments is not None and (
+        size != segments[-1].end + 1 or partial.get_segments(headers) is None
+    ):
+        saved_segments, segments = None, []  # the file has changed on the server
+    if saved_segments is None and (not segments or size != segments[-1].end + 1):
+        segments = _split(size, segments_number if size >= SEGMENT_MIN_SIZE else 1)
+    _attach(response, segments)
+
+    try:
+        _allocate(partial.part_path, size, saved_segments is None, file.title)
+    except BaseException:
+        _close(segments)
+        raise
+    partial.save_segments(headers, [[s.start, s.end, s.received] for s in segments])
+
+    lock = Lock()
+    received = sum(segment.received for segment in segments)
+    started_at = perf_counter()
+    with tqdm(desc=file.title, total=size, initial=received, **tqdm_params) as bar, span(
+        "transfer", file.url, offset=received, segments=len(segments)
+    ):
+
+        def update(chunk_size: int) -> None:
+            with lock:
+                bar.update(chunk_size)
+
+        pool = ThreadPoolExecutor(segments_number, "segment")
+        tasks = [
+            pool.submit(
+                _download_segment,
+                file.stream_url,
+                http_client,
+                partial.part_path,
+                segment,
+                update,
+                chunk_multiplier,
+            )
+            for segment in segments
+            if not segment.is_complete
+        ]
+        try:
+            for task in as_completed(tasks):
+                task.result()
+        finally:
+            pool.shutdown(cancel_futures=True)
+            _close(segments)
+            partial.save_segments(headers, [[s.start, s.end, s.received] for s in segments])
+
+    if not all(segment.is_complete for segment in segments) or partial.offset != size:
+        partial.discard()
+        raise SegmentError(file.title)
+
+    seconds = perf_counter() - started_at
+    if seconds:
+        THROUGHPUT.observe((size - received) / seconds, host=get_host(file.stream_url))
+
+    file.size = size
+    file.etag = headers.get("etag")
+    # segments are not received in order, so the file is read again
+    file.checksum = get_checksum(hash_algorithm, partial.get_hasher(size, hash_algorithm))
+    partial.complete(file)
+    file.mark_downloaded()
+    logger.info('Downloaded "%s" by %s segments', file.title, len(segments))
+    return True
+
+
+def _open(url: URL, http_client: Requester, segments: list[Segment]) -> tuple[Response, int | None]:
+    """
+    Requests the first incomplete segment (the whole file if the segments are not known yet).
+    Returns the response and the size of the file if the server supports ranges.
+    """
+
+    segment = next((segment for segment in segments if not segment.is_complete), None)
+    headers = segment.get_range_headers() if segment is not None else {"range": "bytes=0-"}
+    response = http_client.get_response(url, stream=True, headers=headers)
+    if response.status_code != HTTPStatus.PARTIAL_CONTENT:
+        return response, None
+
+    match = CONTENT_RANGE.fullmatch(response.headers.get("content-range", ""))
+    if match is None or match[3] == "*":
+        return response, None
+
+    return response, int(match[3])
+
+
+def _attach(response: Response, segments: list[Segment]) -> None:
+    """Gives the response to the segment it continues, otherwise it is closed."""
+
+    match = CONTENT_RANGE.fullmatch(response.headers.get("content-range", ""))
+    start = int(match[1]) if match is not None else None
+    for segment in segments:
+        if not segment.is_complete and segment.start + segment.received == start:
+            segment.response = response
+            return
+
+    response.close()
+
+
+def _close(segments: list[Segment]) -> None:
+    for segment in segments:
+        response = segment.pop_response()
+        if response is not None:
+            response.close()
+
+
+def _split(size: int, segments_number: int) -> list[Segment]:
+    length = -(-size // segments_number)  # ceil
+    return [Segment(start, min(start + length, size) - 1) for start in range(0, size, length)]
+
+
+def _allocate(path: Path, size: int, is_new: bool, title: str) -> None:
+    try:
+        bf_out = path.open("wb" if is_new else "r+b")
+    except OSError:
+        raise FileOpenError(path)
+
+    with bf_out:
+        try:
+            space.allocate(bf_out, path, size, title)
+        except NotEnoughSpaceError:
+            if is_new:
+                path.unlink(missing_ok=True)
+            raise
+
+        try:
+            bf_out.truncate(size)  # sparse if the blocks are not allocated
+        except OSError:
+            raise FileOpenError(path)
+
+
+@retry(
+    reraise=True,
+    stop=stop_after_attempt(TOTAL_RETRIES),
+    wait=wait_exponential(**RETRY_STRATEGY),
+    retry=retry_if_exception_type(ChunkedEncodingError),
+    before=log_download,
+    before_sleep=log_retry,
+)
+def _download_segment(
+    url: URL,
+    http_client: Requester,
+    path: Path,
+    segment: Segment,
+    update: Callable[[int], None],
+    chunk_multiplier: int,
+) -> None:
+    """
+    Writes the rest of the segment, a retry continues it from the last received byte.
+
+    Only the broken body is retried here, the request itself is retried by the requester.
+    """
+
+    stream = segment.pop_response() or http_client.get_response(
+        url, stream=True, headers=segment.get_range_headers()
+    )
+    with stream:
+        match = CONTENT_RANGE.fullmatch(stream.headers.get("content-range", ""))
+        if match is None or int(match[1]) != segment.start + segment.received:
+            raise PartialContentError(stream.headers.get("content-range"))
+
+        chunk_size = ChunkSize(BASE_CHUNK * chunk_multiplier)
+        remaining = segment.length - segment.received  # the server may send more
+        received = segment.received
+        fd = os.open(path, os.O_WRONLY | getattr(os, "O_BINARY", 0))
+        try:
+            for chunk in iter_chunks(
+                stream, get_buffer(), chunk_size, remaining, http_client.bandwidth
+            ):
+                try:
+                    _write_at(fd, chunk, segment.start + segment.received)
+                except OSError:
+                    raise DeviceSpaceRunOutError
+                else:
+                    segment.received += len(chunk)
+                    update(len(chunk))
+        except (ConnectionError, Timeout) as e:  # e.g. the read timeout
+            raise ChunkedEncodingError(e) from e
+        finally:
+            os.close(fd)
+            RECEIVED_BYTES.inc(segment.received - received, host=get_host(url))
+
+    if not segment.is_complete:
+        raise ChunkedEncodingError(f"Segment {segment} is not complete")
+
+
+def _write_at(fd: int, data: memoryview, offset: int) -> None:
+    view = memoryview(data)
+    while view:
+        if hasattr(os, "pwrite"):
+            written = os.pwrite(fd, view, offset)
+        else:  # Windows, every segment has its own descriptor
+            os.lseek(fd, offset, os.SEEK_SET)
+            written = os.write(fd, view)
+        view, offset = view[written:], offset + written
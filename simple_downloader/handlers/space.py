@@ -0,0 +1,88 @@
+import ctypes
+import errno
+from functools import cache
+from logging import getLogger
+import os
+from pathlib import Path
+from shutil import disk_usage
+import sys
+from threading import Lock
+from typing import BinaryIO, Callable
+
+from simple_downloader.config import DISK_SPACE_MARGIN
+from simple_downloader.core.exceptions import NotEnoughSpaceError
+
+
+logger = getLogger(__name__)
+
+BLOCK_SIZE = 512  # the unit of "st_blocks"
+FALLOC_FL_KEEP_SIZE = 0x01  # linux/falloc.h: the blocks are reserved, the file size is kept
+
+_lock = Lock()  # the free space is checked and taken by one file at a time
+
+
+def get_free_space(path: Path) -> int:
+    """The free space of the disk of the path (it may not exist yet) without the margin."""
+
+    existing = next(parent for parent in (path, *path.parents) if parent.exists())
+    return disk_usage(existing).free - DISK_SPACE_MARGIN
+
+
+def check(path: Path, size: int, title: str) -> None:
+    """Raises the error if the file (the rest of it) does not fit on the disk of the path."""
+
+    if size <= 0:
+        return
+
+    free = get_free_space(path)
+    if size > free:
+        raise NotEnoughSpaceError(title, size, max(free, 0))
+
+
+def allocate(bf_out: BinaryIO, path: Path, size: int, title: str) -> None:
+    """
+    Reserves the whole file on the disk before its content is written.
+
+    The free space is checked and the blocks are reserved under one lock, so the files downloaded
+    at the same time do not count on the same free space, and the reserved file is contiguous
+    (less fragmentation on hard disks). The blocks are reserved beyond the end of the file
+    (FALLOC_FL_KEEP_SIZE), the file size stays the received bytes even if the process is killed,
+    so the next attempt continues from them. Without fallocate() (not Linux, or not supported by
+    the disk) only the free space is checked, the file grows by the writes.
+    """
+
+    stat = os.fstat(bf_out.fileno())
+    allocated = stat.st_blocks * BLOCK_SIZE if hasattr(stat, "st_blocks") else stat.st_size
+
+    with _lock:
+        check(path, size - allocated, title)
+        if size <= allocated or (fallocate := _get_fallocate()) is None:
+            return
+
+        bf_out.flush()
+        if not fallocate(bf_out.fileno(), FALLOC_FL_KEEP_SIZE, 0, size):
+            return
+
+        error = ctypes.get_errno()
+        if error not in (errno.ENOSPC, errno.EDQUOT):  # e.g. not supported by the disk
+            logger.debug('File "%s" is not preallocated: %s', title, os.strerror(error))
+            return
+
+        raise NotEnoughSpaceError(title, size - allocated, max(get_free_space(path), 0))
+
+
+@cache
+def _get_fallocate() -> Callable[[int, int, int, int], int] | None:
+    """fallocate() of the C library, os.posix_fallocate() cannot keep the file size."""
+
+    if not sys.platform.startswith("linux"):
+        return None
+
+    try:
+        fallocate = ctypes.CDLL(None, use_errno=True).fallocate
+    except (OSError, AttributeError):
+        return None
+
+    fallocate.argtypes = (ctypes.c_int, ctypes.c_int, ctypes.c_int64, ctypes.c_int64)
+    fallocate.restype = ctypes.c_int
+    return fallocate
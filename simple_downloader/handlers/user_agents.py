@@ -0,0 +1,60 @@
+import json
+from logging import getLogger
+import os
+from pathlib import Path
+import random
+from threading import Lock
+from time import time
+
+from simple_downloader.config import USER_AGENTS_PATH, USER_AGENTS_SIZE, USER_AGENTS_TTL
+
+
+logger = getLogger(__name__)
+
+_pool: list[str] = []
+_pool_lock = Lock()
+
+
+def get_user_agent() -> str:
+    """
+    Returns a random user agent of a real browser.
+
+    The dataset of fake_useragent takes a noticeable part of the startup to load, so the sample
+    of it is kept in the file and fake_useragent is imported only when the sample is outdated.
+    """
+
+    with _pool_lock:
+        if not _pool:
+            _pool.extend(_load(USER_AGENTS_PATH) or _sample(USER_AGENTS_PATH))
+
+        return random.choice(_pool)
+
+
+def _load(path: Path) -> list[str] | None:
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+        if time() - data["sampled_at"] < USER_AGENTS_TTL and data["user_agents"]:
+            return data["user_agents"]
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        logger.debug("User agents are not loaded from %s: %s", path, e)
+
+    return None
+
+
+def _sample(path: Path) -> list[str]:
+    from fake_useragent import UserAgent
+
+    user_agent = UserAgent()
+    pool = list(dict.fromkeys(user_agent.random for _ in range(USER_AGENTS_SIZE)))
+
+    temporary = path.with_name(f"{path.name}.tmp")
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temporary.write_text(
+            json.dumps({"sampled_at": time(), "user_agents": pool}), encoding="utf-8"
+        )
+        os.replace(temporary, path)
+    except OSError as e:
+        logger.debug("User agents are not saved to %s: %s", path, e)
+
+    return pool
@@ -0,0 +1,474 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field, replace
+from functools import partial
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import count
+import json
+from logging import getLogger
+from pathlib import Path
+from queue import Empty, SimpleQueue
+from socketserver import ThreadingMixIn, UnixStreamServer
+from threading import Lock
+from time import time
+from typing import Any, Callable, Iterator, TypeAlias
+
+from yarl import URL
+
+from simple_downloader.config import (
+    JOBS_NAME,
+    SERVICE_KEEPALIVE,
+    SERVICE_TASKS_KEPT,
+)
+from simple_downloader.core.exceptions import DownloadError
+from simple_downloader.core.jobs import Job, JobState, get_queue
+from simple_downloader.core.metrics import REGISTRY
+from simple_downloader.core.models import Crawler, DownloadCounter, DownloadOptions
+from simple_downloader.core.utils import parse_rate
+from simple_downloader.handlers import factory
+from simple_downloader.handlers.cache import ResponseCache
+from simple_downloader.handlers.requester import Requester
+
+
+logger = getLogger(__name__)
+
+Event: TypeAlias = dict[str, Any]
+Process: TypeAlias = Callable[
+    [URL, Path, Crawler, Requester, DownloadCounter, ThreadPoolExecutor | None, DownloadOptions],
+    None,
+]
+FINISHED = (JobState.DONE, JobState.FAILED)
+
+
+@dataclass(slots=True)
+class Task:
+    """The URLs submitted by one request, they are downloaded one after another as by the CLI."""
+
+    id: int
+    urls: list[URL]
+    save_path: Path
+    state: JobState = JobState.PENDING
+    error: str | None = None
+    created_at: float = field(default_factory=time)
+    finished_at: float | None = None
+    counter: DownloadCounter = field(default_factory=DownloadCounter)
+    events: list[Event] = field(default_factory=list)  # replayed to the late subscribers
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "id": self.id,
+            "urls": [str(url) for url in self.urls],
+            "save_path": str(self.save_path),
+            "state": self.state,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "attempts": self.counter.attempts,
+            "successes": self.counter.successes,
+            "skips": self.counter.skips,
+            "links": self.counter.links,
+            "queued": self.counter.queued,
+            "failures": self.counter.failures,
+        }
+
+
+@dataclass(slots=True)
+class Subscriber:
+    task_id: int | None  # None - the events of all tasks
+    events: SimpleQueue[Event] = field(default_factory=SimpleQueue)
+
+
+class Service:
+    """
+    Runs the submitted tasks with the sessions, crawlers and caches kept between them.
+
+    The tasks are queued against one budget: the workers run the tasks and download the files
+    of their albums, and the limiter of the options restricts the downloads in total and per
+    hosting. Each hosting has one session, so its connections and cookies outlive the task.
+    Every change of the state of a task or of its file is published as an event.
+    """
+
+    def __init__(
+        self,
+        process: Process,
+        save_path: Path,
+        options: DownloadOptions,
+        workers: int,
+        cache: ResponseCache,
+    ) -> None:
+        self.process = process
+        self.save_path = save_path
+        self.options = options
+        self.workers = workers
+        self.cache = cache
+
+        self._tasks: dict[int, Task] = {}
+        self._ids = count(1)
+        self._subscribers: list[Subscriber] = []
+        self._sessions: dict[str, tuple[Requester, Crawler]] = {}
+        self._lock = Lock()
+
+        self._runner = ThreadPoolExecutor(workers, "task")
+        self._pool = ThreadPoolExecutor(workers, "download")
+
+    def submit(self, urls: list[URL], save_path: Path | None = None) -> Task:
+        """
+        Queues the task, raises ValueError (or CrawlerNotFound) if it cannot be run.
+
+        The save path of the task is relative to the save path of the service and cannot leave it
+        (an absolute path, "..", a symbolic link to another directory).
+        """
+
+        if not urls:
+            raise ValueError("Pass the URL or the list of URLs")
+        for url in urls:
+            if not url.is_absolute():
+                raise ValueError(f"URL is not absolute: {url}")
+            factory.get_hosting(url)
+
+        root = self.save_path.resolve()
+        save_path = root.joinpath(save_path or "").resolve()
+        if not save_path.is_relative_to(root):
+            raise ValueError(f'Save path "{save_path}" is outside of "{root}"')
+        if not save_path.is_dir():
+            raise ValueError(f'Save path "{save_path}" does not exist')
+
+        with self._lock:
+            task = Task(next(self._ids), urls, save_path)
+            self._tasks[task.id] = task
+            self._forget_tasks()
+
+        queue = get_queue(save_path.joinpath(JOBS_NAME))
+        if queue is not None:
+            queue.add(Job(url, save_path) for url in urls)
+
+        logger.info("Task %s is queued: %s", task.id, ", ".join(map(str, urls)))
+        self._set_state(task, JobState.PENDING)
+        self._runner.submit(self._run, task)
+        return task
+
+    def get_task(self, task_id: int) -> Task | None:
+        with self._lock:
+            return self._tasks.get(task_id)
+
+    def get_tasks(self) -> list[Task]:
+        with self._lock:
+            return list(self._tasks.values())
+
+    def get_status(self) -> dict[str, Any]:
+        with self._lock:
+            states = [task.state for task in self._tasks.values()]
+            hostings = list(self._sessions)
+
+        limiter = self.options.limiter
+        total, per_host = self.get_bandwidth()
+        health = self.options.health.get_report() if self.options.health is not None else []
+        return {
+            "tasks": {state: states.count(state) for state in JobState if state in states},
+            "workers": self.workers,
+            "per_host": limiter.per_host if limiter is not None else self.workers,
+            "bandwidth": {"total": total, "per_host": per_host},
+            "sessions": hostings,
+            "hosts": [asdict(report) for report in health],
+        }
+
+    @contextmanager
+    def subscribe(
+        self, task: Task | None = None
+    ) -> Iterator[tuple[list[Event], SimpleQueue[Event]]]:
+        """
+        Yields the past events of the task and the queue of its new events.
+
+        Without the task only the new events of all tasks are received.
+        """
+
+        subscriber = Subscriber(task.id if task is not None else None)
+        with self._lock:
+            history = list(task.events) if task is not None else []
+            self._subscribers.append(subscriber)
+
+        try:
+            yield history, subscriber.events
+        finally:
+            with self._lock:
+                self._subscribers.remove(subscriber)
+
+    def get_bandwidth(self) -> tuple[float | None, float | None]:
+        if self.options.bandwidth is None:
+            return None, None
+        return self.options.bandwidth.limits
+
+    def set_bandwidth(self, total: float | None, per_host: float | None) -> None:
+        """Changes the limits of all the transfers, including the running ones."""
+
+        if self.options.bandwidth is None:
+            raise ValueError("Bandwidth limiter is not enabled")
+        self.options.bandwidth.set_limits(total, per_host)
+
+    def close(self) -> None:
+        """The queued tasks are cancelled (they stay pending in the job queue), the running ones end."""
+
+        self._runner.shutdown(cancel_futures=True)
+        self._pool.shutdown(cancel_futures=True)
+        with self._lock:
+            for http_client, _ in self._sessions.values():
+                http_client.close_session()
+            self._sessions.clear()
+
+    def _run(self, task: Task) -> None:
+        self._set_state(task, JobState.DOWNLOADING)
+        options = replace(
+            self.options,
+            jobs_path=task.save_path.joinpath(JOBS_NAME),
+            listener=partial(self._on_file_state, task),
+        )
+
+        try:
+            for url in task.urls:
+                http_client, crawler = self._get_session(url)
+                self.process(
+                    url, task.save_path, crawler, http_client, task.counter, self._pool, options
+                )
+        except Exception as e:
+            # the errors of a file are handled by the process, this one stops all
+            logger.warning("Task %s failed: %s", task.id, e, exc_info=True)
+            self._set_state(task, JobState.FAILED, f"{type(e).__name__}: {e}")
+        else:
+            self._set_state(task, JobState.DONE)
+
+    def _get_session(self, url: URL) -> tuple[Requester, Crawler]:
+        hosting = factory.get_hosting(url)
+        with self._lock:
+            session = self._sessions.get(hosting)
+            if session is None:
+                http_client = Requester(
+                    pool_maxsize=self.options.connections or self.workers * self.options.segments,
+                    cache=self.cache,
+                    bandwidth=self.options.bandwidth,
+                    health=self.options.health,
+                    mirrors=self.options.mirrors,
+                )
+                session = self._sessions[hosting] = (
+                    http_client,
+                    factory.get_crawler(url, http_client),
+                )
+
+            return session
+
+    def _set_state(self, task: Task, state: JobState, error: str | None = None) -> None:
+        task.state, task.error = state, error
+        if state in FINISHED:
+            task.finished_at = time()
+            logger.info("Task %s is %s", task.id, state)
+
+        event = {"event": "task", **task.to_dict()}
+        self._publish(task, event)
+
+    def _on_file_state(
+        self, task: Task, url: URL, state: JobState, reason: str | None = None
+    ) -> None:
+        event = {"event": "file", "task": task.id, "url": str(url), "state": state}
+        if reason is not None:
+            event["reason"] = reason
+        self._publish(task, event)
+
+    def _publish(self, task: Task, event: Event) -> None:
+        event["time"] = round(time(), 3)
+        with self._lock:
+            task.events.append(event)
+            for subscriber in self._subscribers:
+                if subscriber.task_id in (None, task.id):
+                    subscriber.events.put(event)
+
+    def _forget_tasks(self) -> None:
+        finished = [task.id for task in self._tasks.values() if task.state in FINISHED]
+        for task_id in finished[: max(0, len(self._tasks) - SERVICE_TASKS_KEPT)]:
+            del self._tasks[task_id]
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    """
+    The API of the service.
+
+    POST /tasks             {"urls": [...], "save_path": "..."} (or "url"), the path is relative
+                            to the save path of the service
+    GET  /tasks             the states and counters of the tasks
+    GET  /tasks/<id>        the same for one task
+    GET  /tasks/<id>/events the events of the task (server-sent events) until it is finished
+    GET  /events            the new events of all tasks
+    GET  /status            the tasks by state, the limits, the sessions and the hosts health
+    GET  /bandwidth         the bandwidth limits in bytes per second (null - no limit)
+    PUT  /bandwidth         {"total": "300Mbit", "per_host": 6250000}, the omitted one is kept
+    GET  /metrics           the metrics in the Prometheus text format
+    """
+
+    server_version = "simple-downloader"
+
+    @property
+    def service(self) -> Service:
+        return self.server.service  # type: ignore[attr-defined]
+
+    def do_GET(self) -> None:
+        parts = URL(self.path).parts[1:]
+        match parts:
+            case ("tasks",):
+                self._send_json([task.to_dict() for task in self.service.get_tasks()])
+            case ("tasks", task_id) | ("tasks", task_id, "events"):
+                task = self.service.get_task(int(task_id)) if task_id.isdigit() else None
+                if task is None:
+                    self._send_error(HTTPStatus.NOT_FOUND, f"Task {task_id} is not found")
+                elif parts[-1] == "events":
+                    self._send_events(task)
+                else:
+                    self._send_json(task.to_dict())
+            case ("events",):
+                self._send_events(None)
+            case ("bandwidth",):
+                self._send_json(self._get_bandwidth())
+            case ("status",):
+                self._send_json(self.service.get_status())
+            case ("metrics",):
+                body = REGISTRY.render_prometheus().encode()
+                self._send(HTTPStatus.OK, body, "text/plain; version=0.0.4; charset=utf-8")
+            case _:
+                self._send_error(HTTPStatus.NOT_FOUND, f"Unknown path: {self.path}")
+
+    def do_POST(self) -> None:
+        if URL(self.path).parts[1:] != ("tasks",):
+            self._send_error(HTTPStatus.NOT_FOUND, f"Unknown path: {self.path}")
+            return
+
+        try:
+            body = self._read_json()
+            urls = body.get("urls") or ([body["url"]] if body.get("url") else [])
+            save_path = body.get("save_path")
+            task = self.service.submit(
+                [URL(url) for url in dict.fromkeys(urls)],
+                Path(save_path) if save_path else None,
+            )
+        except (ValueError, TypeError, AttributeError, DownloadError) as e:
+            self._send_error(HTTPStatus.BAD_REQUEST, str(e))
+            return
+
+        self._send_json(task.to_dict(), HTTPStatus.ACCEPTED, {"location": f"/tasks/{task.id}"})
+
+    def do_PUT(self) -> None:
+        if URL(self.path).parts[1:] != ("bandwidth",):
+            self._send_error(HTTPStatus.NOT_FOUND, f"Unknown path: {self.path}")
+            return
+
+        try:
+            body = self._read_json()
+            total, per_host = self.service.get_bandwidth()
+            self.service.set_bandwidth(
+                _parse_rate(body.get("total", total)), _parse_rate(body.get("per_host", per_host))
+            )
+        except (ValueError, TypeError, AttributeError) as e:
+            self._send_error(HTTPStatus.BAD_REQUEST, str(e))
+            return
+
+        self._send_json(self._get_bandwidth())
+
+    def log_message(self, format: str, *args: Any) -> None:
+        logger.debug(format, *args)
+
+    def _read_json(self) -> dict[str, Any]:
+        length = int(self.headers.get("content-length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        if not isinstance(body, dict):
+            raise ValueError("Pass the JSON object")
+        return body
+
+    def _get_bandwidth(self) -> dict[str, float | None]:
+        total, per_host = self.service.get_bandwidth()
+        return {"total": total, "per_host": per_host}
+
+    def _send_events(self, task: Task | None) -> None:
+        self.send_response(HTTPStatus.OK)
+        self.send_header("content-type", "text/event-stream")
+        self.send_header("cache-control", "no-cache")
+        self.end_headers()
+
+        try:
+            with self.service.subscribe(task) as (history, events):
+                for event in history:
+                    if self._write_event(event, task):
+                        return
+
+                while True:
+                    try:
+                        event = events.get(timeout=SERVICE_KEEPALIVE)
+                    except Empty:
+                        self.wfile.write(b": keepalive\n\n")  # it finds out the client is gone
+                        self.wfile.flush()
+                        continue
+
+                    if self._write_event(event, task):
+                        return
+        except (BrokenPipeError, ConnectionResetError):
+            logger.debug("Event stream is closed by the client")
+
+    def _write_event(self, event: Event, task: Task | None) -> bool:
+        """Writes the event and returns True if it is the last one of the task."""
+
+        data = json.dumps(event, ensure_ascii=False)
+        self.wfile.write(f"event: {event['event']}\ndata: {data}\n\n".encode())
+        self.wfile.flush()
+        return task is not None and event["event"] == "task" and event["state"] in FINISHED
+
+    def _send_json(
+        self,
+        data: Any,
+        status: HTTPStatus = HTTPStatus.OK,
+        headers: dict[str, str] | None = None,
+    ) -> None:
+        body = json.dumps(data, ensure_ascii=False).encode()
+        self._send(status, body, "application/json", headers)
+
+    def _send_error(self, status: HTTPStatus, message: str) -> None:
+        self._send_json({"error": message}, status)
+
+    def _send(
+        self,
+        status: HTTPStatus,
+        body: bytes,
+        content_type: str,
+        headers: dict[str, str] | None = None,
+    ) -> None:
+        self.send_response(status)
+        self.send_header("content-type", content_type)
+        self.send_header("content-length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class ServiceServer(ThreadingHTTPServer):
+    def __init__(self, address: tuple[str, int], service: Service) -> None:
+        super().__init__(address, ServiceHandler)
+        self.service = service
+
+
+class UnixServiceServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path: Path, service: Service) -> None:
+        if path.is_socket():
+            path.unlink()  # left by the service that was killed
+        super().__init__(str(path), ServiceHandler)
+        self.service = service
+        self.path = path
+
+    def server_close(self) -> None:
+        super().server_close()
+        self.path.unlink(missing_ok=True)
+
+
+def _parse_rate(value: str | float | None) -> float | None:
+    """The rate is either bytes per second or the string as in the CLI ("300Mbit")."""
+
+    if value is None or isinstance(value, int | float):
+        return value
+    return parse_rate(value)
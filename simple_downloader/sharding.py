@@ -0,0 +1,341 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from dataclasses import dataclass, replace
+from logging import getLogger
+from logging.handlers import QueueHandler, QueueListener
+import multiprocessing
+from multiprocessing.managers import BaseManager
+from pathlib import Path
+from queue import Empty
+import signal
+from threading import Condition
+from typing import Any, Callable, Literal, TypeAlias
+
+from simple_downloader.config import SHARDING_POLL_INTERVAL
+from simple_downloader.core.exceptions import DeviceSpaceRunOutError, WorkerError
+from simple_downloader.core.jobs import Job, close_queues
+from simple_downloader.core.manifest import close_manifests
+from simple_downloader.core.models import Crawler, DownloadCounter, DownloadOptions, Totals
+from simple_downloader.core.store import close_stores
+from simple_downloader.core.tracing import start_tracing, stop_tracing
+from simple_downloader.handlers import factory
+from simple_downloader.handlers.cache import ResponseCache
+from simple_downloader.handlers.health import DeferredJobs, HealthTracker
+from simple_downloader.handlers.rate_limiter import BandwidthLimiter, RateLimiter
+from simple_downloader.handlers.requester import Requester
+
+
+logger = getLogger(__name__)
+
+ShardBy: TypeAlias = Literal["album", "host"]
+
+
+class FileClaims:
+    """
+    The files being downloaded by the worker processes (by URL).
+
+    The same file is often in several albums. The worker which claims the file claimed by another
+    one waits until it is released, then the file is found by the manifest or the store.
+    The claims are kept with the PID of the worker, so the claims of the killed worker are released
+    by the main process (see collect()).
+    """
+
+    def __init__(self) -> None:
+        self._claimed: dict[str, int] = {}  # PID of the worker by the key
+        self._released = Condition()
+
+    def claim(self, key: str, owner: int) -> None:
+        with self._released:
+            self._released.wait_for(lambda: key not in self._claimed)
+            self._claimed[key] = owner
+
+    def release(self, key: str) -> None:
+        with self._released:
+            self._claimed.pop(key, None)
+            self._released.notify_all()
+
+    def release_owners(self, owners: set[int]) -> int:
+        """Releases all claims of the workers, returns their number."""
+
+        with self._released:
+            keys = [key for key, owner in self._claimed.items() if owner in owners]
+            for key in keys:
+                del self._claimed[key]
+            self._released.notify_all()
+
+        return len(keys)
+
+
+class Coordinator(BaseManager):
+    """
+    The process which keeps the state shared by the workers: the request rates and the circuits
+    of the hosts, the bandwidth and the claimed files. The workers call the objects by proxies.
+    """
+
+    RateLimiter: Callable[[], RateLimiter]
+    BandwidthLimiter: Callable[[float | None, float | None], BandwidthLimiter]
+    FileClaims: Callable[[], FileClaims]
+    HealthTracker: Callable[[], HealthTracker]
+
+
+Coordinator.register("RateLimiter", RateLimiter)
+Coordinator.register("BandwidthLimiter", BandwidthLimiter)
+Coordinator.register("FileClaims", FileClaims)
+Coordinator.register("HealthTracker", HealthTracker)
+
+
+@dataclass(frozen=True, slots=True)
+class WorkerSettings:
+    workers: int  # threads of each process
+    options: DownloadOptions
+    cache_ttl: float
+    cache_dir: Path | None
+    trace_file: Path | None
+
+
+@dataclass(frozen=True, slots=True)
+class WorkerResult:
+    totals: Totals
+    out_of_space: bool = False
+    error: str | None = None  # the unexpected error which stopped the worker
+
+
+def shard(groups: dict[str, list[Job]], by: ShardBy) -> list[list[Job]]:
+    """
+    Splits the jobs grouped by the hosting into the units of work of the processes.
+
+    A unit is taken by the free process, so the processes are loaded evenly. By album every
+    URL is a unit, by host all the URLs of the hosting are processed by one process.
+    """
+
+    if by == "host":
+        return list(groups.values())
+
+    return [[job] for jobs in groups.values() for job in jobs]
+
+
+def run_processes(
+    units: list[list[Job]],
+    processes: int,
+    settings: WorkerSettings,
+    counter: DownloadCounter,
+) -> None:
+    """
+    Runs the units of work by the worker processes and merges their counters into the counter.
+
+    Each worker keeps its own sessions of the hostings and defers its own jobs. The request
+    rates, the circuits of the hosts, the bandwidth and the claimed files are shared by
+    the coordinator, the logs are written by this process.
+    """
+
+    # "fork" would copy the threads of this process (e.g. the writer of the job queue)
+    context = multiprocessing.get_context("spawn")
+    coordinator = Coordinator(ctx=context)
+    coordinator.start(ignore_interrupt)  # it serves the workers until they finish the files
+    try:
+        options = settings.options
+        bandwidth = options.bandwidth.limits if options.bandwidth is not None else None
+        health = coordinator.HealthTracker()
+        shared = replace(
+            options,
+            rate_limiter=coordinator.RateLimiter(),
+            bandwidth=coordinator.BandwidthLimiter(*bandwidth) if bandwidth is not None else None,
+            claims=coordinator.FileClaims(),
+            health=health,
+            deferred=None,  # by each worker
+        )
+        collected, interrupted = start_workers(
+            context, units, processes, replace(settings, options=shared)
+        )
+        if options.health is not None:
+            options.health.merge(health.get_report())
+    finally:
+        coordinator.shutdown()
+
+    for result in collected:
+        counter.merge(result.totals)
+    if interrupted:
+        raise KeyboardInterrupt
+    if any(result.out_of_space for result in collected):
+        raise DeviceSpaceRunOutError
+    errors = [result.error for result in collected if result.error is not None]
+    if errors:
+        raise WorkerError(errors[0])
+
+
+def start_workers(
+    context: Any,
+    units: list[list[Job]],
+    processes: int,
+    settings: WorkerSettings,
+) -> tuple[list[WorkerResult], bool]:
+    """Returns the results of the workers and whether they were interrupted (Ctrl+C)."""
+
+    queue, results, logs = context.Queue(), context.Queue(), context.Queue()
+    stopped = context.Event()
+    for unit in units:
+        queue.put(unit)
+    for _ in range(processes):
+        queue.put(None)
+    queue.cancel_join_thread()  # the units left by the stopped workers are not needed
+
+    listener = QueueListener(logs, *getLogger("simple_downloader").handlers)
+    listener.start()
+    workers = [
+        context.Process(
+            target=work,
+            args=(queue, results, logs, stopped, settings),
+            name=f"worker-{index}",
+        )
+        for index in range(1, processes + 1)
+    ]
+    for worker in workers:
+        worker.start()
+    logger.info("%s units are sharded across %s processes", len(units), processes)
+
+    interrupted = False
+    try:
+        try:
+            collected = collect(results, workers, settings.options.claims)
+        except KeyboardInterrupt:  # the workers are interrupted too, they finish the running files
+            interrupted = True
+            stopped.set()
+            collected = collect(results, workers, settings.options.claims)
+    finally:
+        for worker in workers:
+            worker.join()
+        listener.stop()
+
+    return collected, interrupted
+
+
+def collect(
+    results: Any, workers: list[Any], claims: FileClaims | None = None
+) -> list[WorkerResult]:
+    """
+    Receives the result of every worker, the worker killed without the result is reported.
+    The files claimed by the exited worker are released, so other workers do not wait for them.
+    """
+
+    collected: list[WorkerResult] = []
+    exited: set[int] = set()
+    while len(collected) < len(workers):
+        if claims is not None:
+            _release_exited(claims, workers, exited)
+        try:
+            collected.append(results.get(timeout=SHARDING_POLL_INTERVAL))
+        except Empty:
+            if not any(worker.is_alive() for worker in workers) and results.empty():
+                break
+
+    lost = len(workers) - len(collected)
+    if lost:
+        logger.warning("%s worker processes exited without the results", lost)
+        totals = DownloadCounter().get_totals()
+        collected.append(WorkerResult(totals, error=f"{lost} workers exited"))
+
+    return collected
+
+
+def _release_exited(claims: FileClaims, workers: list[Any], exited: set[int]) -> None:
+    owners = {worker.pid for worker in workers if not worker.is_alive()} - exited
+    if owners:
+        exited.update(owners)
+        released = claims.release_owners(owners)
+        if released:
+            logger.warning("%s files claimed by the exited workers are released", released)
+
+
+def work(
+    queue: Any,
+    results: Any,
+    logs: Any,
+    stopped: Any,
+    settings: WorkerSettings,
+) -> None:
+    """The worker process takes the units until they are over or until another worker fails."""
+
+    # by the name: the module run by "python -m" is not imported by the spawned process
+    from simple_downloader.__main__ import retry_deferred, run_job
+
+    forward_logs(logs)
+    options = replace(settings.options, deferred=DeferredJobs())
+    counter = DownloadCounter()
+    out_of_space, error = False, None
+    sessions: dict[str, tuple[Requester, Crawler]] = {}
+
+    def get_session(job: Job) -> tuple[Requester, Crawler]:
+        hosting = factory.get_hosting(job.url)
+        session = sessions.get(hosting)
+        if session is None:
+            http_client = Requester(
+                settings.options.rate_limiter,
+                pool_maxsize=settings.options.connections
+                or settings.workers * settings.options.segments,
+                cache=cache,
+                bandwidth=settings.options.bandwidth,
+                health=settings.options.health,
+                mirrors=settings.options.mirrors,
+            )
+            session = sessions[hosting] = (http_client, factory.get_crawler(job.url, http_client))
+
+        return session
+
+    def run_jobs(jobs: list[Job], options: DownloadOptions) -> None:
+        for job in jobs:
+            http_client, crawler = get_session(job)
+            run_job(job, crawler, http_client, counter, pool, options)
+
+    def close_sessions() -> None:
+        for http_client, _ in sessions.values():
+            http_client.close_session()
+
+    try:
+        with ExitStack() as stack:  # closed in the reverse order, the pool is shut down first
+            for close in (close_manifests, close_stores, close_queues):
+                stack.callback(close)
+            cache = ResponseCache(settings.cache_ttl, directory=settings.cache_dir)
+            stack.callback(cache.close)
+            stack.callback(close_sessions)
+            if settings.options.storage is not None:
+                stack.callback(settings.options.storage.close)
+            if settings.trace_file is not None:
+                start_tracing(settings.trace_file)
+                stack.callback(stop_tracing)
+            pool = None
+            if settings.workers > 1:
+                pool = ThreadPoolExecutor(settings.workers, "download")
+                stack.callback(pool.shutdown, cancel_futures=True)
+
+            for unit in iter(queue.get, None):
+                if stopped.is_set():
+                    break
+                run_jobs(unit, options)
+            if not stopped.is_set():
+                retry_deferred(run_jobs, options)
+    except DeviceSpaceRunOutError as e:
+        logger.warning(e)
+        stopped.set()  # the other workers would fail on the same disk
+        out_of_space = True
+    except KeyboardInterrupt:
+        pass  # the main process reports it
+    except Exception as e:
+        logger.exception("Worker is stopped by an unexpected error")
+        stopped.set()
+        error = f"{type(e).__name__}: {e}"
+    finally:
+        results.put(WorkerResult(counter.get_totals(), out_of_space, error))
+
+
+def ignore_interrupt() -> None:
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def forward_logs(logs: Any) -> None:
+    """The records of the worker are written by the handlers of the main process (one log file)."""
+
+    package_logger = getLogger("simple_downloader")
+    for handler in package_logger.handlers[:]:
+        package_logger.removeHandler(handler)
+        handler.close()
+    package_logger.addHandler(QueueHandler(logs))
@@ -0,0 +1,29 @@
+from importlib import import_module
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from .local import LocalStorage
+    from .s3 import S3Storage
+    from .sftp import SftpStorage
+
+__all__ = [
+    "LocalStorage",
+    "S3Storage",
+    "SftpStorage",
+]
+
+MODULES = {
+    "LocalStorage": "local",
+    "S3Storage": "s3",
+    "SftpStorage": "sftp",
+}
+
+
+def __getattr__(name: str) -> Any:
+    """The storage is imported on the first use, so its client (boto3, paramiko) is loaded only if used."""
+
+    module = MODULES.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    return getattr(import_module(f".{module}", __name__), name)
@@ -0,0 +1,15 @@
+from dataclasses import dataclass
+from pathlib import Path
+
+from simple_downloader.core.models import Storage
+from simple_downloader.handlers.partial import PartialFile
+
+
+@dataclass(frozen=True, slots=True)
+class LocalStorage(Storage):
+    """The save path on the local disk, the default storage."""
+
+    is_local = True
+
+    def get_file(self, path: Path) -> PartialFile:
+        return PartialFile(path)
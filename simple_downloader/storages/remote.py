@@ -0,0 +1,131 @@
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from logging import getLogger
+from pathlib import Path, PurePosixPath
+from typing import Iterator, Mapping, Self
+
+from yarl import URL
+
+from simple_downloader.core.exceptions import IntegrityError
+from simple_downloader.core.models import MediaFile, Storage, StoredFile
+from simple_downloader.handlers.integrity import Hasher, get_checksum_file, new_hasher, verify
+
+
+logger = getLogger(__name__)
+
+
+class Upload(ABC):
+    """The content of one file sent to the storage while it is received."""
+
+    @abstractmethod
+    def write(self, data: bytes | memoryview) -> None: ...
+
+    @abstractmethod
+    def complete(self) -> None: ...
+
+    @abstractmethod
+    def abort(self) -> None: ...
+
+
+class RemoteStorage(Storage):
+    """
+    The storage which receives the files over the network.
+
+    A file is placed by its path relative to the save path, which keeps only the manifests
+    and the job queue on the local disk.
+    """
+
+    def __init__(self, root: Path, prefix: str) -> None:
+        self.root = root.absolute()
+        self.prefix = prefix
+
+    @classmethod
+    @abstractmethod
+    def from_url(cls, url: URL, root: Path) -> Self: ...
+
+    @abstractmethod
+    def upload(self, key: str, size: int | None) -> Upload: ...
+
+    @abstractmethod
+    def put(self, key: str, content: bytes) -> None:
+        """Saves the small file (e.g. the checksum) by one request."""
+
+    def get_file(self, path: Path) -> "RemoteFile":
+        return RemoteFile(self, path)
+
+    def get_key(self, path: Path) -> str:
+        path = path.absolute()
+        parts = (
+            path.relative_to(self.root).parts if path.is_relative_to(self.root) else path.parts[1:]
+        )
+        return str(PurePosixPath(self.prefix, *parts))
+
+
+class RemoteFile(StoredFile):
+    """
+    The file uploaded to the remote storage while it is downloaded.
+
+    Nothing is kept on the local disk, so the download is not continued by the retry, the file is
+    uploaded again. The upload is aborted if the download fails or ends short, and completed only
+    after the file is verified, so a broken file does not appear in the storage.
+    """
+
+    def __init__(self, storage: RemoteStorage, path: Path) -> None:
+        self.storage = storage
+        self.path = path
+        self._upload: Upload | None = None
+        self._written = 0
+
+    @property
+    def offset(self) -> int:
+        return self._written
+
+    def get_range_headers(self) -> dict[str, str]:
+        return {}
+
+    def get_resume_offset(self, status_code: int, headers: Mapping[str, str]) -> int:
+        return 0
+
+    def get_hasher(self, offset: int, algorithm: str) -> Hasher:
+        return new_hasher(algorithm)
+
+    @contextmanager
+    def writing(self, offset: int, length: int | None, title: str) -> Iterator[Self]:
+        self.discard()  # the upload of the previous attempt
+        self._upload = self.storage.upload(self.storage.get_key(self.path), length)
+        self._written = 0
+        try:
+            yield self
+        except BaseException:
+            self.discard()
+            raise
+
+        if length is not None and self._written != length:
+            self.discard()
+
+    def write(self, data: bytes | memoryview) -> None:
+        assert self._upload is not None
+
+        self._upload.write(data)
+        self._written += len(data)
+
+    def complete(self, file: MediaFile) -> None:
+        assert self._upload is not None
+
+        try:
+            verify(file)
+        except IntegrityError:
+            self.discard()
+            raise
+
+        upload, self._upload = self._upload, None
+        upload.complete()
+        if file.checksum is not None:
+            checksum_path, line = get_checksum_file(self.path, file.checksum)
+            self.storage.put(self.storage.get_key(checksum_path), line.encode())
+        logger.debug('File "%s" is uploaded', self.storage.get_key(self.path))
+
+    def discard(self) -> None:
+        upload, self._upload = self._upload, None
+        if upload is not None:
+            upload.abort()
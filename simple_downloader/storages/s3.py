@@ -0,0 +1,197 @@
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from logging import getLogger
+from pathlib import Path
+from threading import Lock, Semaphore
+from typing import Any, Self
+
+import boto3
+from botocore.config import Config
+from botocore.exceptions import BotoCoreError, ClientError
+from yarl import URL
+
+from simple_downloader.config import (
+    S3_MAX_PARTS,
+    S3_PARTS_IN_FLIGHT,
+    S3_PART_SIZE,
+    S3_UPLOAD_THREADS,
+)
+from simple_downloader.core.exceptions import StorageError
+from simple_downloader.storages.remote import RemoteStorage, Upload
+
+
+logger = getLogger(__name__)
+
+
+class S3Storage(RemoteStorage):
+    """
+    The bucket of S3 or of a compatible storage (MinIO, Ceph, R2).
+
+    The endpoint, the region and the credentials are taken from the configuration of boto3
+    (e.g. AWS_ENDPOINT_URL, AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY) unless they are passed.
+    The parts of all the files are uploaded by the threads of the storage, the failed requests
+    are retried by botocore.
+    """
+
+    def __init__(
+        self,
+        bucket: str,
+        prefix: str = "",
+        root: Path = Path(),
+        endpoint_url: str | None = None,
+        part_size: int = S3_PART_SIZE,
+        threads: int = S3_UPLOAD_THREADS,
+        parts_in_flight: int = S3_PARTS_IN_FLIGHT,
+    ) -> None:
+        super().__init__(root, prefix.strip("/"))
+        self.bucket = bucket
+        self.endpoint_url = endpoint_url
+        self.part_size = part_size
+        self.threads = threads
+        self.parts_in_flight = parts_in_flight
+
+        self._client: Any = None
+        self._pool: ThreadPoolExecutor | None = None
+        self._lock = Lock()
+
+    def __reduce__(self) -> tuple[Any, ...]:
+        return S3Storage, (
+            self.bucket,
+            self.prefix,
+            self.root,
+            self.endpoint_url,
+            self.part_size,
+            self.threads,
+            self.parts_in_flight,
+        )  # each process has its own client
+
+    @classmethod
+    def from_url(cls, url: URL, root: Path) -> Self:
+        """s3://bucket/prefix"""
+
+        if not url.host:
+            raise ValueError(f"Bucket is not specified: {url}")
+        return cls(url.host, url.path, root)
+
+    @property
+    def client(self) -> Any:
+        with self._lock:
+            if self._client is None:
+                self._client = boto3.client(
+                    "s3",
+                    endpoint_url=self.endpoint_url,
+                    config=Config(max_pool_connections=self.threads + 2),  # and the small requests
+                )
+
+            return self._client
+
+    @property
+    def pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(self.threads, "upload")
+
+            return self._pool
+
+    def upload(self, key: str, size: int | None) -> "S3Upload":
+        part_size = self.part_size
+        if size is not None:
+            part_size = max(part_size, -(-size // S3_MAX_PARTS))  # ceil
+        return S3Upload(self, key, part_size)
+
+    def put(self, key: str, content: bytes) -> None:
+        self.call("put_object", key, Body=content)
+
+    def call(self, method: str, key: str, **kwargs: Any) -> Any:
+        try:
+            return getattr(self.client, method)(Bucket=self.bucket, Key=key, **kwargs)
+        except (BotoCoreError, ClientError) as e:
+            raise StorageError(key, str(e))
+
+    def close(self) -> None:
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+            if self._client is not None:
+                self._client.close()
+            self._pool = self._client = None
+
+
+class S3Upload(Upload):
+    """
+    The multipart upload of one file.
+
+    The received content is cut into parts, and every part is uploaded by the pool of the storage
+    while the next one is received. When the parts in flight (waiting for the pool or being sent)
+    reach the limit, the download waits for them, so the memory of one file is bounded by
+    (parts in flight + 1) * part size. A file smaller than a part is sent by one request.
+    """
+
+    def __init__(self, storage: S3Storage, key: str, part_size: int) -> None:
+        self.storage = storage
+        self.key = key
+        self.part_size = part_size
+
+        self._buffer = bytearray()
+        self._upload_id: str | None = None
+        self._parts: list[Future[dict[str, Any]]] = []
+        self._slots = Semaphore(storage.parts_in_flight)
+
+    def write(self, data: bytes | memoryview) -> None:
+        self._buffer += data
+        while len(self._buffer) >= self.part_size:
+            part = bytes(self._buffer[: self.part_size])
+            del self._buffer[: self.part_size]
+            self._send(part)
+
+    def complete(self) -> None:
+        if self._upload_id is None:
+            self.storage.put(self.key, bytes(self._buffer))
+            return
+
+        try:
+            if self._buffer:
+                self._send(bytes(self._buffer))  # the last part may be smaller
+            parts = [part.result() for part in self._parts]
+            self.storage.call(
+                "complete_multipart_upload",
+                self.key,
+                UploadId=self._upload_id,
+                MultipartUpload={"Parts": parts},
+            )
+        except BaseException:
+            self.abort()
+            raise
+
+    def abort(self) -> None:
+        for part in self._parts:
+            part.cancel()
+        wait(self._parts)  # the part sent after the abort would be kept by the storage
+
+        upload_id, self._upload_id = self._upload_id, None
+        if upload_id is None:
+            return
+
+        try:
+            self.storage.call("abort_multipart_upload", self.key, UploadId=upload_id)
+        except StorageError as e:
+            logger.warning("Upload is not aborted, its parts are kept by the storage: %s", e)
+
+    def _send(self, part: bytes) -> None:
+        if self._upload_id is None:
+            self._upload_id = self.storage.call("create_multipart_upload", self.key)["UploadId"]
+
+        for sent in self._parts:  # the failed part stops the download at once
+            if sent.done() and not sent.cancelled() and sent.exception() is not None:
+                sent.result()
+
+        self._slots.acquire()
+        number = len(self._parts) + 1
+        task = self.storage.pool.submit(self._upload_part, number, part)
+        task.add_done_callback(lambda _: self._slots.release())
+        self._parts.append(task)
+
+    def _upload_part(self, number: int, part: bytes) -> dict[str, Any]:
+        response = self.storage.call(
+            "upload_part", self.key, UploadId=self._upload_id, PartNumber=number, Body=part
+        )
+        return {"ETag": response["ETag"], "PartNumber": number}
@@ -0,0 +1,26 @@
+from time import monotonic
+
+import pytest
+
+
+class Clock:
+    """The monotonic clock of the tests, the time passes only when the test moves it."""
+
+    def __init__(self) -> None:
+        # later than the real clock, so the timestamps taken before the patch are in the past
+        self.now = monotonic() + 3600
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float) -> None:
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch: pytest.MonkeyPatch) -> Clock:
+    clock = Clock()
+    for module in ("rate_limiter", "health", "mirrors"):
+        monkeypatch.setattr(f"simple_downloader.handlers.{module}.monotonic", clock)
+
+    return clock
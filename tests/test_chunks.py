@@ -0,0 +1,89 @@
+from io import BytesIO
+
+import pytest
+from requests import Response
+from requests.exceptions import ChunkedEncodingError
+from urllib3 import HTTPResponse
+from urllib3.exceptions import ProtocolError
+
+from simple_downloader.handlers.chunks import ChunkSize, get_buffer, iter_chunks
+
+
+def make_response(raw: object) -> Response:
+    response = Response()
+    response.raw = raw
+    response.url = "https://a.example/file"
+    return response
+
+
+class BrokenStream(BytesIO):
+    def read(self, size: int | None = -1) -> bytes:
+        raise ProtocolError("Connection broken")
+
+
+def test_size_is_doubled_by_fast_reads_up_to_maximum() -> None:
+    chunk_size = ChunkSize(1024, maximum=4096, read_time=0.1)
+
+    sizes = []
+    for _ in range(4):
+        chunk_size.update(chunk_size.size, 0.01)
+        sizes.append(chunk_size.size)
+
+    assert sizes == [2048, 4096, 4096, 4096]
+
+
+def test_size_is_kept_by_short_or_normal_reads() -> None:
+    chunk_size = ChunkSize(1024, maximum=4096, read_time=0.1)
+
+    chunk_size.update(512, 0.01)  # the end of the stream, the buffer is not filled
+    chunk_size.update(1024, 0.1)
+
+    assert chunk_size.size == 1024
+
+
+def test_size_is_halved_by_slow_reads_down_to_initial() -> None:
+    chunk_size = ChunkSize(1024, maximum=8192, read_time=0.1)
+    chunk_size.update(1024, 0.01)
+    chunk_size.update(2048, 0.01)
+
+    sizes = []
+    for _ in range(3):
+        chunk_size.update(chunk_size.size, 0.5)
+        sizes.append(chunk_size.size)
+
+    assert sizes == [2048, 1024, 1024]
+
+
+def test_initial_size_is_not_above_maximum() -> None:
+    assert ChunkSize(8192, maximum=4096).size == 4096
+
+
+def test_chunks_are_read_into_the_buffer() -> None:
+    data = bytes(range(256)) * 40
+    response = make_response(HTTPResponse(BytesIO(data), preload_content=False))
+    buffer = get_buffer()
+
+    chunk_size = ChunkSize(1000, maximum=2000)
+
+    chunks = [bytes(chunk) for chunk in iter_chunks(response, buffer, chunk_size)]
+
+    assert b"".join(chunks) == data
+    assert all(len(chunk) <= 2000 for chunk in chunks)
+
+
+def test_reading_stops_at_limit() -> None:
+    data = bytes(10_000)
+    response = make_response(HTTPResponse(BytesIO(data), preload_content=False))
+
+    received = sum(
+        len(chunk) for chunk in iter_chunks(response, get_buffer(), ChunkSize(3000), 4500)
+    )
+
+    assert received == 4500
+
+
+def test_broken_stream_raises_as_iter_content() -> None:
+    response = make_response(HTTPResponse(BrokenStream(), preload_content=False))
+
+    with pytest.raises(ChunkedEncodingError):
+        list(iter_chunks(response, get_buffer(), ChunkSize(1000)))
@@ -0,0 +1,123 @@
+from pathlib import Path
+
+import pytest
+from yarl import URL
+
+from simple_downloader.core.jobs import Job
+from simple_downloader.handlers.health import DeferredJobs, HealthTracker
+
+from conftest import Clock
+
+
+URL_A = URL("https://a.example/file")
+URL_B = URL("https://b.example/file")
+
+
+@pytest.fixture
+def health(clock: Clock) -> HealthTracker:
+    return HealthTracker(threshold=3, cooldown=30, max_cooldown=100, window=4)
+
+
+def fail(health: HealthTracker, url: URL, times: int) -> None:
+    for _ in range(times):
+        health.record(url, failed=True)
+
+
+def test_healthy_host_is_admitted(health: HealthTracker) -> None:
+    fail(health, URL_A, 2)
+
+    assert health.admit(URL_A) == 0
+    assert not health.is_open(URL_A)
+
+
+def test_circuit_is_opened_by_failures_in_row(health: HealthTracker, clock: Clock) -> None:
+    fail(health, URL_A, 3)
+    clock.advance(10)
+
+    assert health.is_open(URL_A)
+    assert health.admit(URL_A) == pytest.approx(20)
+    assert health.admit(URL_B) == 0
+
+
+def test_success_resets_failures_in_row(health: HealthTracker) -> None:
+    fail(health, URL_A, 2)
+    health.record(URL_A, failed=False)
+    fail(health, URL_A, 2)
+
+    assert not health.is_open(URL_A)
+
+
+def test_one_request_probes_host_after_cooldown(health: HealthTracker, clock: Clock) -> None:
+    fail(health, URL_A, 3)
+    clock.advance(30)
+
+    assert not health.is_open(URL_A)
+    assert health.admit(URL_A) == 0  # the probe
+    assert health.admit(URL_A) == pytest.approx(30)  # the others wait for its result
+
+
+def test_successful_probe_closes_circuit(health: HealthTracker, clock: Clock) -> None:
+    fail(health, URL_A, 3)
+    clock.advance(30)
+    health.admit(URL_A)
+
+    health.record(URL_A, failed=False)
+
+    assert health.admit(URL_A) == 0
+    assert health.get_report()[0].state == "closed"
+
+
+def test_failed_probe_doubles_cooldown_up_to_maximum(health: HealthTracker, clock: Clock) -> None:
+    fail(health, URL_A, 3)
+
+    cooldowns = []
+    for _ in range(3):
+        clock.advance(health.admit(URL_A))
+        health.admit(URL_A)
+        health.record(URL_A, failed=True)
+        cooldowns.append(health.admit(URL_A))
+
+    assert cooldowns == [pytest.approx(60), pytest.approx(100), pytest.approx(100)]
+
+
+def test_lost_probe_is_repeated_after_cooldown(health: HealthTracker, clock: Clock) -> None:
+    fail(health, URL_A, 3)
+    clock.advance(30)
+    health.admit(URL_A)  # the probe, its result is never recorded
+
+    clock.advance(30)
+
+    assert health.admit(URL_A) == 0
+
+
+def test_report_has_error_rate_of_window(health: HealthTracker) -> None:
+    fail(health, URL_A, 1)
+    for _ in range(3):
+        health.record(URL_A, failed=False)
+    health.record(URL_A, failed=False)  # the first failure leaves the window
+
+    (report,) = health.get_report()
+
+    assert (report.host, report.requests, report.failures) == ("a.example", 5, 1)
+    assert report.error_rate == 0
+    assert report.trips == 0
+
+
+def test_merged_report_is_added(health: HealthTracker) -> None:
+    other = HealthTracker()
+    fail(other, URL_B, 1)
+
+    health.merge(other.get_report())
+
+    assert [report.host for report in health.get_report()] == ["b.example"]
+
+
+def test_deferred_jobs_are_taken_when_ready(clock: Clock) -> None:
+    deferred = DeferredJobs()
+    jobs = [Job(URL_A, Path("a")), Job(URL_B, Path("b"))]
+    deferred.add(jobs[0], 30)
+    deferred.add(jobs[1], 10)
+    clock.advance(5)
+
+    assert deferred.take() == (jobs, pytest.approx(25))
+    assert deferred.take() == ([], 0)
@@ -0,0 +1,128 @@
+from pathlib import Path
+from time import sleep
+from typing import Iterator
+
+import pytest
+from yarl import URL
+
+from simple_downloader.core.jobs import Job, JobQueue, JobState
+
+
+ALBUM = URL("https://a.example/a/album")
+FILES = [URL(f"https://a.example/f/{index}") for index in range(3)]
+FILE = URL("https://a.example/f/single")
+
+
+@pytest.fixture
+def path(tmp_path: Path) -> Path:
+    return tmp_path.joinpath(".jobs.sqlite3")
+
+
+@pytest.fixture
+def queue(path: Path) -> Iterator[JobQueue]:
+    queue = JobQueue(path, flush_interval=60)
+    yield queue
+    queue.close()
+
+
+def get_urls(jobs: list[Job]) -> list[URL]:
+    return [job.url for job in jobs]
+
+
+def test_requested_urls_are_returned_in_order(queue: JobQueue, tmp_path: Path) -> None:
+    queue.add([Job(FILE, tmp_path), Job(ALBUM, tmp_path)])
+
+    jobs = queue.get_jobs()
+
+    assert jobs == [Job(FILE, tmp_path), Job(ALBUM, tmp_path)]
+
+
+def test_finished_urls_are_not_returned(queue: JobQueue, tmp_path: Path) -> None:
+    queue.add([Job(FILE, tmp_path), Job(ALBUM, tmp_path)])
+
+    queue.update(FILE, tmp_path, JobState.DONE)
+    queue.update(ALBUM, tmp_path, JobState.FAILED, "HTTPError: 404")
+
+    assert get_urls(queue.get_jobs()) == [ALBUM]
+
+
+def test_url_requested_again_is_pending(queue: JobQueue, tmp_path: Path) -> None:
+    queue.add([Job(FILE, tmp_path)])
+    queue.update(FILE, tmp_path, JobState.DONE)
+
+    queue.add([Job(FILE, tmp_path)])
+
+    assert get_urls(queue.get_jobs()) == [FILE]
+
+
+def test_expanded_album_is_returned_with_rest_of_files(queue: JobQueue, tmp_path: Path) -> None:
+    album_path = tmp_path.joinpath("Album")
+    queue.add([Job(ALBUM, tmp_path)])
+    queue.expand(ALBUM, album_path, FILES)
+    queue.update(FILES[1], album_path, JobState.DONE)
+
+    (job,) = queue.get_jobs()
+
+    assert job.url == ALBUM
+    assert job.save_path == tmp_path
+    assert job.album is not None
+    assert job.album.title == "Album"
+    assert list(job.album.file_urls) == [FILES[0], FILES[2]]
+
+
+def test_album_is_finished_with_its_files(queue: JobQueue, tmp_path: Path) -> None:
+    album_path = tmp_path.joinpath("Album")
+    queue.add([Job(ALBUM, tmp_path)])
+    queue.expand(ALBUM, album_path, FILES)
+    for url in FILES:
+        queue.update(url, album_path, JobState.DONE)
+    queue.update(ALBUM, tmp_path, JobState.DONE)
+
+    assert queue.get_jobs() == []
+
+
+def test_buffered_state_does_not_overwrite_expansion(queue: JobQueue, tmp_path: Path) -> None:
+    queue.add([Job(ALBUM, tmp_path)])
+    queue.update(ALBUM, tmp_path, JobState.RESOLVING)  # buffered, not written yet
+
+    queue.expand(ALBUM, tmp_path.joinpath("Album"), FILES)
+
+    (job,) = queue.get_jobs()
+    assert job.album is not None
+
+
+def test_states_are_kept_after_restart(path: Path, tmp_path: Path) -> None:
+    album_path = tmp_path.joinpath("Album")
+    queue = JobQueue(path, flush_interval=60)
+    queue.add([Job(FILE, tmp_path), Job(ALBUM, tmp_path)])
+    queue.expand(ALBUM, album_path, FILES)
+    queue.update(FILE, tmp_path, JobState.DONE)
+    queue.update(FILES[0], album_path, JobState.DONE)
+    queue.close()  # the buffered states are written
+
+    restarted = JobQueue(path, flush_interval=60)
+    try:
+        (job,) = restarted.get_jobs()
+    finally:
+        restarted.close()
+
+    assert job.album is not None
+    assert list(job.album.file_urls) == FILES[1:]
+
+
+def test_states_are_written_by_batch(queue: JobQueue, path: Path, tmp_path: Path) -> None:
+    queue.batch_size = 2
+    queue.add([Job(url, tmp_path) for url in FILES])
+
+    queue.update(FILES[0], tmp_path, JobState.DONE)
+    queue.update(FILES[1], tmp_path, JobState.DONE)  # the batch is full, the writer is woken
+
+    reader = JobQueue(path, flush_interval=60)
+    try:
+        for _ in range(100):
+            if get_urls(reader.get_jobs()) == FILES[2:]:
+                break
+            sleep(0.01)  # the writer is the background thread
+        assert get_urls(reader.get_jobs()) == FILES[2:]
+    finally:
+        reader.close()
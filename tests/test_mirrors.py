@@ -0,0 +1,112 @@
+import pytest
+from yarl import URL
+
+from simple_downloader.handlers.health import HealthTracker
+from simple_downloader.handlers.mirrors import Mirrors
+
+from conftest import Clock
+
+
+DOMAINS = {"bunkr": ("bunkr.si", "bunkr.la", "bunkr.su"), "single": ("single.example",)}
+
+
+@pytest.fixture
+def mirrors() -> Mirrors:
+    return Mirrors(DOMAINS, probe_ttl=600, smoothing=0.5)
+
+
+@pytest.fixture
+def health(clock: Clock) -> HealthTracker:
+    return HealthTracker(threshold=1)
+
+
+def get_hosts(candidates: list[URL]) -> list[str | None]:
+    return [candidate.host for candidate in candidates]
+
+
+@pytest.mark.parametrize(
+    "url", ["https://other.example/a/1", "https://single.example/a/1", "https://notbunkr.si/a/1"]
+)
+def test_url_without_mirrors_is_the_only_candidate(
+    mirrors: Mirrors, health: HealthTracker, url: str
+) -> None:
+    assert mirrors.get_candidates(URL(url), health) == [URL(url)]
+
+
+def test_requested_host_is_first_until_measured(mirrors: Mirrors, health: HealthTracker) -> None:
+    candidates = mirrors.get_candidates(URL("https://bunkr.la/a/1"), health)
+
+    assert get_hosts(candidates) == ["bunkr.la", "bunkr.si", "bunkr.su"]
+
+
+def test_url_is_kept_on_every_mirror(mirrors: Mirrors, health: HealthTracker) -> None:
+    url = URL("https://cdn9.bunkr.la/v/file.mp4?n=1")
+
+    candidates = mirrors.get_candidates(url, health)
+
+    assert candidates == [
+        url,
+        URL("https://cdn9.bunkr.si/v/file.mp4?n=1"),
+        URL("https://cdn9.bunkr.su/v/file.mp4?n=1"),
+    ]
+
+
+def test_fastest_host_is_first(mirrors: Mirrors, health: HealthTracker) -> None:
+    mirrors.set_latency(URL("https://bunkr.si/"), 0.3)
+    mirrors.set_latency(URL("https://bunkr.su/"), 0.1)
+
+    candidates = mirrors.get_candidates(URL("https://bunkr.la/a/1"), health)
+
+    assert get_hosts(candidates) == ["bunkr.su", "bunkr.si", "bunkr.la"]
+
+
+def test_failed_host_is_last(mirrors: Mirrors, health: HealthTracker) -> None:
+    mirrors.set_latency(URL("https://bunkr.la/"), None)
+
+    candidates = mirrors.get_candidates(URL("https://bunkr.la/a/1"), health)
+
+    assert get_hosts(candidates) == ["bunkr.si", "bunkr.su", "bunkr.la"]
+
+
+def test_host_with_open_circuit_is_last(mirrors: Mirrors, health: HealthTracker) -> None:
+    mirrors.set_latency(URL("https://bunkr.si/"), 0.1)
+    mirrors.set_latency(URL("https://bunkr.su/"), 0.2)
+    health.record(URL("https://bunkr.si/a/1"), failed=True)
+
+    candidates = mirrors.get_candidates(URL("https://bunkr.la/a/1"), health)
+
+    assert get_hosts(candidates) == ["bunkr.su", "bunkr.la", "bunkr.si"]
+
+
+def test_latency_follows_response_times(mirrors: Mirrors) -> None:
+    url = URL("https://bunkr.si/a/1")
+
+    mirrors.observe(url, 0.4)
+    mirrors.observe(url, 0.2)
+
+    assert mirrors.report("bunkr").startswith("bunkr.si 300ms")
+
+
+def test_failed_request_resets_latency(mirrors: Mirrors) -> None:
+    url = URL("https://bunkr.si/a/1")
+    mirrors.observe(url, 0.4)
+
+    mirrors.observe(url, None)
+    mirrors.observe(url, 0.2)
+
+    assert mirrors.report("bunkr").startswith("bunkr.si 200ms")
+
+
+def test_mirrors_are_probed_once_per_ttl(mirrors: Mirrors, clock: Clock) -> None:
+    assert mirrors.claim_probe("bunkr")
+    assert not mirrors.claim_probe("bunkr")
+
+    clock.advance(600)
+
+    assert mirrors.claim_probe("bunkr")
+
+
+def test_probe_urls_are_roots_of_domains(mirrors: Mirrors) -> None:
+    urls = mirrors.get_probe_urls("bunkr", URL("http://cdn9.bunkr.la:8080/v/file.mp4"))
+
+    assert urls == [URL(f"http://{domain}:8080/") for domain in DOMAINS["bunkr"]]
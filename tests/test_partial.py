@@ -0,0 +1,156 @@
+import json
+import os
+from pathlib import Path
+
+import pytest
+from yarl import URL
+
+from simple_downloader.core.exceptions import IntegrityError, PartialContentError
+from simple_downloader.core.models import MediaFile
+from simple_downloader.core.parsing import parse_filename
+from simple_downloader.handlers.integrity import get_checksum, new_hasher
+from simple_downloader.handlers.partial import PartialFile
+
+
+@pytest.fixture
+def partial(tmp_path: Path) -> PartialFile:
+    return PartialFile(tmp_path.joinpath("video.mp4"))
+
+
+def make_file(
+    size: int, checksum: str | None = None, expected_size: int | None = None
+) -> MediaFile:
+    url = URL("https://a.example/video")
+    return MediaFile(
+        "video",
+        parse_filename("video.mp4"),
+        url,
+        url,
+        size=size,
+        checksum=checksum,
+        expected_size=expected_size,
+    )
+
+
+def test_whole_content_is_written_from_start(partial: PartialFile) -> None:
+    partial.part_path.write_bytes(b"old")
+
+    offset = partial.get_resume_offset(200, {"etag": '"v1"', "accept-ranges": "bytes"})
+
+    assert offset == 0
+    assert json.loads(partial.sidecar_path.read_text())["etag"] == '"v1"'
+
+
+def test_partial_content_continues_from_offset(partial: PartialFile) -> None:
+    partial.part_path.write_bytes(b"x" * 100)
+
+    offset = partial.get_resume_offset(206, {"content-range": "bytes 100-199/200"})
+
+    assert offset == 100
+
+
+@pytest.mark.parametrize("content_range", ["bytes 0-199/200", "bytes 50-199/200", None])
+def test_unexpected_range_discards_partial_file(
+    partial: PartialFile, content_range: str | None
+) -> None:
+    partial.part_path.write_bytes(b"x" * 100)
+    headers = {} if content_range is None else {"content-range": content_range}
+
+    with pytest.raises(PartialContentError):
+        partial.get_resume_offset(206, headers)
+
+    assert not partial.part_path.exists()
+
+
+def test_range_is_not_requested_without_partial_file(partial: PartialFile) -> None:
+    assert partial.get_range_headers() == {}
+
+
+def test_range_is_requested_with_validator(partial: PartialFile) -> None:
+    partial.part_path.write_bytes(b"x" * 100)
+    partial.get_resume_offset(200, {"etag": '"v1"', "last-modified": "Mon, 01 Jan 2024"})
+
+    assert partial.get_range_headers() == {"range": "bytes=100-", "if-range": '"v1"'}
+
+
+def test_weak_etag_is_replaced_by_last_modified(partial: PartialFile) -> None:
+    partial.part_path.write_bytes(b"x" * 100)
+    partial.get_resume_offset(200, {"etag": 'W/"v1"', "last-modified": "Mon, 01 Jan 2024"})
+
+    assert partial.get_range_headers()["if-range"] == "Mon, 01 Jan 2024"
+
+
+def test_range_is_not_requested_if_server_refuses_it(partial: PartialFile) -> None:
+    partial.part_path.write_bytes(b"x" * 100)
+    partial.get_resume_offset(200, {"accept-ranges": "none"})
+
+    assert partial.get_range_headers() == {}
+
+
+def test_segmented_file_is_downloaded_again(partial: PartialFile) -> None:
+    partial.part_path.write_bytes(bytes(200))
+    partial.save_segments({}, [[0, 99, 50], [100, 199, 0]])
+
+    assert partial.get_range_headers() == {}
+    assert not partial.part_path.exists()
+    assert not partial.sidecar_path.exists()
+
+
+def test_writing_cuts_off_rest_that_was_not_received(partial: PartialFile) -> None:
+    partial.part_path.write_bytes(b"a" * 10)
+
+    with partial.writing(10, 90, "video") as bf_out:
+        bf_out.write(b"b" * 20)
+
+    assert partial.part_path.read_bytes() == b"a" * 10 + b"b" * 20
+    assert partial.offset == 30
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="the writer is killed in a child process")
+def test_killed_writer_is_resumed_from_received_bytes(partial: PartialFile) -> None:
+    partial.get_resume_offset(200, {"etag": '"v1"'})
+
+    pid = os.fork()
+    if not pid:  # the writer is killed without the cleanup, as by SIGKILL or a power loss
+        with partial.writing(0, 10_000_000, "video") as bf_out:
+            bf_out.write(b"x" * 1000)
+            bf_out.flush()
+            os._exit(0)
+
+    os.waitpid(pid, 0)
+
+    assert partial.offset == 1000
+    assert partial.get_range_headers() == {"range": "bytes=1000-", "if-range": '"v1"'}
+
+
+def test_hasher_includes_received_content(partial: PartialFile) -> None:
+    partial.part_path.write_bytes(b"abc")
+    hasher = partial.get_hasher(3, "sha256")
+    hasher.update(b"def")
+
+    expected = new_hasher("sha256")
+    expected.update(b"abcdef")
+    assert hasher.hexdigest() == expected.hexdigest()
+
+
+def test_complete_moves_file_with_checksum(partial: PartialFile) -> None:
+    partial.part_path.write_bytes(b"abc")
+    partial.get_resume_offset(200, {"etag": '"v1"'})
+    file = make_file(size=3, checksum=get_checksum("sha256", partial.get_hasher(3, "sha256")))
+
+    partial.complete(file)
+
+    assert partial.path.read_bytes() == b"abc"
+    assert not partial.part_path.exists()
+    assert not partial.sidecar_path.exists()
+    assert partial.path.with_name("video.mp4.sha256").read_text().endswith("  video.mp4\n")
+
+
+def test_complete_discards_broken_file(partial: PartialFile) -> None:
+    partial.part_path.write_bytes(b"abc")
+
+    with pytest.raises(IntegrityError):
+        partial.complete(make_file(size=3, expected_size=4))
+
+    assert not partial.part_path.exists()
+    assert not partial.path.exists()
@@ -0,0 +1,111 @@
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+import pytest
+from yarl import URL
+
+from simple_downloader.handlers.rate_limiter import RateLimiter, parse_retry_after
+
+from conftest import Clock
+
+
+URL_A = URL("https://a.example/file")
+URL_B = URL("https://b.example/file")
+
+
+def test_burst_is_not_delayed(clock: Clock) -> None:
+    limiter = RateLimiter(rate=2, burst=3)
+
+    assert [limiter.reserve(URL_A) for _ in range(3)] == [0, 0, 0]
+
+
+def test_requests_after_burst_are_queued_by_rate(clock: Clock) -> None:
+    limiter = RateLimiter(rate=2, burst=1)
+    limiter.reserve(URL_A)
+
+    assert limiter.reserve(URL_A) == pytest.approx(0.5)
+    assert limiter.reserve(URL_A) == pytest.approx(1)
+
+
+def test_tokens_are_refilled_by_time(clock: Clock) -> None:
+    limiter = RateLimiter(rate=2, burst=1)
+    limiter.reserve(URL_A)
+    clock.advance(0.5)
+
+    assert limiter.reserve(URL_A) == 0
+
+
+def test_hosts_are_limited_separately(clock: Clock) -> None:
+    limiter = RateLimiter(rate=1, burst=1)
+    limiter.reserve(URL_A)
+
+    assert limiter.reserve(URL_B) == 0
+    assert limiter.reserve(URL_A.with_path("/other")) == pytest.approx(1)
+
+
+def test_slow_down_halves_rate_down_to_minimum(clock: Clock) -> None:
+    limiter = RateLimiter(rate=1, burst=1, min_rate=0.4)
+    limiter.reserve(URL_A)
+
+    limiter.slow_down(URL_A)
+    assert limiter.reserve(URL_A) == pytest.approx(2)
+
+    limiter.slow_down(URL_A)  # 0.25 is below the minimum, the queued tokens are repaid by it
+    assert limiter.reserve(URL_A) == pytest.approx(2 / 0.4)
+
+
+def test_slow_down_blocks_host_for_retry_after(clock: Clock) -> None:
+    limiter = RateLimiter(rate=1, burst=5)
+
+    limiter.slow_down(URL_A, retry_after=30)
+
+    assert limiter.reserve(URL_A) == pytest.approx(30)
+    assert limiter.reserve(URL_B) == 0
+    clock.advance(30)
+    assert limiter.reserve(URL_A) == 0
+
+
+def test_speed_up_after_recovery_up_to_maximum(clock: Clock) -> None:
+    limiter = RateLimiter(rate=2, burst=1, max_rate=4, recovery=3)
+    limiter.reserve(URL_A)
+
+    for _ in range(2):
+        limiter.speed_up(URL_A)
+    assert limiter.reserve(URL_A) == pytest.approx(1 / 2)
+
+    limiter.speed_up(URL_A)  # 3 in a row, the queued tokens are repaid faster
+    assert limiter.reserve(URL_A) == pytest.approx(2 / 3)
+
+    for _ in range(3):
+        limiter.speed_up(URL_A)  # 4.5 is above the maximum
+    assert limiter.reserve(URL_A) == pytest.approx(3 / 4)
+
+
+def test_slow_down_resets_recovery(clock: Clock) -> None:
+    limiter = RateLimiter(rate=2, burst=1, recovery=2)
+    limiter.reserve(URL_A)
+
+    limiter.speed_up(URL_A)
+    limiter.slow_down(URL_A)
+    limiter.speed_up(URL_A)  # the first success after the slow down
+
+    assert limiter.reserve(URL_A) == pytest.approx(1)
+
+
+@pytest.mark.parametrize(
+    ("value", "expected"),
+    [(None, None), ("", None), ("120", 120), ("1.5", 1.5), ("-5", 0), ("soon", None)],
+)
+def test_parse_retry_after_seconds(value: str | None, expected: float | None) -> None:
+    headers = {} if value is None else {"retry-after": value}
+
+    assert parse_retry_after(headers) == expected
+
+
+def test_parse_retry_after_date() -> None:
+    retry_at = datetime.now(timezone.utc) + timedelta(seconds=60)
+
+    seconds = parse_retry_after({"retry-after": format_datetime(retry_at, usegmt=True)})
+
+    assert seconds == pytest.approx(60, abs=2)
+    assert parse_retry_after({"retry-after": "Wed, 21 Oct 2015 07:28:00 GMT"}) == 0
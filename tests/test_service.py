@@ -0,0 +1,138 @@
+from http.client import HTTPConnection
+import json
+from pathlib import Path
+from threading import Thread
+from typing import Any, Iterator
+
+import pytest
+from yarl import URL
+
+from simple_downloader.core.exceptions import CrawlerNotFound
+from simple_downloader.core.jobs import JobState, close_queues
+from simple_downloader.core.models import DownloadOptions
+from simple_downloader.handlers import user_agents
+from simple_downloader.handlers.cache import ResponseCache
+from simple_downloader.service import Service, ServiceServer
+
+
+ALBUM = URL("https://pixeldrain.com/l/album")
+
+
+class Recorder:
+    """The process of the service which only records the URLs and their save paths."""
+
+    def __init__(self) -> None:
+        self.calls: list[tuple[URL, Path]] = []
+
+    def __call__(self, url: URL, save_path: Path, *args: Any) -> None:
+        self.calls.append((url, save_path))
+
+
+@pytest.fixture
+def root(tmp_path: Path) -> Path:
+    root = tmp_path.joinpath("saves")
+    root.joinpath("album").mkdir(parents=True)
+    return root
+
+
+@pytest.fixture
+def process() -> Recorder:
+    return Recorder()
+
+
+@pytest.fixture
+def service(root: Path, process: Recorder, monkeypatch: pytest.MonkeyPatch) -> Iterator[Service]:
+    monkeypatch.setattr(user_agents, "_pool", ["test"])  # not sampled into the user cache
+    service = Service(process, root, DownloadOptions(), 1, ResponseCache())
+    yield service
+    service.close()
+    close_queues()
+
+
+def test_task_is_run_in_save_path(service: Service, process: Recorder, root: Path) -> None:
+    task = service.submit([ALBUM], Path("album"))
+    service.close()  # waits for the running task
+
+    assert task.save_path == root.joinpath("album").resolve()
+    assert task.state == JobState.DONE
+    assert process.calls == [(ALBUM, task.save_path)]
+
+
+def test_task_is_run_in_root_by_default(service: Service, root: Path) -> None:
+    assert service.submit([ALBUM]).save_path == root.resolve()
+
+
+@pytest.mark.parametrize("urls", [[], [URL("/l/album")]])
+def test_urls_are_required(service: Service, urls: list[URL]) -> None:
+    with pytest.raises(ValueError):
+        service.submit(urls)
+
+
+def test_unknown_hosting_is_refused(service: Service) -> None:
+    with pytest.raises(CrawlerNotFound):
+        service.submit([URL("https://unknown.example/a/album")])
+
+
+@pytest.mark.parametrize("save_path", ["..", "album/../..", "../saves-other"])
+def test_save_path_cannot_leave_root(service: Service, save_path: str) -> None:
+    with pytest.raises(ValueError, match="is outside of"):
+        service.submit([ALBUM], Path(save_path))
+
+
+def test_absolute_save_path_cannot_leave_root(service: Service, tmp_path: Path) -> None:
+    with pytest.raises(ValueError, match="is outside of"):
+        service.submit([ALBUM], tmp_path)
+
+
+def test_absolute_save_path_inside_root_is_allowed(service: Service, root: Path) -> None:
+    task = service.submit([ALBUM], root.joinpath("album"))
+
+    assert task.save_path == root.joinpath("album").resolve()
+
+
+def test_symlink_cannot_leave_root(service: Service, root: Path, tmp_path: Path) -> None:
+    tmp_path.joinpath("other").mkdir()
+    root.joinpath("link").symlink_to(tmp_path.joinpath("other"))
+
+    with pytest.raises(ValueError, match="is outside of"):
+        service.submit([ALBUM], Path("link"))
+
+
+def test_save_path_must_exist(service: Service) -> None:
+    with pytest.raises(ValueError, match="does not exist"):
+        service.submit([ALBUM], Path("missing"))
+
+
+def test_refused_task_is_not_queued(service: Service, process: Recorder) -> None:
+    with pytest.raises(ValueError):
+        service.submit([ALBUM], Path(".."))
+    service.close()
+
+    assert service.get_tasks() == []
+    assert process.calls == []
+
+
+@pytest.mark.parametrize(
+    ("body", "status"),
+    [
+        ({"url": str(ALBUM), "save_path": "album"}, 202),
+        ({"url": str(ALBUM), "save_path": "../.."}, 400),
+        ({"url": str(ALBUM), "save_path": "/"}, 400),
+        ({"urls": []}, 400),
+        ({"url": "https://unknown.example/a/album"}, 400),
+    ],
+)
+def test_api_validates_task(service: Service, body: dict[str, Any], status: int) -> None:
+    server = ServiceServer(("127.0.0.1", 0), service)
+    Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+    try:
+        connection = HTTPConnection("127.0.0.1", server.server_address[1])
+        connection.request("POST", "/tasks", json.dumps(body))
+        response = connection.getresponse()
+        response.read()
+        connection.close()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert response.status == status